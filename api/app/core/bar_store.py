@@ -0,0 +1,308 @@
+import asyncio
+import fcntl
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Tuple
+import numpy as np
+import yfinance as yf
+from app.utils.logger import logger
+
+DEFAULT_BAR_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "bars")
+COLUMNS = ("ts", "open", "high", "low", "close", "volume")
+# Bar length in seconds, how far back yfinance serves the interval, and how often a stored series is refreshed
+INTERVALS = {
+    "1m": {"seconds": 60, "max_history": timedelta(days=7), "refresh": 60.0},
+    "1h": {"seconds": 3600, "max_history": timedelta(days=729), "refresh": 600.0},
+    "1d": {"seconds": 86400, "max_history": None, "refresh": 3600.0},
+}
+DEFAULT_HISTORY = timedelta(days=365)
+# Symbols become directory names, so only plain tickers (BRK-B, ^GSPC, EURUSD=X) are accepted
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9^][A-Z0-9.\-^=]{0,14}$")
+
+BarFetcher = Callable[[str, str, datetime, datetime | None], Dict[str, np.ndarray]]
+
+
+def utc(value: datetime | None) -> datetime | None:
+    """Treats naive datetimes as UTC"""
+    return value.replace(tzinfo=timezone.utc) if value is not None and value.tzinfo is None else value
+
+
+def empty_bars() -> Dict[str, np.ndarray]:
+    return {column: np.empty(0, dtype=np.int64 if column == "ts" else np.float64) for column in COLUMNS}
+
+
+def download_bars(symbol: str, interval: str, start: datetime, end: datetime | None = None) -> Dict[str, np.ndarray]:
+    """
+    Downloads OHLCV bars for one symbol from yfinance
+
+    :param symbol: Stock ticker symbol
+    :param interval: One of INTERVALS
+    :param start: First bar to fetch
+    :param end: Fetch bars before this time, None for up to now
+    :return: Column arrays keyed by COLUMNS, ts in epoch seconds
+    """
+    data = yf.download(symbol, start=start, end=end, interval=interval, progress=False,
+                       auto_adjust=False, multi_level_index=False)
+    if data.empty:
+        return empty_bars()
+    data = data.dropna(subset=["Close"])
+    index = data.index.tz_localize("UTC") if data.index.tz is None else data.index.tz_convert("UTC")
+    return {
+        "ts": (index.asi8 // 10**9).astype(np.int64),
+        "open": data["Open"].to_numpy(dtype=np.float64),
+        "high": data["High"].to_numpy(dtype=np.float64),
+        "low": data["Low"].to_numpy(dtype=np.float64),
+        "close": data["Close"].to_numpy(dtype=np.float64),
+        "volume": data["Volume"].to_numpy(dtype=np.float64),
+    }
+
+
+class BarStore:
+    def __init__(self, path: str = DEFAULT_BAR_STORE_PATH, fetch: BarFetcher = download_bars, max_series: int = 256,
+                 miss_ttl: float = 3600.0):
+        """
+        On-disk columnar store of OHLCV bars, one directory per interval and symbol with one
+        flat little-endian file per column. Reads memory-map the columns and binary search the
+        timestamps, so a range is a view over the mapped files rather than a copy. Refreshes
+        only download the bars after the last stored one (re-fetching that one, since it may
+        still have been forming) and append them in place; an flock keeps worker processes
+        sharing the directory from writing the same series at once. Mappings and refresh
+        state are kept for the max_series most recently requested series only. Nothing is
+        written for a symbol until the source returns bars for it, and symbols it has none for
+        are answered empty for miss_ttl seconds without asking again.
+
+        :param path: Root directory of the store
+        :param fetch: Blocking bar download, yfinance unless given
+        :param max_series: Maximum series kept mapped in memory, and unknown series remembered
+        :param miss_ttl: Seconds a series the source had no bars for is served empty
+        """
+        self.path = path
+        self.fetch = fetch
+        self.max_series = max_series
+        self.miss_ttl = miss_ttl
+        self._maps: Dict[Tuple[str, str], Tuple[int, Dict[str, np.ndarray]]] = {}
+        self._refreshed: Dict[Tuple[str, str], float] = {}
+        self._covered_from: Dict[Tuple[str, str], datetime] = {}
+        # Per-series refresh locks, in least recently requested order
+        self._series: OrderedDict[Tuple[str, str], asyncio.Lock] = OrderedDict()
+        # Series the source had no bars for, with when that was found, oldest first
+        self._misses: OrderedDict[Tuple[str, str], float] = OrderedDict()
+        self.evicted = 0
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "fetched_bars": 0, "fetch_errors": 0}
+
+    def _dir(self, symbol: str, interval: str) -> str:
+        if not SYMBOL_PATTERN.match(symbol):
+            raise ValueError(f"Invalid symbol {symbol!r}")
+        return os.path.join(self.path, interval, symbol)
+
+    def _column_path(self, symbol: str, interval: str, column: str) -> str:
+        return os.path.join(self._dir(symbol, interval), f"{column}.bin")
+
+    def columns(self, symbol: str, interval: str) -> Dict[str, np.ndarray]:
+        """
+        Memory-maps a stored series, reusing the mapping until the series grows
+
+        :param symbol: Stock ticker symbol
+        :param interval: One of INTERVALS
+        :return: Column arrays keyed by COLUMNS, empty if nothing is stored
+        """
+        key = (symbol, interval)
+        try:
+            size = os.path.getsize(self._column_path(symbol, interval, "ts"))
+        except FileNotFoundError:
+            return empty_bars()
+        cached = self._maps.get(key)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        # ts is written last, so its length bounds what the other columns are guaranteed to hold
+        count = size // 8
+        if count == 0:
+            return empty_bars()
+        columns = {
+            column: np.memmap(self._column_path(symbol, interval, column), mode="r",
+                              dtype="<i8" if column == "ts" else "<f8", shape=(count,))
+            for column in COLUMNS
+        }
+        if key in self._series:
+            self._maps[key] = (size, columns)
+        return columns
+
+    def read(self, symbol: str, interval: str, start: datetime | None = None, end: datetime | None = None) -> Dict[str, np.ndarray]:
+        """
+        Returns the stored bars in [start, end) as views over the mapped columns
+
+        :param symbol: Stock ticker symbol
+        :param interval: One of INTERVALS
+        :param start: First bar time, None for the beginning of the series
+        :param end: Exclusive end time, None for the end of the series
+        :return: Column arrays keyed by COLUMNS
+        """
+        columns = self.columns(symbol, interval)
+        ts = columns["ts"]
+        lo = int(np.searchsorted(ts, int(start.timestamp()), side="left")) if start else 0
+        hi = int(np.searchsorted(ts, int(end.timestamp()), side="left")) if end else len(ts)
+        return {column: np.asarray(values[lo:hi]) for column, values in columns.items()}
+
+    def _write(self, symbol: str, interval: str, bars: Dict[str, np.ndarray]):
+        """Appends bars newer than the stored ones, overwriting a re-fetched last bar in place"""
+        os.makedirs(self._dir(symbol, interval), exist_ok=True)
+        stored = self.columns(symbol, interval)
+        count = len(stored["ts"])
+        offset = count
+        if count and len(bars["ts"]):
+            last = int(stored["ts"][-1])
+            keep = bars["ts"] >= last
+            bars = {column: values[keep] for column, values in bars.items()}
+            if len(bars["ts"]) and int(bars["ts"][0]) == last:
+                offset = count - 1
+        if not len(bars["ts"]):
+            return 0
+        for column in COLUMNS[1:] + COLUMNS[:1]:
+            with open(self._column_path(symbol, interval, column), "r+b" if offset else "wb") as f:
+                f.seek(offset * 8)
+                f.write(np.ascontiguousarray(bars[column], dtype="<i8" if column == "ts" else "<f8").tobytes())
+        return offset + len(bars["ts"]) - count
+
+    @staticmethod
+    def _wanted(interval: str, start: datetime | None) -> datetime:
+        """Earliest bar a request needs, clamped to what the source can serve"""
+        wanted = start or datetime.now(timezone.utc) - DEFAULT_HISTORY
+        max_history = INTERVALS[interval]["max_history"]
+        if max_history is not None:
+            wanted = max(wanted, datetime.now(timezone.utc) - max_history)
+        return wanted
+
+    def _covers(self, symbol: str, interval: str, wanted: datetime) -> bool:
+        ts = self.columns(symbol, interval)["ts"]
+        if len(ts) and wanted.timestamp() >= ts[0] - INTERVALS[interval]["seconds"]:
+            return True
+        # The source may simply have nothing older than what's stored (e.g. before a listing)
+        covered = self._covered_from.get((symbol, interval))
+        return covered is not None and wanted >= covered
+
+    def refresh(self, symbol: str, interval: str, start: datetime | None = None) -> int | None:
+        """
+        Downloads and stores the bars missing from a series. Blocking.
+
+        :param symbol: Stock ticker symbol
+        :param interval: One of INTERVALS
+        :param start: Earliest bar wanted; history older than what's stored triggers a full reload
+        :return: Number of bars added, None if nothing is stored and the source has no bars either
+        """
+        key = (symbol, interval)
+        wanted = self._wanted(interval, start)
+        prefetched = None
+        if not os.path.isdir(self._dir(symbol, interval)):
+            # Any symbol can be asked for, so it only gets a directory once the source knows it
+            prefetched = self.fetch(symbol, interval, wanted, None)
+            self.stats["refreshes"] += 1
+            if not len(prefetched["ts"]):
+                return None
+        os.makedirs(self._dir(symbol, interval), exist_ok=True)
+        with open(os.path.join(self._dir(symbol, interval), ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                ts = self.columns(symbol, interval)["ts"]
+                if self._covers(symbol, interval, wanted):
+                    fetch_from = datetime.fromtimestamp(int(ts[-1]), timezone.utc) if len(ts) else wanted
+                else:
+                    fetch_from = wanted
+                    for column in COLUMNS:
+                        path = self._column_path(symbol, interval, column)
+                        if os.path.exists(path):
+                            os.remove(path)
+                    self._maps.pop(key, None)
+                    self._covered_from[key] = wanted
+                if prefetched is not None:
+                    bars = prefetched
+                else:
+                    bars = self.fetch(symbol, interval, fetch_from, None)
+                    self.stats["refreshes"] += 1
+                added = self._write(symbol, interval, bars)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self.stats["fetched_bars"] += len(bars["ts"])
+        logger.info(f"Refreshed {interval} bars for {symbol}: {added} added")
+        return added
+
+    def _lock(self, key: Tuple[str, str]) -> asyncio.Lock:
+        """Marks a series as most recently requested, dropping state of the least recent ones beyond max_series"""
+        lock = self._series.pop(key, None) or asyncio.Lock()
+        self._series[key] = lock
+        while len(self._series) > self.max_series:
+            evicted, _ = self._series.popitem(last=False)
+            # Releases the mapped files; the series is refreshed again when next requested
+            self._maps.pop(evicted, None)
+            self._refreshed.pop(evicted, None)
+            self._covered_from.pop(evicted, None)
+            self.evicted += 1
+        return lock
+
+    def _missed(self, key: Tuple[str, str]) -> bool:
+        missed = self._misses.get(key)
+        if missed is None:
+            return False
+        if time.monotonic() - missed > self.miss_ttl:
+            del self._misses[key]
+            return False
+        return True
+
+    def _record_miss(self, key: Tuple[str, str]):
+        self._misses.pop(key, None)
+        self._misses[key] = time.monotonic()
+        while len(self._misses) > self.max_series:
+            self._misses.popitem(last=False)
+
+    def _is_fresh(self, symbol: str, interval: str, wanted: datetime) -> bool:
+        refreshed = self._refreshed.get((symbol, interval))
+        if refreshed is None or time.monotonic() - refreshed > INTERVALS[interval]["refresh"]:
+            return False
+        return self._covers(symbol, interval, wanted)
+
+    async def get_bars(self, symbol: str, interval: str = "1d", start: datetime | None = None,
+                       end: datetime | None = None) -> Dict[str, np.ndarray]:
+        """
+        Returns bars for a range, refreshing the stored series first when it is stale
+
+        :param symbol: Stock ticker symbol
+        :param interval: One of INTERVALS
+        :param start: First bar time, None for the default history window
+        :param end: Exclusive end time, None for up to the latest bar
+        :return: Column arrays keyed by COLUMNS
+        """
+        if interval not in INTERVALS:
+            raise ValueError(f"Unsupported interval {interval}, expected one of {', '.join(INTERVALS)}")
+        symbol = symbol.upper()
+        if not SYMBOL_PATTERN.match(symbol):
+            raise ValueError(f"Invalid symbol {symbol!r}")
+        key = (symbol, interval)
+        if self._missed(key):
+            self.stats["misses"] += 1
+            return empty_bars()
+        lock = self._lock(key)
+        start, end = (utc(value) for value in (start, end))
+        wanted = self._wanted(interval, start)
+        if self._is_fresh(symbol, interval, wanted):
+            self.stats["hits"] += 1
+        else:
+            async with lock:
+                if not self._is_fresh(symbol, interval, wanted):
+                    try:
+                        if await asyncio.to_thread(self.refresh, symbol, interval, start) is None:
+                            self._record_miss(key)
+                            return empty_bars()
+                        self._refreshed[key] = time.monotonic()
+                    except Exception as e:
+                        # Serve whatever is stored rather than failing the request
+                        self.stats["fetch_errors"] += 1
+                        logger.error(f"Error refreshing {interval} bars for {symbol}: {str(e)}")
+        return self.read(symbol, interval, wanted, end)
+
+    def get_stats(self) -> dict:
+        return {"series": len(self._maps), "evicted": self.evicted, **self.stats}
+
+
+bar_store = BarStore(path=os.getenv("BAR_STORE_PATH", DEFAULT_BAR_STORE_PATH))
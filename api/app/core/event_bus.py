@@ -0,0 +1,238 @@
+"""
+Pub/sub backbone shared by the API worker processes.
+
+The local bus keeps everything in one process. With several uvicorn workers, run the broker
+once per host and point every worker at it with EVENT_BUS=unix:
+
+    python -m app.core.event_bus --path /tmp/trade-processing-events.sock
+"""
+import argparse
+import asyncio
+import itertools
+import os
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List
+from app.utils.json_utils import dumps_bytes, loads
+from app.utils.logger import logger
+
+DEFAULT_EVENT_BUS_PATH = "/tmp/trade-processing-events.sock"
+PEER_LEFT = "bus.peer_left"
+MAX_LINE = 16 * 1024 * 1024
+
+Handler = Callable[[object, int | None], Awaitable[None]]
+
+
+class EventBus:
+    """Channel registry shared by the bus backends. Handlers receive (message, origin peer)."""
+
+    name = "base"
+    distributed = False
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self.connect_listeners: List[Callable[[], Awaitable[None]]] = []
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, channel: str, handler: Handler):
+        self.handlers[channel].append(handler)
+
+    def on_connect(self, listener: Callable[[], Awaitable[None]]):
+        """Registers a callback run every time the bus (re)connects"""
+        self.connect_listeners.append(listener)
+
+    async def publish(self, channel: str, message):
+        raise NotImplementedError
+
+    async def dispatch(self, channel: str, message, origin: int | None):
+        for handler in self.handlers.get(channel, ()):
+            try:
+                await handler(message, origin)
+                self.delivered += 1
+            except Exception as e:
+                logger.error(f"Error handling event on channel {channel}: {str(e)}")
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def get_stats(self) -> dict:
+        return {"backend": self.name, "published": self.published, "delivered": self.delivered}
+
+
+class LocalEventBus(EventBus):
+    """Single-process bus: publish runs the channel's handlers directly."""
+
+    name = "local"
+
+    async def publish(self, channel: str, message):
+        self.published += 1
+        await self.dispatch(channel, message, None)
+
+
+class SocketEventBus(EventBus):
+    name = "unix"
+    distributed = True
+
+    def __init__(self, path: str = DEFAULT_EVENT_BUS_PATH, reconnect_delay: float = 1.0, connect_timeout: float = 5.0):
+        """
+        Client of an EventBroker over a Unix domain socket. Events are newline-delimited JSON;
+        a published event reaches the handlers in every other connected process, the
+        publisher handles its own copy locally.
+
+        :param path: Broker socket path
+        :param reconnect_delay: Seconds between reconnection attempts
+        :param connect_timeout: Seconds start() waits for the first connection
+        """
+        super().__init__()
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.connect_timeout = connect_timeout
+        self.dropped = 0
+        self.reconnects = 0
+        self._writer: asyncio.StreamWriter | None = None
+        self._connected = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def publish(self, channel: str, message):
+        writer = self._writer
+        if writer is None:
+            self.dropped += 1
+            return
+        writer.write(dumps_bytes({"channel": channel, "message": message}) + b"\n")
+        self.published += 1
+        await writer.drain()
+
+    async def run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_LINE)
+            except OSError as e:
+                logger.warning(f"Event broker at {self.path} unavailable: {str(e)}")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            self._writer = writer
+            self._connected.set()
+            logger.info(f"Connected to event broker at {self.path}")
+            try:
+                for listener in self.connect_listeners:
+                    await listener()
+                while line := await reader.readline():
+                    envelope = loads(line)
+                    event = envelope["event"]
+                    await self.dispatch(event["channel"], event["message"], envelope["origin"])
+            except (ConnectionError, ValueError) as e:
+                logger.warning(f"Lost connection to event broker: {str(e)}")
+            finally:
+                self._writer = None
+                self._connected.clear()
+                writer.close()
+            self.reconnects += 1
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=self.connect_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Event broker not reachable after {self.connect_timeout}s, will keep retrying")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def get_stats(self) -> dict:
+        return {
+            **super().get_stats(),
+            "connected": self._writer is not None,
+            "dropped": self.dropped,
+            "reconnects": self.reconnects,
+        }
+
+
+class EventBroker:
+    def __init__(self, path: str = DEFAULT_EVENT_BUS_PATH):
+        """
+        Fans out every event it receives to all other connected processes, stamped with the
+        sender's peer id. When a peer goes away the others get a bus.peer_left event.
+
+        :param path: Unix socket path to listen on
+        """
+        self.path = path
+        self.peers: Dict[int, asyncio.StreamWriter] = {}
+        self.forwarded = 0
+        self._ids = itertools.count(1)
+        self._server: asyncio.AbstractServer | None = None
+
+    async def _forward(self, sender: int, data: bytes):
+        recipients = [writer for peer, writer in list(self.peers.items()) if peer != sender]
+        for writer in recipients:
+            writer.write(data)
+        self.forwarded += 1
+        await asyncio.gather(*(writer.drain() for writer in recipients), return_exceptions=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = next(self._ids)
+        self.peers[peer] = writer
+        prefix = b'{"origin":%d,"event":' % peer
+        try:
+            while line := await reader.readline():
+                # Wrap the raw line rather than decoding and re-encoding it
+                await self._forward(peer, prefix + line.rstrip(b"\n") + b"}\n")
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"Event bus peer {peer} dropped: {str(e)}")
+        finally:
+            del self.peers[peer]
+            writer.close()
+            await self._forward(peer, prefix + dumps_bytes({"channel": PEER_LEFT, "message": {"peer": peer}}) + b"}\n")
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path, limit=MAX_LINE)
+        logger.info(f"Event broker listening on {self.path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self.peers.values()):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def create_event_bus(name: str, path: str = DEFAULT_EVENT_BUS_PATH) -> EventBus:
+    """
+    Builds the configured event bus
+
+    :param name: 'local' for a single process or 'unix' to join a broker
+    :param path: Broker socket path for the unix bus
+    :return: Event bus instance
+    """
+    if name == LocalEventBus.name:
+        return LocalEventBus()
+    if name == SocketEventBus.name:
+        return SocketEventBus(path)
+    raise ValueError(f"Unknown event bus: {name}")
+
+
+async def serve(path: str):
+    broker = EventBroker(path)
+    await broker.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await broker.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the event broker shared by API workers")
+    parser.add_argument("--path", default=os.getenv("EVENT_BUS_PATH", DEFAULT_EVENT_BUS_PATH))
+    asyncio.run(serve(parser.parse_args().path))
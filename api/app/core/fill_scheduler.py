@@ -0,0 +1,104 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+from app.utils.logger import logger
+
+
+class FillScheduler:
+    def __init__(
+        self,
+        on_progress: Callable[[List], Awaitable[None]],
+        on_fill: Callable[[object], Awaitable[None]],
+        tick_interval: float = 0.5,
+    ):
+        """
+        Tracks every in-flight trade on a single clock instead of one sleeping coroutine per trade.
+        Trades sit in a heap keyed by fill deadline; each tick reports progress for all of them
+        and trades whose deadline has passed are completed and handed to settlement.
+            :param on_progress: Coroutine called once per tick with the list of in-flight trades
+            :param on_fill: Coroutine called with each trade once its simulated latency has elapsed
+            :param tick_interval: Seconds between progress ticks
+        """
+        self.on_progress = on_progress
+        self.on_fill = on_fill
+        self.tick_interval = tick_interval
+        self._heap: List[Tuple[float, int, object]] = []
+        self._seq = itertools.count()
+        self.in_flight: Dict[str, object] = {}
+        self._last_deadline: Dict[str, float] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self):
+        return len(self.in_flight)
+
+    def schedule(self, trade):
+        """
+        Starts a trade and registers its fill deadline.
+        A trader's fills never overtake each other: a trade that would finish before the
+        trader's previous order is held back until that order's deadline.
+            :param trade: StockTrade to start
+        """
+        trade.start()
+        deadline = trade.timestamp + trade.latency
+        previous_deadline = self._last_deadline.get(trade.trader_id)
+        if previous_deadline is not None and deadline < previous_deadline:
+            deadline = previous_deadline
+            trade.latency = deadline - trade.timestamp
+        self._last_deadline[trade.trader_id] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), trade))
+        self.in_flight[trade.id] = trade
+        self._wakeup.set()
+
+    def next_deadline(self) -> float | None:
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, trade = heapq.heappop(self._heap)
+            self.in_flight.pop(trade.id, None)
+            if self._last_deadline.get(trade.trader_id) == deadline:
+                del self._last_deadline[trade.trader_id]
+            due.append(trade)
+        return due
+
+    async def run(self):
+        next_tick = time.time() + self.tick_interval
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                next_tick = time.time() + self.tick_interval
+            now = time.time()
+            if now >= next_tick:
+                next_tick = now + self.tick_interval
+                if self.in_flight:
+                    try:
+                        await self.on_progress(list(self.in_flight.values()))
+                    except Exception as e:
+                        logger.error(f"Error emitting trade progress: {str(e)}", exc_info=True)
+            for trade in self.pop_due(time.time()):
+                trade.complete()
+                await self.on_fill(trade)
+            wake_at = next_tick
+            deadline = self.next_deadline()
+            if deadline is not None:
+                wake_at = min(wake_at, deadline)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(wake_at - time.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
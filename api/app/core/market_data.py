@@ -2,59 +2,134 @@
 from app.core.websocket_manager import WebsocketManager
 from app.utils.logger import logger
 import asyncio
-from typing import Set, Tuple
-from app.core.stock_search import get_multiple_price_data
+from collections import Counter
+from typing import Dict, List
+from app.core.price_provider import PriceProvider, price_provider as default_price_provider
+from app.utils.json_utils import dumps
+from app.core.portfolio_valuation import PortfolioValuator
+from app.core.tick_buffer import TickStore
 class MarketDataStreamer:
-    def __init__(self):
-        self.active_streams: Set[Tuple[str, Tuple[str, ...]]] = set()
+    def __init__(self, poll_interval: float = 10.0, price_provider: PriceProvider | None = None,
+                 valuator: PortfolioValuator | None = None, tick_store: TickStore | None = None):
+        """
+        Process-wide market data hub. Keeps a ref-counted registry of the tickers
+        each trader watches, polls the union of them in one batched download per
+        interval and fans every quote out to the traders subscribed to it.
+        Symbols held in live-valued portfolios are polled too and every batch of
+        quotes is handed to the valuator and recorded in the intraday tick store.
 
+        :param poll_interval: Seconds between price polls
+        :param price_provider: Async price provider, defaults to the shared one
+        :param valuator: Optional live portfolio valuator fed with every poll
+        :param tick_store: Optional tick store every polled price is recorded in
+        """
+        self.poll_interval = poll_interval
+        self.price_provider = price_provider or default_price_provider
+        self.valuator = valuator
+        self.tick_store = tick_store
+        self.subscriptions: Dict[str, List[str]] = {}
+        self.ticker_refs: Counter = Counter()
+        self.polls = 0
+        self.ws_manager: WebsocketManager | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
 
-    async def stream_price_data(self, tickers: list, trader_id:str, ws_manager:WebsocketManager):
+    def subscribe(self, trader_id: str, tickers: List[str]):
         """
-        Asynchronously fetches the latest price data for a given stock ticker.
-        
-        :param ticker: Stock ticker symbol (e.g., 'AAPL', 'GOOGL')
+        Replaces the trader's watch list and triggers an immediate poll
+
         :param trader_id: Unique identifier for the trader
-        :param ws_manager: Websocket manager instance to send data
-        :return: Dictionary with latest price data
+        :param tickers: Stock ticker symbols (e.g., ['AAPL', 'GOOGL'])
         """
-        key=(trader_id, tuple(sorted(tickers)))
-        if key in self.active_streams:
-            logger.info(f"Stream for {key} is already active, skipping new stream.")
+        self.unsubscribe(trader_id)
+        tickers = list(dict.fromkeys(tickers))
+        self.subscriptions[trader_id] = tickers
+        self.ticker_refs.update(tickers)
+        logger.info(f"Trader {trader_id} subscribed to {tickers}")
+        self._wakeup.set()
+
+    def unsubscribe(self, trader_id: str):
+        tickers = self.subscriptions.pop(trader_id, None)
+        if not tickers:
+            return
+        self.ticker_refs.subtract(tickers)
+        for ticker in tickers:
+            if self.ticker_refs[ticker] <= 0:
+                del self.ticker_refs[ticker]
+        logger.info(f"Trader {trader_id} unsubscribed from market data")
+
+    async def track_portfolio(self, trader_id: str):
+        """Starts live valuation of the trader's portfolio and triggers an immediate poll"""
+        await self.valuator.track(trader_id)
+        self._wakeup.set()
+
+    def untrack_portfolio(self, trader_id: str):
+        if self.valuator is not None:
+            self.valuator.untrack(trader_id)
+
+    def _idle(self) -> bool:
+        return not self.subscriptions and not (self.valuator and self.valuator.holders)
+
+    async def poll_once(self):
+        tickers = sorted(set(self.ticker_refs).union(self.valuator.symbols() if self.valuator else ()))
+        if not tickers:
             return
-        self.active_streams.add(key)
-        logger.info(f"Starting stream for {trader_id} with tickers {tickers}")
-        try:
-            while True:
-                if not ws_manager.has_active_connection(trader_id):
-                    logger.info(f"No active websocket connection for trader {trader_id}, stopping stream.")
-                    break
-                try:
-                        data = get_multiple_price_data(tickers)
-                        success=await ws_manager.notify(trader_id, data)
-                        if not success:
-                            break
-                except asyncio.CancelledError:
-                        logger.info(f"Market data stream for trader {trader_id} cancelled")
-                        raise  # Re-raise to trigger cleanup
-                except Exception as e:
-                        logger.error(f"Error while sending price data: {str(e)}")
-                        # If error occurs, check connection before continuing
-                        if not ws_manager.has_active_connection(trader_id):
-                            break
-                            
-                await asyncio.sleep(10)
-        except asyncio.CancelledError:
-            logger.info(f"Market data stream for trader {trader_id} cancelled")
-            # Let the cancellation propagate after cleanup
-            raise
-        except Exception as e:
-            logger.error(f"Error in market data stream for trader {trader_id}: {str(e)}")
-        finally:
-            # Always clean up, even if there's an error
-            if key in self.active_streams:
-                self.active_streams.remove(key)
-            logger.info(f"Stopped market data stream for trader {trader_id}")
+        quotes = await self.price_provider.get_quotes(tickers)
+        self.polls += 1
+        if self.tick_store is not None:
+            self.tick_store.record(quotes)
+        # Encode every quote once and reuse the frame for traders watching the same list
+        encoded = {ticker: dumps(quote) for ticker, quote in quotes.items()}
+        payloads: Dict[tuple, str] = {}
+        for trader_id, trader_tickers in list(self.subscriptions.items()):
+            data = [quotes[ticker] for ticker in trader_tickers if ticker in quotes]
+            key = tuple(trader_tickers)
+            payload = payloads.get(key)
+            if payload is None:
+                payload = payloads[key] = "[" + ",".join(encoded[ticker] for ticker in trader_tickers if ticker in encoded) + "]"
+            success = await self.ws_manager.notify(trader_id, data, payload=payload)
+            # notify also returns False for a frame dropped from a full queue; that client is still there
+            if not success and not self.ws_manager.has_active_connection(trader_id):
+                logger.info(f"No active websocket connection for trader {trader_id}, dropping subscription.")
+                self.unsubscribe(trader_id)
+        if self.valuator is not None:
+            await self.valuator.push_quotes(quotes)
+
+    async def run(self):
+        while True:
+            if self._idle():
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error while sending price data: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
 
+    def get_stats(self) -> dict:
+        stats = {
+            "subscribers": len(self.subscriptions),
+            "tickers": len(self.ticker_refs),
+            "polls": self.polls,
+        }
+        if self.valuator is not None:
+            stats["portfolios"] = self.valuator.get_stats()
+        return stats
 
+    def start(self, ws_manager: WebsocketManager):
+        self.ws_manager = ws_manager
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
 
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        logger.info("Stopped market data hub")
@@ -1,37 +1,189 @@
-
+import asyncio
+from collections import defaultdict, deque
 from datetime import datetime, timezone
+from typing import Dict, List
+from sqlalchemy import insert
 from app.models.tables import Notification
+from app.core.push_sinks import PushSink, StubPushSink, MAX_MULTICAST_TOKENS
+from app.utils.logger import logger
+
+
 class NotificationService:
-    def __init__(self):
-        pass
-    
-    async def send_notification(self, trader, trade, ws_manager, session):
-        trader_id=trader.id if trader else None
-        notification=Notification(trader_id=trader_id, message="Trade completed!", read=False,created_at=datetime.now(timezone.utc),
-                updated_at=datetime.now(timezone.utc))
-        session.add(notification)
-        await session.commit()
-        message={
-"trader_id": trader_id,
-"trade_id": trade.id,
-"ticker": trade.stock.ticker,
-"quantity": trade.quantity,
-"message": notification.message,
-"event": "trade_completed",
-"progress": 100,
-"status":"success"
-    }
+    def __init__(
+        self,
+        sessionmaker=None,
+        push_sink: PushSink | None = None,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        max_retries: int = 5,
+        retry_backoff: float = 0.5,
+        max_pending: int = 100000,
+    ):
+        """
+        Trade completion notifications. Settlement only queues them on an in-memory outbox;
+        a background worker bulk-inserts the Notification rows and sends pushes for offline
+        traders, grouped per device token into multicasts. Failed inserts and pushes are
+        retried with exponential backoff.
+
+        :param sessionmaker: Async session factory used by the worker
+        :param push_sink: Where pushes go, a recording stub unless configured otherwise
+        :param batch_size: Maximum rows or pushes handled per flush
+        :param flush_interval: Seconds the worker waits for a batch to accumulate
+        :param max_retries: Attempts before a row or push is given up on
+        :param retry_backoff: Delay before the first retry, doubled on every further attempt
+        :param max_pending: Outbox size beyond which new entries are dropped
+        """
+        self.sessionmaker = sessionmaker
+        self.push_sink = push_sink or StubPushSink()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_pending = max_pending
+        self.rows: deque = deque()
+        self.pushes: deque = deque()
+        self.stats = {"inserted": 0, "pushed": 0, "push_calls": 0, "retried": 0, "failed": 0, "dropped": 0}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def _enqueue(self, outbox: deque, entry: tuple):
+        if len(self.rows) + len(self.pushes) >= self.max_pending:
+            self.stats["dropped"] += 1
+            logger.warning("Notification outbox full, dropping entry")
+            return
+        outbox.append(entry)
+        self._wakeup.set()
+
+    async def send_notification(self, trader, trade, ws_manager) -> dict:
+        """
+        Notifies the trader of a completed trade without touching the database or the network
+
+        :param trader: Trader the trade was settled for
+        :param trade: Completed StockTrade
+        :param ws_manager: Manager used to reach traders that are online
+        :return: The trade_completed message
+        """
+        trader_id = trader.id if trader else None
+        now = datetime.now(timezone.utc)
+        message = {
+            "trader_id": trader_id,
+            "trade_id": trade.id,
+            "ticker": trade.stock.ticker,
+            "quantity": trade.quantity,
+            "message": "Trade completed!",
+            "event": "trade_completed",
+            "progress": 100,
+            "status": "success",
+        }
+        # Entries carry their attempt count last
+        self._enqueue(self.rows, ({"trader_id": trader_id, "message": message["message"], "read": False,
+                                   "created_at": now, "updated_at": now}, 0))
         if trader:
-            if trader.status=="online":
-                await ws_manager.notify(trader_id, message)
+            if trader.status == "online":
+                await ws_manager.notify(trader_id, message, guaranteed=True)
             else:
-                for token in trader.notification_tokens:
-                    self.send_push_notification(token, message, trader_id)
+                for token in trader.notification_tokens or []:
+                    self._enqueue(self.pushes, (token, message, 0))
         return message
-    
-    def send_push_notification(self,token, message, trader_id):
-        print(f"Notification sent to {token}: {message['message']}")
 
+    @staticmethod
+    def build_push(messages: List[dict]) -> dict:
+        """Collapses everything pending for one device into a single push"""
+        if len(messages) == 1:
+            message = messages[0]
+            return {
+                "title": message["message"],
+                "body": f"{message['quantity']} {message['ticker']}",
+                "data": {"event": "trade_completed", "trade_id": message["trade_id"]},
+            }
+        return {
+            "title": "Trades completed!",
+            "body": f"{len(messages)} trades completed",
+            "data": {"event": "trade_completed", "trade_ids": ",".join(m["trade_id"] for m in messages)},
+        }
+
+    def _take(self, outbox: deque) -> list:
+        return [outbox.popleft() for _ in range(min(self.batch_size, len(outbox)))]
+
+    def _retry(self, outbox: deque, entries: list, error: str):
+        loop = asyncio.get_running_loop()
+        for entry in entries:
+            attempt = entry[-1] + 1
+            if attempt > self.max_retries:
+                self.stats["failed"] += 1
+                logger.error(f"Giving up on notification after {self.max_retries} retries: {error}")
+                continue
+            self.stats["retried"] += 1
+            loop.call_later(self.retry_backoff * 2 ** (attempt - 1), self._enqueue, outbox, entry[:-1] + (attempt,))
+
+    async def insert_rows(self, entries: list):
+        try:
+            async with self.sessionmaker() as session:
+                await session.execute(insert(Notification), [row for row, _ in entries])
+                await session.commit()
+            self.stats["inserted"] += len(entries)
+        except Exception as e:
+            logger.warning(f"Notification insert failed: {str(e)}")
+            self._retry(self.rows, entries, str(e))
+
+    async def send_pushes(self, entries: list):
+        by_token: Dict[str, list] = defaultdict(list)
+        for entry in entries:
+            by_token[entry[0]].append(entry)
+        # Devices whose collapsed push is identical share one multicast
+        groups: Dict[tuple, tuple] = {}
+        for token, token_entries in by_token.items():
+            push = self.build_push([message for _, message, _ in token_entries])
+            key = (push["title"], push["body"], tuple(sorted(push["data"].items())))
+            groups.setdefault(key, (push, []))[1].append(token)
+        failed = []
+        for push, tokens in groups.values():
+            for start in range(0, len(tokens), MAX_MULTICAST_TOKENS):
+                chunk = tokens[start:start + MAX_MULTICAST_TOKENS]
+                self.stats["push_calls"] += 1
+                try:
+                    retry_tokens = await asyncio.to_thread(self.push_sink.send_multicast, chunk, push)
+                except Exception as e:
+                    logger.warning(f"Push multicast failed: {str(e)}")
+                    retry_tokens = chunk
+                self.stats["pushed"] += len(chunk) - len(retry_tokens)
+                for token in retry_tokens:
+                    failed.extend(by_token[token])
+        if failed:
+            self._retry(self.pushes, failed, "push delivery failed")
+
+    async def flush(self):
+        rows, pushes = self._take(self.rows), self._take(self.pushes)
+        if rows:
+            await self.insert_rows(rows)
+        if pushes:
+            await self.send_pushes(pushes)
+
+    async def run(self):
+        while True:
+            if not self.rows and not self.pushes:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error flushing notification outbox: {str(e)}", exc_info=True)
 
+    def get_stats(self) -> dict:
+        return {"queued_rows": len(self.rows), "queued_pushes": len(self.pushes), **self.stats}
 
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
 
+    async def stop(self):
+        """Stops the worker and flushes whatever is still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self.rows or self.pushes:
+            await self.flush()
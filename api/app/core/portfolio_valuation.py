@@ -0,0 +1,249 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+from app.core.event_bus import EventBus
+from app.core.trader_ledger import TraderLedger
+from app.db.trader_store import get_positions
+from app.utils.logger import logger
+
+TRACK_READS = 3  # Position reads per track before loading whatever was read last
+
+
+class Position:
+    __slots__ = ("quantity", "cost", "price")
+
+    def __init__(self, quantity: float, cost: float | None = None, price: float | None = None):
+        self.quantity = quantity
+        self.cost = cost  # Average price paid since tracking started, first quote for positions loaded from the DB
+        self.price = price
+
+    @property
+    def value(self) -> float:
+        return self.quantity * self.price if self.price is not None else 0.0
+
+    @property
+    def pnl(self) -> float:
+        return self.quantity * (self.price - self.cost) if self.price is not None and self.cost is not None else 0.0
+
+
+class LivePortfolio:
+    __slots__ = ("trader_id", "cash_balance", "positions", "value", "pnl")
+
+    def __init__(self, trader_id: str, cash_balance: float, positions: Dict[str, Position]):
+        self.trader_id = trader_id
+        self.cash_balance = cash_balance
+        self.positions = positions
+        self.recompute()
+
+    def recompute(self):
+        self.value = sum(position.value for position in self.positions.values())
+        self.pnl = sum(position.pnl for position in self.positions.values())
+
+
+class PortfolioValuator:
+    def __init__(self, ws_manager, sessionmaker=None, ledger: TraderLedger | None = None,
+                 bus: EventBus | None = None, channel: str = "portfolio"):
+        """
+        Live valuation of connected traders' portfolios. Positions are held in memory with a
+        symbol -> holders reverse index, so a price tick only touches the traders holding that
+        symbol and only their value and P&L are adjusted by the change. Each change is pushed
+        to the trader's market data socket as a portfolio_update delta. Fills are applied as
+        they settle; with a distributed bus they also reach the worker holding the socket.
+
+        :param ws_manager: Market data socket manager deltas are pushed to
+        :param sessionmaker: Async session factory used to load positions when tracking starts
+        :param ledger: Optional trader ledger positions are read from when current
+        :param bus: Event bus fills are shared over, None for a single process
+        :param channel: Bus channel for fills
+        """
+        self.ws_manager = ws_manager
+        self.sessionmaker = sessionmaker
+        self.ledger = ledger
+        self.bus = bus
+        self.channel = channel
+        self.portfolios: Dict[str, LivePortfolio] = {}
+        self.holders: Dict[str, Set[str]] = defaultdict(set)
+        self._loading: Dict[str, int] = {}  # Fills seen per trader while their positions are being read
+        self.stats = {"ticks": 0, "updates": 0, "fills": 0}
+        if bus is not None:
+            bus.subscribe(channel, self._on_bus_fills)
+
+    def symbols(self) -> List[str]:
+        return list(self.holders)
+
+    def load(self, trader_id: str, cash_balance: float, holdings: Iterable, quotes: Dict[str, dict] | None = None) -> dict:
+        """
+        Starts (or restarts) tracking a trader from their current holdings
+
+        :param trader_id: Trader to track
+        :param cash_balance: Current cash balance
+        :param holdings: Holdings with symbol and quantity
+        :param quotes: Already known quotes, used as the starting price and P&L reference
+        :return: Snapshot of the whole portfolio
+        """
+        self.untrack(trader_id)
+        positions = {}
+        for holding in holdings:
+            price = ((quotes or {}).get(holding.symbol) or {}).get("price")
+            positions[holding.symbol] = Position(holding.quantity, cost=price, price=price)
+            self.holders[holding.symbol].add(trader_id)
+        portfolio = self.portfolios[trader_id] = LivePortfolio(trader_id, cash_balance, positions)
+        return self._message("portfolio_snapshot", portfolio, positions)
+
+    async def track(self, trader_id: str) -> dict:
+        """
+        Loads a trader's positions, starts tracking them and pushes a snapshot. A fill settling
+        while the positions are read may or may not be in what was read, so the read is repeated
+        until one completes without a fill arriving for the trader.
+        """
+        self._loading.setdefault(trader_id, 0)
+        try:
+            for _ in range(TRACK_READS):
+                seen = self._loading[trader_id]
+                async with self.sessionmaker() as session:
+                    trader, holdings = await get_positions(trader_id, session, self.ledger)
+                if self._loading[trader_id] == seen:
+                    break
+            else:
+                logger.warning(f"Fills kept settling while loading trader {trader_id}, their portfolio may lag until the next reconnect")
+        finally:
+            self._loading.pop(trader_id, None)
+        snapshot = self.load(trader_id, trader.cash_balance, holdings)
+        await self.ws_manager.notify(trader_id, snapshot)
+        return snapshot
+
+    def untrack(self, trader_id: str):
+        portfolio = self.portfolios.pop(trader_id, None)
+        if portfolio is None:
+            return
+        for symbol in portfolio.positions:
+            self._drop_holder(symbol, trader_id)
+
+    def _drop_holder(self, symbol: str, trader_id: str):
+        holders = self.holders.get(symbol)
+        if holders is not None:
+            holders.discard(trader_id)
+            if not holders:
+                del self.holders[symbol]
+
+    @staticmethod
+    def _message(event: str, portfolio: LivePortfolio, positions: Dict[str, Position]) -> dict:
+        return {
+            "event": event,
+            "cash_balance": portfolio.cash_balance,
+            "value": portfolio.value,
+            "pnl": portfolio.pnl,
+            "total_value": portfolio.cash_balance + portfolio.value,
+            "positions": [
+                {"symbol": symbol, "quantity": position.quantity, "price": position.price,
+                 "value": position.value, "pnl": position.pnl}
+                for symbol, position in positions.items()
+            ],
+        }
+
+    def on_quotes(self, quotes: Dict[str, dict]) -> Dict[str, dict]:
+        """
+        Applies a batch of quotes to the portfolios holding the quoted symbols
+
+        :param quotes: Latest quotes keyed by symbol
+        :return: A portfolio_update delta per affected trader, listing only the positions that moved
+        """
+        changed: Dict[str, Dict[str, Position]] = defaultdict(dict)
+        for symbol, quote in quotes.items():
+            price = (quote or {}).get("price")
+            holders = self.holders.get(symbol)
+            if price is None or not holders:
+                continue
+            for trader_id in holders:
+                portfolio = self.portfolios[trader_id]
+                position = portfolio.positions[symbol]
+                if position.price == price:
+                    continue
+                if position.price is None:
+                    if position.cost is None:
+                        position.cost = price
+                    position.price = price
+                    portfolio.value += position.value
+                    portfolio.pnl += position.pnl
+                else:
+                    delta = position.quantity * (price - position.price)
+                    position.price = price
+                    portfolio.value += delta
+                    portfolio.pnl += delta
+                changed[trader_id][symbol] = position
+        self.stats["ticks"] += 1
+        return {
+            trader_id: self._message("portfolio_update", self.portfolios[trader_id], positions)
+            for trader_id, positions in changed.items()
+        }
+
+    def apply_fill(self, fill: dict) -> Position | None:
+        """
+        Applies a settled fill to a tracked portfolio
+
+        :param fill: Dict with trader_id, symbol, trade_type, quantity, price and the resulting cash_balance
+        :return: The updated position (quantity 0 once closed), or None if the trader isn't tracked here
+        """
+        if fill["trader_id"] in self._loading:
+            self._loading[fill["trader_id"]] += 1
+        portfolio = self.portfolios.get(fill["trader_id"])
+        if portfolio is None:
+            return None
+        symbol, quantity, price = fill["symbol"], fill["quantity"], fill["price"]
+        position = portfolio.positions.get(symbol)
+        if fill["trade_type"] == "buy":
+            if position is None:
+                position = portfolio.positions[symbol] = Position(0.0, cost=price, price=price)
+                self.holders[symbol].add(portfolio.trader_id)
+            elif position.cost is not None:
+                position.cost = (position.quantity * position.cost + quantity * price) / (position.quantity + quantity)
+            position.quantity += quantity
+        else:
+            position = position or Position(0.0)
+            position.quantity = max(position.quantity - quantity, 0.0)
+            if position.quantity == 0:
+                portfolio.positions.pop(symbol, None)
+                self._drop_holder(symbol, portfolio.trader_id)
+        portfolio.cash_balance = fill["cash_balance"]
+        portfolio.recompute()
+        self.stats["fills"] += 1
+        return position
+
+    async def _push(self, deltas: Dict[str, dict]):
+        for trader_id, delta in deltas.items():
+            if await self.ws_manager.notify(trader_id, delta):
+                self.stats["updates"] += 1
+            elif not self.ws_manager.has_active_connection(trader_id):
+                logger.info(f"No market data connection for trader {trader_id}, no longer valuing their portfolio")
+                self.untrack(trader_id)
+
+    async def push_quotes(self, quotes: Dict[str, dict]):
+        await self._push(self.on_quotes(quotes))
+
+    async def _apply_fills(self, fills: List[dict]):
+        changed: Dict[str, Dict[str, Position]] = defaultdict(dict)
+        for fill in fills:
+            position = self.apply_fill(fill)
+            if position is not None:
+                changed[fill["trader_id"]][fill["symbol"]] = position
+        await self._push({
+            trader_id: self._message("portfolio_update", self.portfolios[trader_id], positions)
+            for trader_id, positions in changed.items()
+            if trader_id in self.portfolios
+        })
+
+    async def record_fills(self, fills: List[dict]):
+        """
+        Applies settled fills here and shares them with the other workers
+
+        :param fills: Dicts as taken by apply_fill
+        """
+        await self._apply_fills(fills)
+        if self.bus is not None and self.bus.distributed and fills:
+            await self.bus.publish(self.channel, fills)
+
+    async def _on_bus_fills(self, fills: List[dict], origin: int | None):
+        if origin is not None:
+            await self._apply_fills(fills)
+
+    def get_stats(self) -> dict:
+        return {"traders": len(self.portfolios), "symbols": len(self.holders), **self.stats}
@@ -0,0 +1,83 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from app.core.stock_search import QuoteCache, quote_cache, error_quote, lookup_stock
+from app.core.price_sources import PriceSource, YFinanceSource, create_price_source
+from app.utils.logger import logger
+
+
+class PriceProvider:
+    def __init__(self, cache: QuoteCache, source: PriceSource | None = None, max_workers: int = 4, timeout: float = 10.0):
+        """
+        Async front for the blocking price and lookup calls. Cached quotes are answered on the
+        event loop; everything else runs on a dedicated, bounded thread pool so a slow download
+        never stalls websocket sends or trade processing.
+
+        :param cache: Quote cache shared with the synchronous helpers in stock_search
+        :param source: Where quotes come from, yfinance unless configured otherwise
+        :param max_workers: Number of threads allowed to block on the provider at once
+        :param timeout: Seconds before a call is abandoned and an error quote returned
+        """
+        self.cache = cache
+        self.source = source or YFinanceSource()
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="price-provider")
+        self.timeouts = 0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self.executor, func, *args), timeout=self.timeout)
+
+    async def get_quotes(self, tickers: List[str]) -> Dict[str, dict]:
+        """
+        Fetches the latest quote for each ticker
+
+        :param tickers: Stock ticker symbols (e.g., ['AAPL', 'GOOGL'])
+        :return: Dictionary of quotes keyed by ticker
+        """
+        quotes = self.cache.get_cached(tickers)
+        missing = [ticker for ticker in dict.fromkeys(tickers) if ticker not in quotes]
+        if not missing:
+            return quotes
+        try:
+            quotes.update(await self._run(self.cache.get_many, missing, self.source.fetch_quotes))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Price download for {missing} timed out after {self.timeout}s")
+            quotes.update({ticker: error_quote(ticker, "Download timed out") for ticker in missing})
+        return quotes
+
+    async def get_quote(self, ticker: str) -> dict:
+        return (await self.get_quotes([ticker]))[ticker]
+
+    async def lookup(self, symbol: str, result_length: int = 5) -> list:
+        try:
+            return await self._run(lookup_stock, symbol, result_length)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def get_stats(self) -> dict:
+        return {
+            "source": self.source.name,
+            "max_workers": self.max_workers,
+            "queued": self.executor._work_queue.qsize(),
+            "timeouts": self.timeouts,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+price_provider = PriceProvider(
+    cache=quote_cache,
+    source=create_price_source(
+        name=os.getenv("PRICE_SOURCE", "yfinance"),
+        seed=int(os.getenv("PRICE_SOURCE_SEED", "0")),
+        replay_path=os.getenv("PRICE_REPLAY_PATH"),
+    ),
+    max_workers=int(os.getenv("PRICE_PROVIDER_WORKERS", "4")),
+    timeout=float(os.getenv("PRICE_PROVIDER_TIMEOUT", "10")),
+)
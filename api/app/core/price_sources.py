@@ -0,0 +1,117 @@
+import math
+import random
+import threading
+import zlib
+from typing import Dict, List
+import pandas as pd
+from app.core.stock_search import download_quotes, error_quote
+from app.utils.date_utils import create_timestamp
+
+
+class PriceSource:
+    """Synchronous source of latest quotes. Implementations may block; PriceProvider runs them off the loop."""
+
+    name = "base"
+
+    def fetch_quotes(self, tickers: List[str]) -> Dict[str, dict]:
+        raise NotImplementedError
+
+
+class YFinanceSource(PriceSource):
+    name = "yfinance"
+
+    def fetch_quotes(self, tickers: List[str]) -> Dict[str, dict]:
+        return download_quotes(tickers)
+
+
+class RandomWalkSource(PriceSource):
+    name = "random_walk"
+
+    def __init__(self, seed: int = 0, volatility: float = 0.002):
+        """
+        Offline geometric random walk. Every ticker gets its own generator derived from the seed
+        and the ticker, so a ticker's price path is reproducible no matter which other tickers
+        are requested alongside it.
+
+        :param seed: Seed shared by all tickers
+        :param volatility: Standard deviation of the log return per fetch
+        """
+        self.seed = seed
+        self.volatility = volatility
+        self._walks: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    def _next_price(self, ticker: str) -> float:
+        walk = self._walks.get(ticker)
+        if walk is None:
+            rng = random.Random(self.seed ^ zlib.crc32(ticker.encode("utf-8")))
+            walk = self._walks[ticker] = [rng, rng.uniform(20.0, 500.0)]
+        rng, price = walk
+        walk[1] = price * math.exp(rng.gauss(0.0, self.volatility))
+        return round(walk[1], 4)
+
+    def fetch_quotes(self, tickers: List[str]) -> Dict[str, dict]:
+        timestamp = create_timestamp()
+        with self._lock:
+            return {
+                ticker: {"ticker": ticker, "price": self._next_price(ticker), "date": timestamp}
+                for ticker in tickers
+            }
+
+
+class ReplaySource(PriceSource):
+    name = "replay"
+
+    def __init__(self, path: str):
+        """
+        Replays recorded ticks from a CSV or Parquet file with timestamp, ticker and price columns.
+        Each fetch advances a ticker to its next recorded tick and wraps around at the end.
+
+        :param path: Path to a .csv or .parquet file
+        """
+        if path.endswith(".parquet"):
+            ticks = pd.read_parquet(path, columns=["timestamp", "ticker", "price"])
+        else:
+            ticks = pd.read_csv(path, usecols=["timestamp", "ticker", "price"])
+        ticks = ticks.sort_values("timestamp", kind="stable")
+        self.path = path
+        self._ticks = {
+            ticker: list(zip(group["timestamp"].astype(str), group["price"].astype(float)))
+            for ticker, group in ticks.groupby("ticker", sort=False)
+        }
+        self._cursors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def fetch_quotes(self, tickers: List[str]) -> Dict[str, dict]:
+        results = {}
+        with self._lock:
+            for ticker in tickers:
+                ticks = self._ticks.get(ticker)
+                if not ticks:
+                    results[ticker] = error_quote(ticker, "No recorded ticks")
+                    continue
+                cursor = self._cursors.get(ticker, 0)
+                timestamp, price = ticks[cursor]
+                self._cursors[ticker] = (cursor + 1) % len(ticks)
+                results[ticker] = {"ticker": ticker, "price": price, "date": timestamp}
+        return results
+
+
+def create_price_source(name: str, seed: int = 0, replay_path: str | None = None) -> PriceSource:
+    """
+    Builds the configured price source
+
+    :param name: One of 'yfinance', 'random_walk' or 'replay'
+    :param seed: Seed for the random walk source
+    :param replay_path: Recorded tick file for the replay source
+    :return: Price source instance
+    """
+    if name == YFinanceSource.name:
+        return YFinanceSource()
+    if name == RandomWalkSource.name:
+        return RandomWalkSource(seed=seed)
+    if name == ReplaySource.name:
+        if not replay_path:
+            raise ValueError("PRICE_REPLAY_PATH must be set for the replay price source")
+        return ReplaySource(replay_path)
+    raise ValueError(f"Unknown price source: {name}")
@@ -0,0 +1,90 @@
+import asyncio
+from typing import Dict, Iterable
+from app.core.websocket_manager import WebsocketManager
+from app.utils.logger import logger
+
+
+class ProgressAggregator:
+    def __init__(self, flush_interval: float = 0.5, min_delta: float = 0.0):
+        """
+        Merges trade progress updates into one frame per connection per flush. A newer update
+        for a trade replaces the pending one, and updates that haven't moved by at least
+        min_delta percentage points (with the same status) are skipped altogether.
+
+        :param flush_interval: Seconds between batched frames
+        :param min_delta: Minimum progress change, in percentage points, worth sending
+        """
+        self.flush_interval = flush_interval
+        self.min_delta = min_delta
+        self.pending: Dict[str, Dict[str, dict]] = {}
+        self.last_sent: Dict[str, tuple] = {}
+        self.ws_manager: WebsocketManager | None = None
+        self.updates = 0
+        self.skipped = 0
+        self.frames = 0
+        self._task: asyncio.Task | None = None
+
+    def add(self, update: dict, recipients: Iterable[str]):
+        """
+        Queues a progress update for the next flush
+
+        :param update: trade_progress message with trade_id, progress and status
+        :param recipients: Traders whose connections should receive it
+        """
+        trade_id = update["trade_id"]
+        last = self.last_sent.get(trade_id)
+        if last is not None and last[1] == update["status"] and abs(update["progress"] - last[0]) < self.min_delta:
+            self.skipped += 1
+            return
+        self.last_sent[trade_id] = (update["progress"], update["status"])
+        self.updates += 1
+        for recipient in recipients:
+            self.pending.setdefault(recipient, {})[trade_id] = update
+
+    def discard(self, trade_id: str):
+        """Forgets a finished trade so no stale progress is sent after its completion event"""
+        self.last_sent.pop(trade_id, None)
+        for updates in self.pending.values():
+            updates.pop(trade_id, None)
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        for trader_id, updates in pending.items():
+            if not updates:
+                continue
+            await self.ws_manager.notify(trader_id, {
+                "event": "trade_progress_batch",
+                "trades": list(updates.values()),
+            })
+            self.frames += 1
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error flushing trade progress: {str(e)}")
+
+    def get_stats(self) -> dict:
+        return {
+            "updates": self.updates,
+            "skipped": self.skipped,
+            "frames": self.frames,
+            "tracked_trades": len(self.last_sent),
+        }
+
+    def start(self, ws_manager: WebsocketManager):
+        self.ws_manager = ws_manager
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.ws_manager is not None:
+            await self.flush()
@@ -0,0 +1,85 @@
+import threading
+from typing import List
+from app.utils.logger import logger
+
+# FCM accepts at most this many tokens per multicast
+MAX_MULTICAST_TOKENS = 500
+
+
+class PushSink:
+    """Synchronous push delivery. Implementations may block; the notification worker runs them off the loop."""
+
+    name = "base"
+
+    def send_multicast(self, tokens: List[str], message: dict) -> List[str]:
+        """
+        Sends one message to many device tokens
+
+        :param tokens: Device tokens, at most MAX_MULTICAST_TOKENS
+        :param message: Dictionary with title, body and string-valued data
+        :return: Tokens that failed with a transient error and should be retried
+        """
+        raise NotImplementedError
+
+
+class FirebasePushSink(PushSink):
+    name = "firebase"
+
+    def send_multicast(self, tokens: List[str], message: dict) -> List[str]:
+        from firebase_admin import messaging
+
+        response = messaging.send_each_for_multicast(messaging.MulticastMessage(
+            tokens=tokens,
+            notification=messaging.Notification(title=message["title"], body=message["body"]),
+            data=message["data"],
+        ))
+        retry = []
+        for token, result in zip(tokens, response.responses):
+            if result.success:
+                continue
+            if isinstance(result.exception, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+                logger.info(f"Dropping push to stale token {token[:12]}...: {result.exception}")
+            else:
+                retry.append(token)
+        return retry
+
+
+class StubPushSink(PushSink):
+    name = "stub"
+
+    def __init__(self, fail_tokens: dict | None = None):
+        """
+        Records pushes instead of sending them, for local runs and tests.
+
+        :param fail_tokens: Number of transient failures to simulate per token
+        """
+        self.fail_tokens = dict(fail_tokens or {})
+        self.sent: List[tuple] = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def send_multicast(self, tokens: List[str], message: dict) -> List[str]:
+        with self._lock:
+            self.calls += 1
+            retry = []
+            for token in tokens:
+                if self.fail_tokens.get(token, 0) > 0:
+                    self.fail_tokens[token] -= 1
+                    retry.append(token)
+                else:
+                    self.sent.append((token, message))
+            return retry
+
+
+def create_push_sink(name: str) -> PushSink:
+    """
+    Builds the configured push sink
+
+    :param name: One of 'firebase' or 'stub'
+    :return: Push sink instance
+    """
+    if name == FirebasePushSink.name:
+        return FirebasePushSink()
+    if name == StubPushSink.name:
+        return StubPushSink()
+    raise ValueError(f"Unknown push sink: {name}")
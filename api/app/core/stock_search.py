@@ -1,6 +1,9 @@
 import yfinance as yf
-import pandas as pd
-import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple
 from app.utils.date_utils import create_timestamp
 from app.utils.logger import logger
 
@@ -20,7 +23,6 @@ def lookup_stock(symbol: str, result_length:int=5) -> dict:
         raise ValueError(f"Stock with symbol {symbol} not found.")
     if len(filtered_stocks) > result_length:
         filtered_stocks = filtered_stocks[:result_length]
-    print(filtered_stocks.columns)
     stock_list=[]
     for symbol in filtered_stocks.index:
         data=filtered_stocks.loc[symbol]
@@ -33,101 +35,157 @@ def lookup_stock(symbol: str, result_length:int=5) -> dict:
         
         
 
-def get_price_data(ticker: str):
+class QuoteCache:
+    def __init__(self, ttl: float = 5.0, max_size: int = 2048, wait_timeout: float = 30.0):
         """
-        Fetches the latest price and date for a given stock ticker.
-        
-        :param ticker: Stock ticker symbol (e.g., 'AAPL', 'GOOGL')
-        :return: Dictionary with latest price data
+        Thread-safe TTL cache of latest quotes with LRU eviction and single-flight fetching:
+        concurrent misses for the same symbol wait for one download instead of starting their own.
+
+        :param ttl: Seconds a quote stays fresh
+        :param max_size: Maximum number of symbols kept, least recently used are evicted first
+        :param wait_timeout: Seconds a coalesced caller waits for the in-flight download
         """
-        # Fetch historical data for the ticker
-        try:
-            data = yf.download([ticker], period="1d", interval="1m")
-            
-            if data.empty:
-                raise ValueError(f"No data found for ticker: {ticker}")
-            
-            # Get the last row of data
-            latest_row = data.iloc[-1]
-            timestamp = create_timestamp 
-            
-            # Handle values whether they're single values or Series objects
-            def safe_float(value):
-                if hasattr(value, "iloc"):  # Check if it's a Series
-                    value=float(value.iloc[0])
-                value=float(value)
-                return value if not math.isnan(value) else None
-            # Create result dictionary with safely converted values
-            result = {
-                "ticker": ticker,
-                "price": safe_float(latest_row["Close"]),
-                "date": timestamp
-            }
-            
-            return result
-        except Exception as e:
-            logger.error(f"Error fetching price data for {ticker}: {e}")
-            return {
-            "ticker": ticker,
-            "price": None,
-            "date": None,
-            "error": f"Download failed: {str(e)}"
-            }
-
-def get_multiple_price_data(tickers: list):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self._entries: OrderedDict[str, Tuple[float, dict]] = OrderedDict()
+        self._in_flight: Dict[str, "_Flight"] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_many(self, tickers: List[str], fetch: Callable[[List[str]], Dict[str, dict]]) -> Dict[str, dict]:
         """
-        Fetches the latest price and date for multiple stock tickers.
-        
+        Returns a quote per ticker, downloading only the ones that are missing or stale
+
+        :param tickers: Stock ticker symbols
+        :param fetch: Function downloading quotes for a list of tickers, keyed by ticker
+        :return: Dictionary of quotes keyed by ticker
+        """
+        results = {}
+        to_fetch: List[str] = []
+        to_wait: List[Tuple[str, _Flight]] = []
+        now = time.monotonic()
+        with self._lock:
+            for ticker in dict.fromkeys(tickers):
+                entry = self._entries.get(ticker)
+                if entry is not None and entry[0] > now:
+                    self.hits += 1
+                    self._entries.move_to_end(ticker)
+                    results[ticker] = entry[1]
+                elif ticker in self._in_flight:
+                    self.coalesced += 1
+                    to_wait.append((ticker, self._in_flight[ticker]))
+                else:
+                    self.misses += 1
+                    self._in_flight[ticker] = _Flight()
+                    to_fetch.append(ticker)
+        if to_fetch:
+            fetched = {}
+            try:
+                fetched = fetch(to_fetch)
+            finally:
+                expires_at = time.monotonic() + self.ttl
+                with self._lock:
+                    for ticker in to_fetch:
+                        quote = fetched.get(ticker) or error_quote(ticker, "No data found")
+                        if quote.get("price") is not None:
+                            self._entries[ticker] = (expires_at, quote)
+                            self._entries.move_to_end(ticker)
+                        flight = self._in_flight.pop(ticker)
+                        flight.quote = quote
+                        flight.event.set()
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+            for ticker in to_fetch:
+                results[ticker] = fetched.get(ticker) or error_quote(ticker, "No data found")
+        for ticker, flight in to_wait:
+            flight.event.wait(self.wait_timeout)
+            results[ticker] = flight.quote or error_quote(ticker, "Timed out waiting for download")
+        return results
+
+    def get_cached(self, tickers: List[str]) -> Dict[str, dict]:
+        """
+        Returns the fresh quotes among the tickers without downloading anything
+
+        :param tickers: Stock ticker symbols
+        :return: Dictionary of cached quotes keyed by ticker, missing or stale tickers are left out
+        """
+        results = {}
+        now = time.monotonic()
+        with self._lock:
+            for ticker in dict.fromkeys(tickers):
+                entry = self._entries.get(ticker)
+                if entry is not None and entry[0] > now:
+                    self.hits += 1
+                    self._entries.move_to_end(ticker)
+                    results[ticker] = entry[1]
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.quote: dict | None = None
+
+
+def error_quote(ticker: str, error: str) -> dict:
+    return {"ticker": ticker, "price": None, "date": None, "error": error}
+
+
+def download_quotes(tickers: List[str]) -> Dict[str, dict]:
+        """
+        Downloads the latest price for each ticker in one batched yfinance call.
+
         :param tickers: List of stock ticker symbols (e.g., ['AAPL', 'GOOGL'])
-        :return: Dictionary with latest price data for each ticker
+        :return: Dictionary of quotes keyed by ticker
         """
         try:
-            # Fetch historical data for multiple tickers
-            data = yf.download(tickers, period="1d", interval="1m")
-            
-            if data.empty:
-                return {ticker: {"ticker": ticker, "price": None, "date": None, "error": "No data found"} for ticker in tickers}
-            
-            # Get the last timestamp
-            timestamp = create_timestamp()
-            
-            # Create result dictionary
-            results = {}
-            
-            # Handle different structures based on whether we have one or multiple tickers
-            if len(tickers) == 1:
-                # Single ticker - simpler structure
-                ticker = tickers[0]
-                latest_row = data.iloc[-1]
-                
+            data = yf.download(tickers, period="1d", interval="1m", progress=False)
+        except Exception as e:
+            logger.error(f"Error fetching price data for tickers {tickers}: {e}")
+            return {ticker: error_quote(ticker, f"Download failed: {str(e)}") for ticker in tickers}
+        if data.empty:
+            return {ticker: error_quote(ticker, "No data found") for ticker in tickers}
+        timestamp = create_timestamp()
+        results = {}
+        for ticker in tickers:
+            try:
+                # Tickers can stop at different minutes, so take each one's last traded close
+                closes = data["Close", ticker].dropna()
+                if closes.empty:
+                    results[ticker] = error_quote(ticker, "No data found")
+                    continue
                 results[ticker] = {
                     "ticker": ticker,
-                    "price": float(latest_row["Close", ticker].iloc[-1]) if isinstance(latest_row["Close", ticker], pd.Series) else float(latest_row["Close", ticker]),
+                    "price": float(closes.iloc[-1]),
                     "date": timestamp
                 }
-            else:
-                # Multiple tickers - data is organized with MultiIndex columns
-                for ticker in tickers:
-                    try:
-                        # Extract data for this ticker from the last row
-                        price = float(data["Close", ticker].iloc[-1])
-                        
-                        results[ticker] = {
-                            "ticker": ticker,
-                            "price": None if math.isnan(price) else price,
-                            "date": timestamp
-                        }
-                    except Exception as e:
-                        # Handle case where a particular ticker might be missing
-                        results[ticker] = {
-                            "ticker": ticker,
-                            "price": None,
-                            "date": timestamp,
-                            "error": f"Error processing ticker data: {str(e)}"
-                        }
-            
-            return list(results.values())
-            
-        except Exception as e:
-            logger.error(f"Error fetching price data for tickers {tickers}: {e}")
-            return {ticker: {"ticker": ticker, "price": None, "date": None, "error": f"Download failed: {str(e)}"} for ticker in tickers}
\ No newline at end of file
+            except Exception as e:
+                # Handle case where a particular ticker might be missing
+                results[ticker] = {
+                    "ticker": ticker,
+                    "price": None,
+                    "date": timestamp,
+                    "error": f"Error processing ticker data: {str(e)}"
+                }
+        return results
+
+
+quote_cache = QuoteCache(
+    ttl=float(os.getenv("QUOTE_CACHE_TTL", "5")),
+    max_size=int(os.getenv("QUOTE_CACHE_MAX_SIZE", "2048")),
+)
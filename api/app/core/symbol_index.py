@@ -0,0 +1,181 @@
+import asyncio
+import csv
+import os
+import sys
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Tuple
+from app.utils.logger import logger
+
+DEFAULT_SYMBOLS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "symbols.csv")
+
+# Ranks, best first
+EXACT_TICKER, TICKER_PREFIX, NAME_PREFIX, NAME_WORD_PREFIX = range(4)
+
+
+class SymbolIndex:
+    def __init__(self, path: str = DEFAULT_SYMBOLS_PATH, max_candidates: int = 200):
+        """
+        In-memory type-ahead index over a local symbol universe. Tickers, full company names
+        and each word of the name are kept in sorted arrays, so a lookup is a couple of binary
+        searches instead of a network round trip.
+
+        :param path: CSV file with symbol and name columns
+        :param max_candidates: Maximum prefix matches scanned per key type before ranking
+        """
+        self.path = path
+        self.max_candidates = max_candidates
+        self._symbols: List[Tuple[str, str]] = []
+        self._ticker_keys: List[Tuple[str, int]] = []
+        self._name_keys: List[Tuple[str, int, int]] = []
+        self.loaded_mtime: float | None = None
+        self.loaded_at: str | None = None
+        self._task: asyncio.Task | None = None
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def load(self):
+        mtime = os.path.getmtime(self.path)
+        symbols = []
+        with open(self.path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                symbol = (row.get("symbol") or "").strip().upper()
+                if symbol:
+                    symbols.append((symbol, (row.get("name") or "").strip()))
+        ticker_keys = sorted((symbol, i) for i, (symbol, _) in enumerate(symbols))
+        name_keys = []
+        for i, (_, name) in enumerate(symbols):
+            lowered = name.lower()
+            if not lowered:
+                continue
+            name_keys.append((lowered, i, 0))
+            for position, word in enumerate(lowered.split()[1:], start=1):
+                name_keys.append((word, i, position))
+        name_keys.sort()
+        # Swap everything at once so concurrent searches never see a half-built index
+        self._symbols, self._ticker_keys, self._name_keys = symbols, ticker_keys, name_keys
+        self.loaded_mtime = mtime
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        logger.info(f"Loaded {len(symbols)} symbols from {self.path}")
+
+    def _prefix_matches(self, keys: list, prefix: str):
+        start = bisect_left(keys, (prefix,))
+        for key in keys[start:start + self.max_candidates]:
+            if not key[0].startswith(prefix):
+                break
+            yield key
+
+    def search(self, query: str, limit: int = 5) -> List[dict]:
+        """
+        Ranked prefix search over tickers and company names.
+        Exact ticker matches come first, then ticker prefixes, then names starting with the
+        query, then names containing a word starting with it; shorter tickers win ties.
+
+        :param query: Ticker or company name prefix typed by the user
+        :param limit: Maximum number of results
+        :return: List of {"symbol", "name"} dictionaries
+        """
+        query = query.strip()
+        if not query:
+            return []
+        symbols, ticker_keys, name_keys = self._symbols, self._ticker_keys, self._name_keys
+        best = {}
+        upper = query.upper()
+        for ticker, i in self._prefix_matches(ticker_keys, upper):
+            best[i] = EXACT_TICKER if ticker == upper else TICKER_PREFIX
+        for _, i, position in self._prefix_matches(name_keys, query.lower()):
+            rank = NAME_PREFIX if position == 0 else NAME_WORD_PREFIX
+            if rank < best.get(i, NAME_WORD_PREFIX + 1):
+                best[i] = rank
+        ranked = sorted(best, key=lambda i: (best[i], len(symbols[i][0]), symbols[i][0]))
+        return [{"symbol": symbols[i][0], "name": symbols[i][1]} for i in ranked[:limit]]
+
+    def add(self, results: List[dict]) -> int:
+        """
+        Merges symbols found elsewhere, such as a live lookup, into the index until the next reload
+
+        :param results: {"symbol", "name"} dictionaries
+        :return: Number of symbols that weren't indexed yet
+        """
+        known = {symbol for symbol, _ in self._symbols}
+        added = 0
+        for result in results:
+            symbol = (result.get("symbol") or "").strip().upper()
+            if not symbol or symbol in known:
+                continue
+            known.add(symbol)
+            i = len(self._symbols)
+            name = (result.get("name") or "").strip()
+            self._symbols.append((symbol, name))
+            insort(self._ticker_keys, (symbol, i))
+            lowered = name.lower()
+            if lowered:
+                insort(self._name_keys, (lowered, i, 0))
+                for position, word in enumerate(lowered.split()[1:], start=1):
+                    insort(self._name_keys, (word, i, position))
+            added += 1
+        return added
+
+    async def search_or_lookup(self, query: str, limit: int,
+                               lookup: Callable[[str, int], Awaitable[List[dict]]]) -> List[dict]:
+        """
+        Searches the index, falling back to a live lookup when nothing local matches; the
+        symbols it finds are added to the index so the next search is served locally
+
+        :param query: Ticker or company name prefix typed by the user
+        :param limit: Maximum number of results
+        :param lookup: Live lookup, raising ValueError when nothing is found
+        :return: List of {"symbol", "name"} dictionaries
+        """
+        results = self.search(query, limit)
+        if results:
+            return results
+        results = await lookup(query, limit)
+        self.add(results)
+        return results
+
+    def memory_bytes(self) -> int:
+        seen = set()
+        total = 0
+        for container in (self._symbols, self._ticker_keys, self._name_keys):
+            total += sys.getsizeof(container)
+            for entry in container:
+                total += sys.getsizeof(entry)
+                for item in entry:
+                    if id(item) not in seen:
+                        seen.add(id(item))
+                        total += sys.getsizeof(item)
+        return total
+
+    def get_stats(self) -> dict:
+        return {
+            "symbols": len(self._symbols),
+            "keys": len(self._ticker_keys) + len(self._name_keys),
+            "memory_bytes": self.memory_bytes(),
+            "loaded_at": self.loaded_at,
+        }
+
+    async def refresh_loop(self, interval: float):
+        while True:
+            try:
+                if os.path.getmtime(self.path) != self.loaded_mtime:
+                    await asyncio.to_thread(self.load)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error refreshing symbol index from {self.path}: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def start(self, refresh_interval: float = 300.0):
+        if self._task is None:
+            self._task = asyncio.create_task(self.refresh_loop(refresh_interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+symbol_index = SymbolIndex(path=os.getenv("SYMBOLS_PATH", DEFAULT_SYMBOLS_PATH))
@@ -0,0 +1,153 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+import numpy as np
+
+# Bar length in seconds for each resampling interval
+INTERVALS = {"1m": 60, "5m": 300, "15m": 900}
+BAR_COLUMNS = ("ts", "open", "high", "low", "close", "ticks")
+
+
+def empty_ohlc() -> Dict[str, np.ndarray]:
+    return {column: np.empty(0, dtype=np.int64 if column in ("ts", "ticks") else np.float64) for column in BAR_COLUMNS}
+
+
+def resample(ts: np.ndarray, price: np.ndarray, seconds: int) -> Dict[str, np.ndarray]:
+    """
+    Buckets time-ordered ticks into OHLC bars without a Python loop
+
+    :param ts: Tick times in epoch seconds, ascending
+    :param price: Tick prices
+    :param seconds: Bar length
+    :return: Column arrays keyed by BAR_COLUMNS, ts being each bar's start
+    """
+    if not len(ts):
+        return empty_ohlc()
+    buckets = (ts // seconds).astype(np.int64) * seconds
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.append(starts[1:], len(ts))
+    return {
+        "ts": buckets[starts],
+        "open": price[starts],
+        "high": np.maximum.reduceat(price, starts),
+        "low": np.minimum.reduceat(price, starts),
+        "close": price[ends - 1],
+        "ticks": ends - starts,
+    }
+
+
+class TickRing:
+    __slots__ = ("ts", "price", "head", "count")
+
+    def __init__(self, capacity: int):
+        """
+        Fixed-capacity ring of (time, price) ticks for one symbol; once full, each new tick
+        overwrites the oldest
+
+        :param capacity: Maximum ticks kept
+        """
+        self.ts = np.empty(capacity, dtype=np.float64)
+        self.price = np.empty(capacity, dtype=np.float64)
+        self.head = 0  # Next slot written
+        self.count = 0
+
+    def append(self, ts: float, price: float) -> bool:
+        if self.count and ts < self.ts[self.head - 1]:
+            return False  # Keep the ring time-ordered if the clock steps back
+        self.ts[self.head] = ts
+        self.price[self.head] = price
+        self.head = (self.head + 1) % len(self.ts)
+        self.count = min(self.count + 1, len(self.ts))
+        return True
+
+    def series(self, since: float | None = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the buffered ticks in time order
+
+        :param since: Only ticks at or after this epoch time, None for all
+        :return: (times, prices)
+        """
+        if self.count < len(self.ts):
+            ts, price = self.ts[:self.count], self.price[:self.count]
+        else:
+            ts = np.concatenate((self.ts[self.head:], self.ts[:self.head]))
+            price = np.concatenate((self.price[self.head:], self.price[:self.head]))
+        lo = int(np.searchsorted(ts, since, side="left")) if since is not None else 0
+        return ts[lo:], price[lo:]
+
+
+class TickStore:
+    def __init__(self, capacity: int = 8640, max_symbols: int = 256):
+        """
+        Intraday ticks recorded from the market data poll, one ring per symbol, resampled to
+        OHLC bars on request. Memory is capped at capacity ticks per symbol and max_symbols
+        rings; the symbol ticked least recently is dropped first.
+
+        :param capacity: Ticks kept per symbol, a day of 10s polls by default
+        :param max_symbols: Maximum symbols buffered
+        """
+        self.capacity = capacity
+        self.max_symbols = max_symbols
+        self._rings: OrderedDict[str, TickRing] = OrderedDict()
+        self.ticks = 0
+        self.evicted = 0
+
+    def record(self, quotes: Dict[str, dict], ts: float | None = None):
+        """
+        Appends the priced quotes of one poll
+
+        :param quotes: Quotes keyed by symbol
+        :param ts: Poll time in epoch seconds, now if None
+        """
+        ts = time.time() if ts is None else ts
+        for symbol, quote in quotes.items():
+            price = (quote or {}).get("price")
+            if price is None:
+                continue
+            ring = self._rings.get(symbol)
+            if ring is None:
+                ring = self._rings[symbol] = TickRing(self.capacity)
+                if len(self._rings) > self.max_symbols:
+                    self._rings.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._rings.move_to_end(symbol)
+            if ring.append(ts, price):
+                self.ticks += 1
+
+    def bars(self, symbol: str, interval: str = "1m", since: datetime | None = None) -> Dict[str, np.ndarray]:
+        """
+        Resamples a symbol's buffered ticks into OHLC bars
+
+        :param symbol: Stock ticker symbol
+        :param interval: One of INTERVALS
+        :param since: First bar time, defaults to the start of the current UTC day
+        :return: Column arrays keyed by BAR_COLUMNS, empty if the symbol isn't buffered
+        """
+        if interval not in INTERVALS:
+            raise ValueError(f"Unsupported interval {interval}, expected one of {', '.join(INTERVALS)}")
+        ring = self._rings.get(symbol.upper())
+        if ring is None:
+            return empty_ohlc()
+        if since is None:
+            since = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        elif since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        ts, price = ring.series(since.timestamp())
+        return resample(ts, price, INTERVALS[interval])
+
+    def get_stats(self) -> dict:
+        return {
+            "symbols": len(self._rings),
+            "ticks": self.ticks,
+            "evicted": self.evicted,
+            "bytes": sum(ring.ts.nbytes + ring.price.nbytes for ring in self._rings.values()),
+        }
+
+
+tick_store = TickStore(
+    capacity=int(os.getenv("TICK_BUFFER_CAPACITY", "8640")),
+    max_symbols=int(os.getenv("TICK_BUFFER_MAX_SYMBOLS", "256")),
+)
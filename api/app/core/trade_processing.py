@@ -1,9 +1,15 @@
-from typing import Literal, List
+from typing import Dict, Literal, List
+from collections import Counter
 import asyncio
+import zlib
 from asyncio import Task
 from app.core.notifications import NotificationService
 from app.core.websocket_manager import WebsocketManager
-from app.db.trader_store import get_trader_by_id, update_on_trade
+from app.core.fill_scheduler import FillScheduler
+from app.core.progress_aggregator import ProgressAggregator
+from app.db.trader_store import settle_trades
+from app.core.trader_ledger import TraderLedger
+from app.core.portfolio_valuation import PortfolioValuator
 import time
 from app.utils.logger import logger 
 import random
@@ -12,7 +18,7 @@ import uuid
 
 class Stock:
     def __init__(self, ticker, price):
-        self.ticker = ticker
+        self.ticker = ticker.strip().upper()  # Trades and holdings are stored and filtered by upper-case symbol
         self.price = price
 
 
@@ -45,7 +51,7 @@ class StockTrade:
         self.stock = stock
 
     def start(self):
-        print("Trade started")
+        logger.debug(f"Trade {self.id} started")
         self.timestamp = time.time()
         self.status = "in_progress"
 
@@ -59,7 +65,7 @@ class StockTrade:
     def complete(self):
         self.status = "completed"
         self.timestamp = None
-        print("Trade filled")
+        logger.debug(f"Trade {self.id} filled")
 
 
 class Trader:
@@ -81,82 +87,328 @@ class Trader:
         return StockTrade(trader_id=self.trader_id, stock=stock, quantity=quantity, trade_type=trade_type)
 
 
+class TradeQueueFullError(Exception):
+    """Raised when the execution queue cannot accept another order in time."""
+
+
 class TradeSystem:
-    def __init__(self, sessionmaker, num_processors: int = 5):
+    def __init__(
+        self,
+        sessionmaker,
+        num_processors: int = 5,
+        max_pending: int = 10000,
+        enqueue_timeout: float = 0.5,
+        tick_interval: float = 0.5,
+        settle_batch_size: int = 100,
+        settle_window: float = 0.005,
+        progress_interval: float = 0.5,
+        progress_min_delta: float = 0.0,
+        ledger: TraderLedger | None = None,
+    ):
+        """
+        Long-lived trade execution engine shared by the whole process.
+        Simulated execution latency is tracked by a single FillScheduler; filled orders are
+        hashed by trader onto one settlement queue per processor, so a trader's orders settle
+        one after another while different traders settle in parallel.
+            :param sessionmaker: Async session factory used for settlement
+            :param num_processors: Number of settlement shards, each drained by a dedicated worker
+            :param max_pending: Maximum number of orders in flight or awaiting settlement
+            :param enqueue_timeout: Seconds to wait for capacity before rejecting an order
+            :param tick_interval: Seconds between trade progress updates
+            :param settle_batch_size: Maximum number of fills committed in one transaction
+            :param settle_window: Seconds a worker waits for more fills before committing a batch
+            :param progress_interval: Seconds between batched progress frames sent to each connection
+            :param progress_min_delta: Minimum progress change, in percentage points, worth sending
+            :param ledger: In-memory trader ledger used by settlement, None to always read from the database
+        """
         self.sessionmaker=sessionmaker
-        self.trade_orders = asyncio.Queue()
+        self.ledger = ledger
         self.num_processors = num_processors
+        self.max_pending = max_pending
+        self.shards: List[asyncio.Queue] = [asyncio.Queue() for _ in range(num_processors)]
+        self.shard_stats = [{"processed": 0, "failed": 0, "batches": 0, "max_depth": 0} for _ in range(num_processors)]
+        self.pending_by_trader: Counter = Counter()
+        self.capacity = asyncio.Semaphore(max_pending)
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.enqueue_timeout = enqueue_timeout
+        self.settle_batch_size = settle_batch_size
+        self.settle_window = settle_window
+        self.scheduler = FillScheduler(
+            on_progress=self.publish_progress,
+            on_fill=self.route_fill,
+            tick_interval=tick_interval,
+        )
+        self.progress = ProgressAggregator(flush_interval=progress_interval, min_delta=progress_min_delta)
         self.processors: List[Task] = []
         self.shutdown_flag = False
+        self.ws_manager: WebsocketManager | None = None
+        self.notification_service: NotificationService | None = None
+        self.valuator: PortfolioValuator | None = None
+
+    def shard_for(self, trader_id: str) -> int:
+        # crc32 rather than hash() so the mapping is stable across processes and restarts
+        return zlib.crc32(trader_id.encode("utf-8")) % self.num_processors
+
+    async def _acquire_capacity(self, count: int):
+        """
+        Reserves capacity for count orders, all or nothing, within enqueue_timeout
+            :param count: Number of orders to reserve room for
+        """
+        if self.shutdown_flag:
+            raise TradeQueueFullError("Trade system is shutting down")
+        if count > self.max_pending:
+            raise TradeQueueFullError(f"Batch of {count} orders exceeds the queue limit of {self.max_pending}")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.enqueue_timeout
+        acquired = 0
+        try:
+            while acquired < count:
+                if self.capacity.locked():
+                    await asyncio.wait_for(self.capacity.acquire(), timeout=max(deadline - loop.time(), 0))
+                else:
+                    await self.capacity.acquire()
+                acquired += 1
+        except BaseException as e:
+            # Hand back a partial reservation on timeout and on cancellation alike, or the slots leak
+            for _ in range(acquired):
+                self.capacity.release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise TradeQueueFullError(
+                    f"Trade queue is full ({self.max_pending} orders pending), try again later"
+                )
+            raise
+
+    def _enqueue(self, trade_order: StockTrade):
+        self.pending_by_trader[trade_order.trader_id] += 1
+        self.idle.clear()
+        self.scheduler.schedule(trade_order)
 
     async def add_trade_order(self, trade_order: StockTrade):
-        await self.trade_orders.put(trade_order)
-
-    async def process_trade(self, processor_id, ws_manager: WebsocketManager, notification_service: NotificationService):
-        async with self.sessionmaker() as session:
-            while not self.shutdown_flag:
-                try:
-                    trade = await self.trade_orders.get()
-                    trade.start()
-                    interval = 0.5
-                    while trade.get_progress() < 1.0:
-                        await asyncio.sleep(interval)
-                        progress = trade.get_progress() * 100
-                        print(
-                            f"[Processor: {processor_id}]Processing trade:{trade.id} for {trade.quantity} shares of {trade.stock.ticker}, Progress:{progress}"
-                        )
-                        message = {
-                            "event": "trade_progress",
-                            "trade_id": trade.id,
-                            "trader_id":trade.trader_id,
-                            "ticker": trade.stock.ticker,
-                            "quantity": trade.quantity,
-                            "progress": round(progress, 2),
-                            "status": trade.status,
-                        }
-                        await ws_manager.broadcast(message)
-                    trade.complete()
-                    updated_trader_data=await update_on_trade(trader_id=trade.trader_id, trade_type=trade.trade_type, quantity=trade.quantity, symbol=trade.stock.ticker, price=trade.stock.price, session=session)
-                    trader=updated_trader_data["trader"]
-                    message=await notification_service.send_notification(trader,  trade, ws_manager, session)
-                    self.trade_orders.task_done()
-                except asyncio.TimeoutError:
-                    continue
-                except Exception as e:
-                    logger.error(f"Error processing trade: {str(e)}, ", exc_info=True)
-                    if trade:
-                        self.trade_orders.task_done()
-
-    async def start_processors(self, ws_manager, notification_service):
+        await self._acquire_capacity(1)
+        self._enqueue(trade_order)
+
+    async def submit_order(self, trader_id: str, ticker: str, quantity: int, price: float, trade_type: Literal["buy", "sell"]) -> StockTrade:
+        trader = Trader(trader_id=trader_id)
+        stock = Stock(ticker=ticker, price=price)
+        trade = trader.make_trade_order(stock, quantity, trade_type)
+        await self.add_trade_order(trade)
+        return trade
+
+    async def submit_many(self, trader_id: str, orders: List[dict]) -> List[StockTrade]:
+        """
+        Submits a basket of orders as one unit. Every order is validated and capacity for the
+        whole basket is reserved before any of them starts; the orders then share one simulated
+        latency so they fill on the same tick and settle in grouped transactions.
+            :param trader_id: Trader placing the orders
+            :param orders: Dictionaries with ticker, quantity, price and trade_type
+            :return: The trades, in the order they were given
+        """
+        trader = Trader(trader_id=trader_id)
+        trades = []
+        for i, order in enumerate(orders):
+            try:
+                stock = Stock(ticker=order["ticker"], price=order["price"])
+                trades.append(trader.make_trade_order(stock, order["quantity"], order["trade_type"]))
+            except ValueError as e:
+                raise ValueError(f"Order {i}: {str(e)}")
+        await self._acquire_capacity(len(trades))
+        for trade in trades:
+            trade.latency = trades[0].latency
+            self._enqueue(trade)
+        return trades
+
+    async def publish_progress(self, trades: List[StockTrade]):
+        """
+        Queues each trade's progress for its owner, plus any admin subscribed to the
+        trade or trader topic. Other traders never see it. The aggregator sends every
+        connection one batched frame per flush.
+        """
+        for trade in trades:
+            progress = trade.get_progress() * 100
+            message = {
+                "event": "trade_progress",
+                "trade_id": trade.id,
+                "trader_id":trade.trader_id,
+                "ticker": trade.stock.ticker,
+                "quantity": trade.quantity,
+                "progress": round(progress, 2),
+                "status": trade.status,
+            }
+            recipients = self.ws_manager.recipients(
+                [f"trade:{trade.id}", f"trader:{trade.trader_id}"], exclude=trade.trader_id
+            )
+            recipients.add(trade.trader_id)
+            self.progress.add(message, recipients)
+
+    async def route_fill(self, trade: StockTrade):
+        shard_id = self.shard_for(trade.trader_id)
+        shard = self.shards[shard_id]
+        shard.put_nowait(trade)
+        stats = self.shard_stats[shard_id]
+        stats["max_depth"] = max(stats["max_depth"], shard.qsize())
+
+    def _drain_shard(self, shard: asyncio.Queue, batch: List[StockTrade]):
+        while len(batch) < self.settle_batch_size and not shard.empty():
+            batch.append(shard.get_nowait())
+
+    async def next_batch(self, shard: asyncio.Queue) -> List[StockTrade]:
+        """
+        Waits for a fill, then gives other fills up to settle_window seconds to join it
+            :param shard: Settlement queue to read from
+        """
+        batch = [await shard.get()]
+        self._drain_shard(shard, batch)
+        if len(batch) < self.settle_batch_size and self.settle_window > 0:
+            await asyncio.sleep(self.settle_window)
+            self._drain_shard(shard, batch)
+        return batch
+
+    async def process_trade(self, processor_id):
+        ws_manager = self.ws_manager
+        notification_service = self.notification_service
+        shard = self.shards[processor_id]
+        stats = self.shard_stats[processor_id]
+        while True:
+            batch = await self.next_batch(shard)
+            settled_ids = set()
+            errors: Dict[str, str] = {}
+            accepted = []
+            try:
+                fills = [
+                    {
+                        "trader_id": trade.trader_id,
+                        "trade_type": trade.trade_type,
+                        "quantity": trade.quantity,
+                        "symbol": trade.stock.ticker,
+                        "price": trade.stock.price,
+                    }
+                    for trade in batch
+                ]
+                async with self.sessionmaker() as session:
+                    results = await settle_trades(fills, session, ledger=self.ledger)
+                stats["batches"] += 1
+                for trade, fill, result in zip(batch, fills, results):
+                    if result["error"]:
+                        stats["failed"] += 1
+                        errors[trade.id] = result["error"]
+                        logger.warning(f"Trade {trade.id} for trader {trade.trader_id} rejected: {result['error']}")
+                        continue
+                    stats["processed"] += 1
+                    settled_ids.add(trade.id)
+                    accepted.append((trade, fill, result))
+            except Exception as e:
+                stats["failed"] += len(batch)
+                logger.error(f"Error processing trade batch: {str(e)}, ", exc_info=True)
+            # Settlement has committed: a failure from here on must not report the trades as failed
+            try:
+                settled = []
+                for trade, fill, result in accepted:
+                    self.progress.discard(trade.id)
+                    try:
+                        await notification_service.send_notification(result["trader"], trade, ws_manager)
+                    except Exception as e:
+                        logger.error(f"Error notifying settlement of trade {trade.id}: {str(e)}", exc_info=True)
+                    if result["trader"] is not None:
+                        settled.append({**fill, "cash_balance": result["trader"].cash_balance})
+                if self.valuator is not None and settled:
+                    try:
+                        await self.valuator.record_fills(settled)
+                    except Exception as e:
+                        logger.error(f"Error valuing settled fills: {str(e)}", exc_info=True)
+            finally:
+                for trade in batch:
+                    # Every outcome ends tracking, so rejected and errored trades don't pile up in the aggregator
+                    self.progress.discard(trade.id)
+                    if trade.id not in settled_ids:
+                        await self.notify_failure(trade, errors.get(trade.id, "Trade could not be settled"))
+                    self._release(trade.trader_id)
+                    shard.task_done()
+
+    async def notify_failure(self, trade: StockTrade, error: str):
+        """Sends the owner a final trade_failed event in place of the completion event"""
+        trade.status = "failed"
+        try:
+            await self.ws_manager.notify(trade.trader_id, {
+                "event": "trade_failed",
+                "trade_id": trade.id,
+                "trader_id": trade.trader_id,
+                "ticker": trade.stock.ticker,
+                "quantity": trade.quantity,
+                "status": "failed",
+                "error": error,
+            }, guaranteed=True)
+        except Exception as e:
+            logger.error(f"Error sending failure of trade {trade.id}: {str(e)}")
+
+    def _release(self, trader_id: str):
+        self.pending_by_trader[trader_id] -= 1
+        if self.pending_by_trader[trader_id] <= 0:
+            del self.pending_by_trader[trader_id]
+        self.capacity.release()
+        if not self.pending_by_trader:
+            self.idle.set()
+
+    def get_stats(self, top_n: int = 5) -> dict:
+        """
+        Returns queue depth and throughput per shard along with the traders that have the most pending orders
+            :param top_n: Number of hottest traders to report per shard
+        """
+        shards = []
+        for shard_id, shard in enumerate(self.shards):
+            hot_traders = [
+                {"trader_id": trader_id, "pending": pending}
+                for trader_id, pending in self.pending_by_trader.most_common()
+                if self.shard_for(trader_id) == shard_id
+            ][:top_n]
+            shards.append({
+                "shard": shard_id,
+                "depth": shard.qsize(),
+                **self.shard_stats[shard_id],
+                "hot_traders": hot_traders,
+            })
+        return {
+            "num_shards": self.num_processors,
+            "in_flight": len(self.scheduler),
+            "pending": sum(self.pending_by_trader.values()),
+            "progress": self.progress.get_stats(),
+            "shards": shards,
+        }
+
+    async def start(self, ws_manager: WebsocketManager, notification_service: NotificationService,
+                    valuator: PortfolioValuator | None = None):
+        self.ws_manager = ws_manager
+        self.notification_service = notification_service
+        self.valuator = valuator
+        self.shutdown_flag = False
         for i in range(self.num_processors):
             trade_execution_task = asyncio.create_task(
-                self.process_trade(i, ws_manager, notification_service)
+                self.process_trade(i)
             )
             self.processors.append(trade_execution_task)
+        self.scheduler.start()
+        self.progress.start(ws_manager)
+        logger.info(f"Trade system started with {self.num_processors} shards")
 
     async def process_all_orders(self):
-        await self.trade_orders.join()
+        await self.idle.wait()
 
-    async def shutdown(self):
+    async def shutdown(self, drain_timeout: float = 10.0):
+        """
+        Stops accepting orders, waits for in-flight orders to fill and settle and cancels the workers
+            :param drain_timeout: Seconds to wait for pending orders before cancelling
+        """
         self.shutdown_flag = True
-        print("Shutting down...")
-        if self.processors:
-            await asyncio.sleep(1.0)
-            for trade_execution_task in self.processors:
-                trade_execution_task.cancel()
-            await asyncio.gather(*self.processors, return_exceptions=True)
-            self.processors = []
-        print("All trade processors shut down successfully")
-
-    async def run(self, trader_id: str, ticker: str, quantity: int, price: int, trade_type: Literal["buy", "sell"],ws_manager: WebsocketManager, notification_service: NotificationService):
+        logger.info("Shutting down trade system...")
         try:
-            trader = Trader(trader_id=trader_id)
-            stock = Stock(ticker=ticker, price=price)
-            trade = trader.make_trade_order(stock, quantity, trade_type)
-            await self.start_processors(ws_manager=ws_manager, notification_service=notification_service)
-            await self.add_trade_order(trade)
-            await self.process_all_orders()
-        except Exception as e:
-            print("An error ocurred in trade system", str(e))
-        finally:
-            await self.shutdown()
+            await asyncio.wait_for(self.process_all_orders(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            dropped = sum(self.pending_by_trader.values())
+            logger.warning(f"Trade system not drained after {drain_timeout}s, {dropped} orders dropped")
+        await self.scheduler.stop()
+        await self.progress.stop()
+        for trade_execution_task in self.processors:
+            trade_execution_task.cancel()
+        await asyncio.gather(*self.processors, return_exceptions=True)
+        self.processors = []
+        logger.info("All trade processors shut down successfully")
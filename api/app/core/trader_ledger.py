@@ -0,0 +1,153 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable
+from app.utils.logger import logger
+
+
+class LedgerEntry:
+    __slots__ = ("trader_id", "cash_balance", "holdings", "stamp", "version", "last_used")
+
+    def __init__(self, trader_id: str, cash_balance: float, holdings: Dict[str, dict], stamp: datetime | None, version: int):
+        self.trader_id = trader_id
+        self.cash_balance = cash_balance
+        self.holdings = holdings
+        self.stamp = stamp
+        self.version = version
+        self.last_used = time.monotonic()
+
+    def positions(self) -> Dict[str, float]:
+        return {symbol: holding["quantity"] for symbol, holding in self.holdings.items()}
+
+
+class TraderLedger:
+    def __init__(self, max_traders: int = 10000, idle_ttl: float = 900.0):
+        """
+        Process-local copy of active traders' cash and positions, written through on every
+        settlement. Each entry remembers the trader row's updated_at it was built from;
+        callers pass the value they just read (under lock) and any mismatch means another
+        writer got there first, so the entry is rebuilt from the database. Rebuilding an
+        entry whose row hasn't changed compares the two and counts any divergence.
+
+        :param max_traders: Maximum number of cached traders, least recently used evicted first
+        :param idle_ttl: Seconds an entry may go unused before it is evicted
+        """
+        self.max_traders = max_traders
+        self.idle_ttl = idle_ttl
+        self._entries: OrderedDict[str, LedgerEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.idle = 0
+        self.evicted = 0
+        self.divergences = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, trader_id: str, stamp: datetime | None) -> LedgerEntry | None:
+        """
+        Returns the cached entry if it is still current
+
+        :param trader_id: Trader to look up
+        :param stamp: updated_at of the trader row as just read from the database
+        :return: The entry, or None on a miss, an idle entry or a stale entry
+        """
+        entry = self._entries.get(trader_id)
+        if entry is not None:
+            now = time.monotonic()
+            if now - entry.last_used > self.idle_ttl:
+                self.idle += 1
+            elif entry.stamp != stamp:
+                self.stale += 1
+            else:
+                entry.last_used = now
+                self._entries.move_to_end(trader_id)
+                self.hits += 1
+                return entry
+        # Idle and stale entries stay until the caller reloads, so load() can reconcile them
+        self.misses += 1
+        return None
+
+    def peek(self, trader_id: str) -> LedgerEntry | None:
+        return self._entries.get(trader_id)
+
+    def load(self, trader_id: str, cash_balance: float, stamp: datetime | None, holdings: Iterable) -> LedgerEntry:
+        """
+        Caches a trader as just read from the database, reconciling it with any entry
+        built from the same row version
+
+        :param trader_id: Trader the rows belong to
+        :param cash_balance: Cash balance from the trader row
+        :param stamp: updated_at from the trader row
+        :param holdings: All of the trader's holdings, with symbol, id, quantity and initial_purchase_date
+        :return: The new entry
+        """
+        cached = {
+            holding.symbol: {"id": holding.id, "quantity": holding.quantity, "initial_purchase_date": holding.initial_purchase_date}
+            for holding in holdings
+        }
+        previous = self._entries.pop(trader_id, None)
+        if previous is not None and previous.stamp == stamp and (
+            previous.cash_balance != cash_balance or previous.positions() != {s: h["quantity"] for s, h in cached.items()}
+        ):
+            self.divergences += 1
+            logger.warning(f"Ledger for trader {trader_id} diverged from the database, reloaded")
+        entry = LedgerEntry(trader_id, cash_balance, cached, stamp, previous.version + 1 if previous else 1)
+        self._entries[trader_id] = entry
+        self._evict(entry.last_used)
+        return entry
+
+    def _evict(self, now: float):
+        # Entries are kept in recency order, so the oldest is always first
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if len(self._entries) <= self.max_traders and now - oldest.last_used <= self.idle_ttl:
+                break
+            del self._entries[oldest.trader_id]
+            self.evicted += 1
+
+    def write(self, trader_id: str, cash_balance: float, stamp: datetime, holdings: Dict[str, dict | None]):
+        """
+        Applies a committed settlement to a cached trader
+
+        :param trader_id: Trader that was settled
+        :param cash_balance: Cash balance written to the database
+        :param stamp: updated_at written to the database
+        :param holdings: Changed holdings by symbol, None for closed positions
+        """
+        entry = self._entries.get(trader_id)
+        if entry is None:
+            return
+        entry.cash_balance = cash_balance
+        entry.stamp = stamp
+        for symbol, holding in holdings.items():
+            if holding is None:
+                entry.holdings.pop(symbol, None)
+            else:
+                entry.holdings[symbol] = holding
+        entry.version += 1
+
+    def invalidate(self, trader_id: str):
+        self._entries.pop(trader_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "traders": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "idle": self.idle,
+            "evicted": self.evicted,
+            "divergences": self.divergences,
+        }
+
+
+trader_ledger = TraderLedger(
+    max_traders=int(os.getenv("LEDGER_MAX_TRADERS", "10000")),
+    idle_ttl=float(os.getenv("LEDGER_IDLE_TTL", "900")),
+)
@@ -1,43 +1,410 @@
 import asyncio
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, Iterable, Set
 from fastapi import WebSocket
 from app.utils.logger import logger
+from app.utils.json_utils import dumps
+from app.core.event_bus import EventBus, PEER_LEFT
+
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+
+def default_coalesce_key(message: Any) -> Hashable:
+    """Messages with the same key supersede each other, e.g. progress updates for one trade."""
+    if isinstance(message, dict):
+        return (message.get("event"), message.get("trade_id"))
+    return type(message).__name__
+
+
+class ClientConnection:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        trader_id: str,
+        max_queue_size: int,
+        overflow_policy: str,
+        send_timeout: float,
+        coalesce_key: Callable[[Any], Hashable],
+        on_close: Callable[["ClientConnection"], None],
+    ):
+        """
+        One websocket with its own bounded outbound queue and writer task, so a slow
+        client only ever delays its own messages.
+        """
+        self.websocket = websocket
+        self.trader_id = trader_id
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.send_timeout = send_timeout
+        self.coalesce_key = coalesce_key
+        self.on_close = on_close
+        self.pending: deque = deque()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+        self._closer: asyncio.Task | None = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self.write_loop())
+
+    def enqueue(self, message, payload: str, guaranteed: bool = False) -> bool:
+        """
+        Queues a message and its encoded payload for the writer task. Guaranteed messages bypass the overflow policy:
+        they are never dropped or coalesced away, even if that takes the queue past its bound.
+        """
+        if self.closed:
+            return False
+        if len(self.pending) >= self.max_queue_size and not guaranteed:
+            if self.overflow_policy == "disconnect":
+                logger.warning(f"Send queue full for trader {self.trader_id}, disconnecting slow client")
+                self.close()
+                return False
+            if self.overflow_policy == "coalesce":
+                key = self.coalesce_key(message)
+                for i, (queued, _, queued_guaranteed) in enumerate(self.pending):
+                    if not queued_guaranteed and self.coalesce_key(queued) == key:
+                        self.pending[i] = (message, payload, False)
+                        self.coalesced += 1
+                        return True
+            self.dropped += 1
+            for i, (_, _, queued_guaranteed) in enumerate(self.pending):
+                if not queued_guaranteed:
+                    del self.pending[i]
+                    break
+            else:
+                return False  # Queue holds only guaranteed messages, drop the new one
+        self.pending.append((message, payload, guaranteed))
+        self._ready.set()
+        return True
+
+    async def write_loop(self):
+        try:
+            while True:
+                while not self.pending:
+                    self._ready.clear()
+                    await self._ready.wait()
+                _, payload, _ = self.pending.popleft()
+                await asyncio.wait_for(self.websocket.send_text(payload), timeout=self.send_timeout)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"WebSocket connection closed for trader {self.trader_id}: {str(e)}")
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.pending.clear()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        # Held here so the close isn't garbage collected before it runs; see wait_closed
+        self._closer = asyncio.create_task(self._close_socket())
+        self.on_close(self)
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+
+    async def wait_closed(self):
+        """Waits for the writer task to stop and the socket close to finish after close()"""
+        current = asyncio.current_task()
+        tasks = [task for task in (self._writer, self._closer) if task is not None and task is not current]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 class WebsocketManager:
-    def __init__(self):
-        self.clients = {}
-        self.lock = asyncio.Lock()
+    def __init__(
+        self,
+        max_queue_size: int = 100,
+        overflow_policy: str = "drop_oldest",
+        send_timeout: float = 5.0,
+        coalesce_key: Callable[[Any], Hashable] = default_coalesce_key,
+    ):
+        """
+        Tracks one websocket per trader. Sends never block the caller: messages are put on the
+        connection's bounded queue and written by its own task. Each message is serialized once,
+        however many connections it goes to. Besides direct delivery to a
+        trader, connections can subscribe to topics (e.g. 'trade:<id>', 'trader:<id>') and
+        receive everything published to them.
+
+        :param max_queue_size: Outbound messages buffered per connection
+        :param overflow_policy: What to do when a queue is full: 'drop_oldest', 'coalesce'
+            (replace the queued message with the same coalesce key, else drop oldest) or 'disconnect'
+        :param send_timeout: Seconds a single send may take before the client is dropped
+        :param coalesce_key: Function mapping a message to its coalescing key
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow_policy}, expected one of {OVERFLOW_POLICIES}")
+        self.clients: Dict[str, ClientConnection] = {}
+        self.topics: Dict[str, Set[str]] = {}
+        self.subscriptions: Dict[str, Set[str]] = {}
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.send_timeout = send_timeout
+        self.coalesce_key = coalesce_key
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = 0
+        # Closed connections whose writer or socket close may still be running
+        self.closing: Set[ClientConnection] = set()
+
+    def _remove(self, connection: ClientConnection):
+        self.closing.add(connection)
+        connection._closer.add_done_callback(lambda _: self.closing.discard(connection))
+        self.sent += connection.sent
+        self.dropped += connection.dropped
+        self.coalesced += connection.coalesced
+        self.closed += 1
+        if self.clients.get(connection.trader_id) is connection:
+            del self.clients[connection.trader_id]
+            self.unsubscribe(connection.trader_id)
 
     async def connect(self, websocket: WebSocket, trader_id:str):
         await websocket.accept()
-        async with self.lock:
-            self.clients[trader_id]=websocket
+        previous = self.clients.get(trader_id)
+        if previous is not None:
+            previous.close()
+        connection = ClientConnection(
+            websocket=websocket,
+            trader_id=trader_id,
+            max_queue_size=self.max_queue_size,
+            overflow_policy=self.overflow_policy,
+            send_timeout=self.send_timeout,
+            coalesce_key=self.coalesce_key,
+            on_close=self._remove,
+        )
+        self.clients[trader_id] = connection
+        connection.start()
 
-    async def disconnect(self,trader_id:str):
-        async with self.lock:
-            self.clients.pop(trader_id, None)
+    async def disconnect(self, trader_id:str, websocket: WebSocket | None = None) -> bool:
+        """
+        Closes the trader's connection. When a websocket is given, only that socket is closed,
+        so a stale handler can't drop the connection that replaced it.
+        """
+        connection = self.clients.get(trader_id)
+        if connection is None or (websocket is not None and connection.websocket is not websocket):
+            return False
+        connection.close()
+        await connection.wait_closed()
+        return True
 
-    async def notify(self, trader_id, message):
-        async with self.lock:
-            ws=self.clients.get(trader_id)
-            if not ws:
-                return False
-            try:
-                await ws.send_json(message)
-                return True
-            except RuntimeError as e:
-                if "close" in str(e):
-                    logger.warning(f"WebSocket connection closed for trader {trader_id}: {str(e)}")
-                    self.clients.pop(trader_id, None)
-                    return False
-            except Exception as e:
-                logger.error(f"Error sending message to trader {trader_id}: {str(e)}")
-                return False
-                
+    async def close_all(self):
+        """Closes every connection and waits for their tasks to finish"""
+        for connection in list(self.clients.values()):
+            connection.close()
+        await asyncio.gather(*(connection.wait_closed() for connection in list(self.closing)))
 
+    async def notify(self, trader_id, message, guaranteed: bool = False, payload: str | None = None) -> bool:
+        """
+        Queues a message for one trader
+
+        :param trader_id: Recipient
+        :param message: JSON-serializable message
+        :param guaranteed: Never drop or coalesce this message
+        :param payload: Message already encoded by the caller, skips serialization
+        :return: False if the trader has no open connection
+        """
+        connection = self.clients.get(trader_id)
+        if connection is None:
+            return False
+        return connection.enqueue(message, payload if payload is not None else dumps(message), guaranteed)
 
     def has_active_connection(self, trader_id: str) -> bool:
         return trader_id in self.clients
 
+    def subscribe(self, trader_id: str, topics: Iterable[str]):
+        """
+        Subscribes the trader's connection to extra topics on top of its own messages
+
+        :param trader_id: Unique identifier of the subscribing connection
+        :param topics: Topic names, e.g. ['trade:<trade_id>', 'trader:<trader_id>']
+        """
+        if trader_id not in self.clients:
+            return
+        for topic in topics:
+            self.topics.setdefault(topic, set()).add(trader_id)
+            self.subscriptions.setdefault(trader_id, set()).add(topic)
+
+    def unsubscribe(self, trader_id: str, topics: Iterable[str] | None = None):
+        subscribed = self.subscriptions.get(trader_id)
+        if not subscribed:
+            return
+        for topic in list(subscribed if topics is None else topics):
+            subscribed.discard(topic)
+            subscribers = self.topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(trader_id)
+                if not subscribers:
+                    del self.topics[topic]
+        if not subscribed:
+            del self.subscriptions[trader_id]
+
+    def recipients(self, topics: Iterable[str], exclude: str | None = None) -> Set[str]:
+        """
+        Returns the connected traders subscribed to any of the topics
+
+        :param topics: Topics a message belongs to
+        :param exclude: Trader that already receives the message directly
+        """
+        recipients = set()
+        if self.topics:
+            for topic in topics:
+                recipients.update(self.topics.get(topic, ()))
+            recipients.discard(exclude)
+        return recipients
+
+    async def publish(self, topics: Iterable[str], message, exclude: str | None = None) -> int:
+        """
+        Queues the message once for every connection subscribed to any of the topics
+
+        :param topics: Topics the message belongs to
+        :param message: JSON-serialisable message
+        :param exclude: Trader that already received the message directly
+        :return: Number of connections the message was queued for
+        """
+        recipients = self.recipients(topics, exclude)
+        if not recipients:
+            return 0
+        payload = dumps(message)
+        delivered = 0
+        for trader_id in recipients:
+            connection = self.clients.get(trader_id)
+            if connection is not None and connection.enqueue(message, payload):
+                delivered += 1
+        return delivered
+
     async def broadcast(self, message):
-        async with self.lock:
-            for ws in self.clients.values():
-                await ws.send_json(message)
\ No newline at end of file
+        if not self.clients:
+            return
+        payload = dumps(message)
+        for connection in list(self.clients.values()):
+            connection.enqueue(message, payload)
+
+    def get_stats(self) -> dict:
+        live = list(self.clients.values())
+        return {
+            "connections": len(live),
+            "topics": len(self.topics),
+            "sent": self.sent + sum(connection.sent for connection in live),
+            "queued": sum(len(connection.pending) for connection in live),
+            "dropped": self.dropped + sum(connection.dropped for connection in live),
+            "coalesced": self.coalesced + sum(connection.coalesced for connection in live),
+            "closed": self.closed,
+        }
+
+
+class WebsocketRelay:
+    def __init__(self, ws_manager: WebsocketManager, bus: EventBus, channel: str):
+        """
+        Front for a WebsocketManager when several worker processes share an event bus.
+        Messages for traders connected to this process are queued directly; messages for
+        traders connected to another worker are published on the bus and delivered there.
+        Workers announce which traders they hold, so notify() still returns False when
+        the trader isn't connected anywhere. Topic subscriptions stay per process.
+
+        :param ws_manager: Manager holding this process's connections
+        :param bus: Event bus shared with the other workers
+        :param channel: Bus channel for this manager's messages
+        """
+        self.ws_manager = ws_manager
+        self.bus = bus
+        self.channel = channel
+        self.presence_channel = f"{channel}.presence"
+        self.remote: Dict[str, int] = {}
+        self.relayed = 0
+        self.received = 0
+        bus.subscribe(channel, self._on_message)
+        bus.subscribe(self.presence_channel, self._on_presence)
+        bus.subscribe(PEER_LEFT, self._on_peer_left)
+        bus.on_connect(self._on_bus_connect)
+
+    async def _announce(self, op: str, trader_ids):
+        if self.bus.distributed:
+            await self.bus.publish(self.presence_channel, {"op": op, "traders": list(trader_ids)})
+
+    async def _on_bus_connect(self):
+        self.remote.clear()
+        await self._announce("sync", [])
+        await self._announce("online", self.ws_manager.clients)
+
+    async def _on_presence(self, event: dict, origin: int | None):
+        op = event["op"]
+        if op == "sync":
+            await self._announce("online", self.ws_manager.clients)
+        elif op == "online":
+            for trader_id in event["traders"]:
+                self.remote[trader_id] = origin
+        elif op == "offline":
+            for trader_id in event["traders"]:
+                if self.remote.get(trader_id) == origin:
+                    del self.remote[trader_id]
+
+    async def _on_peer_left(self, event: dict, origin: int | None):
+        peer = event["peer"]
+        self.remote = {trader_id: owner for trader_id, owner in self.remote.items() if owner != peer}
+
+    async def _on_message(self, event: dict, origin: int | None):
+        self.received += 1
+        if event["trader_id"] is None:
+            await self.ws_manager.broadcast(event["message"])
+        else:
+            await self.ws_manager.notify(event["trader_id"], event["message"], event["guaranteed"])
+
+    async def connect(self, websocket: WebSocket, trader_id: str):
+        await self.ws_manager.connect(websocket, trader_id)
+        await self._announce("online", [trader_id])
+
+    async def disconnect(self, trader_id: str, websocket: WebSocket | None = None) -> bool:
+        removed = await self.ws_manager.disconnect(trader_id, websocket)
+        # The manager may already have dropped a slow client, announce whenever the trader is gone
+        if not self.ws_manager.has_active_connection(trader_id):
+            await self._announce("offline", [trader_id])
+        return removed
+
+    async def close_all(self):
+        trader_ids = list(self.ws_manager.clients)
+        await self.ws_manager.close_all()
+        if trader_ids:
+            await self._announce("offline", trader_ids)
+
+    async def notify(self, trader_id, message, guaranteed: bool = False, payload: str | None = None) -> bool:
+        if self.ws_manager.has_active_connection(trader_id):
+            return await self.ws_manager.notify(trader_id, message, guaranteed, payload)
+        if trader_id not in self.remote:
+            return False
+        await self.bus.publish(self.channel, {"trader_id": trader_id, "message": message, "guaranteed": guaranteed})
+        self.relayed += 1
+        return True
+
+    async def broadcast(self, message):
+        await self.ws_manager.broadcast(message)
+        if self.bus.distributed:
+            await self.bus.publish(self.channel, {"trader_id": None, "message": message, "guaranteed": False})
+
+    def has_active_connection(self, trader_id: str) -> bool:
+        return self.ws_manager.has_active_connection(trader_id) or trader_id in self.remote
+
+    def subscribe(self, trader_id: str, topics: Iterable[str]):
+        self.ws_manager.subscribe(trader_id, topics)
+
+    def recipients(self, topics: Iterable[str], exclude: str | None = None) -> Set[str]:
+        return self.ws_manager.recipients(topics, exclude)
+
+    async def publish(self, topics: Iterable[str], message, exclude: str | None = None) -> int:
+        return await self.ws_manager.publish(topics, message, exclude)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.ws_manager.get_stats(),
+            "remote_traders": len(self.remote),
+            "relayed": self.relayed,
+            "received": self.received,
+        }
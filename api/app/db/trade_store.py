@@ -0,0 +1,234 @@
+import base64
+import binascii
+import csv
+import io
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Literal
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.tables import Trade, Holding
+from app.core.price_provider import price_provider
+from app.utils.json_utils import dumps_bytes, loads
+from app.utils.logger import logger
+
+MAX_PAGE_SIZE = 500
+EXPORT_CHUNK_SIZE = 5000
+TRADE_COLUMNS = (Trade.id, Trade.symbol, Trade.quantity, Trade.price, Trade.trade_type, Trade.trade_date)
+
+
+def encode_cursor(*values) -> str:
+    """Packs the sort key of the last row on a page into an opaque cursor"""
+    return base64.urlsafe_b64encode(dumps_bytes(list(values))).decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """
+    Unpacks a cursor produced by encode_cursor
+
+    :param cursor: Cursor from a previous page
+    :param size: Number of values the cursor must hold
+    :return: The sort key values
+    """
+    try:
+        values = loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def trades_query(
+    trader_id: str,
+    symbol: str | None = None,
+    trade_type: Literal["buy", "sell"] | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+):
+    """Selects a trader's trades, newest first, with the optional filters as WHERE clauses"""
+    query = (
+        select(*TRADE_COLUMNS)
+        .where(Trade.trader_id == trader_id)
+        .order_by(Trade.trade_date.desc(), Trade.id.desc())
+    )
+    if symbol:
+        # Symbols are upper-cased on write, so the stored column is compared as is and stays indexable
+        query = query.where(Trade.symbol == symbol.upper())
+    if trade_type:
+        query = query.where(Trade.trade_type == trade_type)
+    if start:
+        query = query.where(Trade.trade_date >= start)
+    if end:
+        query = query.where(Trade.trade_date < end)
+    return query
+
+
+async def get_trades(
+    trader_id: str,
+    session: AsyncSession,
+    cursor: str | None = None,
+    limit: int = 50,
+    symbol: str | None = None,
+    trade_type: Literal["buy", "sell"] | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> dict:
+    """
+    Returns one page of a trader's trades, newest first.
+    Pages are keyed on (trade_date, id) rather than an offset, so every page is a bounded
+    range scan of ix_trades_trader_id_trade_date_id (or the symbol index when filtering by
+    symbol) no matter how deep into the history it is.
+
+    :param trader_id: Trader whose trades are listed
+    :param session: Database session
+    :param cursor: next_cursor from the previous page, None for the first page
+    :param limit: Page size, at most MAX_PAGE_SIZE
+    :param symbol: Only trades in this symbol
+    :param trade_type: Only buys or only sells
+    :param start: Only trades at or after this time
+    :param end: Only trades before this time
+    :return: Dictionary with the trades and the cursor of the next page (None on the last page)
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = trades_query(trader_id, symbol, trade_type, start, end).limit(limit + 1)
+    if cursor:
+        trade_date, trade_id = decode_cursor(cursor, 2)
+        try:
+            trade_date, trade_id = datetime.fromisoformat(trade_date), uuid.UUID(trade_id)
+        except (TypeError, ValueError, AttributeError):
+            raise ValueError("Invalid cursor")
+        query = query.where(tuple_(Trade.trade_date, Trade.id) < (trade_date, trade_id))
+    rows = (await session.execute(query)).all()
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].trade_date, str(page[-1].id)) if len(rows) > limit else None
+    return {
+        "trades": [
+            {
+                "id": str(row.id),
+                "symbol": row.symbol,
+                "quantity": row.quantity,
+                "price": row.price,
+                "trade_type": row.trade_type,
+                "trade_date": row.trade_date.isoformat() if row.trade_date else None,
+            }
+            for row in page
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+async def get_portfolio(trader_id: str, session: AsyncSession, cursor: str | None = None, limit: int = 50) -> dict:
+    """
+    Returns one page of a trader's holdings in symbol order, valued at the latest quotes.
+    Pages are keyed on symbol over the unique (trader_id, symbol) index. Holdings without a
+    price are still listed, with current_price and current_value set to None.
+
+    :param trader_id: Trader whose holdings are listed
+    :param session: Database session
+    :param cursor: next_cursor from the previous page, None for the first page
+    :param limit: Page size, at most MAX_PAGE_SIZE
+    :return: Dictionary with the holdings, the value of the page and the cursor of the next page
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = (
+        select(Holding.id, Holding.symbol, Holding.quantity, Holding.initial_purchase_date)
+        .where(Holding.trader_id == trader_id)
+        .order_by(Holding.symbol)
+        .limit(limit + 1)
+    )
+    if cursor:
+        (after_symbol,) = decode_cursor(cursor, 1)
+        query = query.where(Holding.symbol > after_symbol)
+    rows = (await session.execute(query)).all()
+    page = rows[:limit]
+    symbols = [row.symbol for row in page]
+    try:
+        quotes = await price_provider.get_quotes(symbols) if symbols else {}
+    except Exception as e:
+        logger.error(f"Error fetching prices for {symbols}: {e}")
+        quotes = {}
+    holdings = []
+    page_value = 0.0
+    for row in page:
+        current_price = (quotes.get(row.symbol) or {}).get("price")
+        current_value = row.quantity * current_price if current_price is not None else None
+        page_value += current_value or 0.0
+        holdings.append({
+            "id": str(row.id),
+            "symbol": row.symbol,
+            "quantity": row.quantity,
+            "purchase_date": row.initial_purchase_date.isoformat() if row.initial_purchase_date else None,
+            "current_price": current_price,
+            "current_value": current_value,
+        })
+    return {
+        "holdings": holdings,
+        "page_value": page_value,
+        "next_cursor": encode_cursor(page[-1].symbol) if len(rows) > limit else None,
+    }
+
+
+def encode_ndjson(rows) -> bytes:
+    return b"".join(
+        dumps_bytes({
+            "id": row.id,
+            "symbol": row.symbol,
+            "quantity": row.quantity,
+            "price": row.price,
+            "trade_type": row.trade_type,
+            "trade_date": row.trade_date,
+        }) + b"\n"
+        for row in rows
+    )
+
+
+def encode_csv(rows, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow([column.key for column in TRADE_COLUMNS])
+    writer.writerows(
+        (row.id, row.symbol, row.quantity, row.price, row.trade_type,
+         row.trade_date.isoformat() if row.trade_date else None)
+        for row in rows
+    )
+    return buffer.getvalue().encode()
+
+
+async def stream_trades(
+    trader_id: str,
+    sessionmaker,
+    export_format: Literal["ndjson", "csv"] = "ndjson",
+    symbol: str | None = None,
+    trade_type: Literal["buy", "sell"] | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[bytes]:
+    """
+    Streams a trader's full trade history, newest first.
+    Rows come from a server-side cursor chunk_size at a time and each chunk is encoded and
+    yielded before the next is fetched, so memory stays bounded by one chunk and a slow
+    client holds the cursor back instead of rows piling up. The generator opens its own
+    session because request-scoped sessions are closed before a streamed body is sent.
+
+    :param trader_id: Trader whose trades are exported
+    :param sessionmaker: Async session factory
+    :param export_format: 'ndjson' for one JSON object per line or 'csv' with a header row
+    :param symbol: Only trades in this symbol
+    :param trade_type: Only buys or only sells
+    :param start: Only trades at or after this time
+    :param end: Only trades before this time
+    :param chunk_size: Rows fetched from the cursor and written per chunk
+    :return: Async iterator of encoded chunks
+    """
+    if export_format == "csv":
+        yield encode_csv([], header=True)
+    async with sessionmaker() as session:
+        result = await session.stream(
+            trades_query(trader_id, symbol, trade_type, start, end),
+            execution_options={"yield_per": chunk_size},
+        )
+        async for rows in result.partitions():
+            yield encode_csv(rows) if export_format == "csv" else encode_ndjson(rows)
@@ -1,85 +1,410 @@
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, delete, tuple_, values, column, text, inspect, String, Float, DateTime, CheckConstraint
+from sqlalchemy.schema import AddConstraint
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.tables import Trader, Holding, Trade
-import math
 from datetime import datetime, timezone
+from types import SimpleNamespace
 from app.utils.logger import logger
-from typing import Literal
-import yfinance as yf
+from typing import Literal, List, Dict, Tuple
+import numpy as np
+from app.core.price_provider import price_provider
+from app.core.trader_ledger import TraderLedger
 async def get_trader_by_id(trader_id: str, session: AsyncSession) -> Trader | None:
     result = await session.execute(select(Trader).where(Trader.id == trader_id))
     trader = result.scalar_one_or_none()
     if not trader:
         raise ValueError(f"Trader with ID {trader_id} not found")
     return trader
+def upsert_holdings_statement(rows: List[dict], increment: bool):
+    """
+    Builds a single INSERT ... ON CONFLICT (trader_id, symbol) statement for holdings.
+
+    :param rows: Dicts with trader_id, symbol, quantity, updated_at and initial_purchase_date
+    :param increment: Add the quantity to an existing holding instead of overwriting it
+    :return: Executable upsert statement
+    """
+    statement = pg_insert(Holding).values(rows)
+    quantity = Holding.quantity + statement.excluded.quantity if increment else statement.excluded.quantity
+    return statement.on_conflict_do_update(
+        index_elements=[Holding.trader_id, Holding.symbol],
+        set_={"quantity": quantity, "updated_at": statement.excluded.updated_at},
+    )
+
+MERGE_DUPLICATE_HOLDINGS = text("""
+    WITH merged AS (
+        SELECT trader_id, symbol,
+               (array_agg(id ORDER BY initial_purchase_date NULLS LAST, id))[1] AS keep_id,
+               sum(quantity) AS quantity,
+               max(updated_at) AS updated_at,
+               min(initial_purchase_date) AS initial_purchase_date
+        FROM holdings
+        WHERE trader_id IS NOT NULL
+        GROUP BY trader_id, symbol
+        HAVING count(*) > 1
+    ), kept AS (
+        UPDATE holdings SET quantity = merged.quantity, updated_at = merged.updated_at,
+                            initial_purchase_date = merged.initial_purchase_date
+        FROM merged WHERE holdings.id = merged.keep_id
+        RETURNING holdings.id
+    )
+    DELETE FROM holdings USING merged
+    WHERE holdings.trader_id = merged.trader_id AND holdings.symbol = merged.symbol AND holdings.id <> merged.keep_id
+""")
+
+
+def merge_duplicate_holdings(sync_conn) -> int:
+    """
+    Collapses duplicate (trader_id, symbol) holdings into one row per position, summing their
+    quantities, so the unique ix_holdings_trader_id_symbol index can be built on databases
+    written before it existed. Does nothing once the index is in place.
+
+    :param sync_conn: Synchronous connection, as passed by run_sync
+    :return: Number of duplicate rows removed
+    """
+    indexes = {index["name"] for index in inspect(sync_conn).get_indexes(Holding.__tablename__)}
+    if "ix_holdings_trader_id_symbol" in indexes:
+        return 0
+    removed = sync_conn.execute(MERGE_DUPLICATE_HOLDINGS).rowcount
+    if removed:
+        logger.warning(f"Merged {removed} duplicate holdings rows before creating the unique holdings index")
+    return removed
+
+
+NORMALIZE_TRADE_SYMBOLS = text("UPDATE trades SET symbol = upper(symbol) WHERE symbol <> upper(symbol)")
+NORMALIZE_HOLDING_SYMBOLS = text("""
+    WITH moved AS (
+        DELETE FROM holdings WHERE symbol <> upper(symbol)
+        RETURNING id, trader_id, upper(symbol) AS symbol, quantity, updated_at, initial_purchase_date
+    )
+    INSERT INTO holdings (id, trader_id, symbol, quantity, updated_at, initial_purchase_date)
+    SELECT (array_agg(id ORDER BY id))[1], trader_id, symbol, sum(quantity), max(updated_at), min(initial_purchase_date)
+    FROM moved GROUP BY trader_id, symbol
+    ON CONFLICT (trader_id, symbol) DO UPDATE SET
+        quantity = holdings.quantity + excluded.quantity,
+        updated_at = greatest(holdings.updated_at, excluded.updated_at),
+        initial_purchase_date = least(holdings.initial_purchase_date, excluded.initial_purchase_date)
+""")
+
+
+def normalize_symbol_case(sync_conn) -> int:
+    """
+    Upper-cases symbols stored before they were normalized on write, folding holdings that
+    differ only by case into one position, then adds the symbol = upper(symbol) check
+    constraints. Runs once: does nothing when the constraints are already in place, as they
+    are on databases created from the current models. Needs the unique holdings index.
+
+    :param sync_conn: Synchronous connection, as passed by run_sync
+    :return: Number of trade and holding rows rewritten
+    """
+    inspector = inspect(sync_conn)
+    missing = [
+        constraint
+        for table in (Trade.__table__, Holding.__table__)
+        for constraint in table.constraints
+        if isinstance(constraint, CheckConstraint)
+        and constraint.name not in {check["name"] for check in inspector.get_check_constraints(table.name)}
+    ]
+    if not missing:
+        return 0
+    changed = sync_conn.execute(NORMALIZE_TRADE_SYMBOLS).rowcount + sync_conn.execute(NORMALIZE_HOLDING_SYMBOLS).rowcount
+    if changed:
+        logger.warning(f"Upper-cased the symbol of {changed} stored trades and holdings")
+    for constraint in missing:
+        sync_conn.execute(AddConstraint(constraint))
+    return changed
+
+
 async def update_on_trade(trader_id:str, trade_type:Literal["buy", "sell"], quantity:int, price:int, symbol:str,session: AsyncSession):
+    symbol = symbol.upper()
     portfolio_value_change=quantity * price
     now=datetime.now(timezone.utc)
-    trader= await get_trader_by_id(trader_id, session)
-    new_trade=Trade(
-        trader_id=trader.id,
-        symbol=symbol,
-        quantity=quantity,
-        price=price,
-        trade_type=trade_type,
-        trade_date=now)
-    session.add(new_trade)
     if trade_type=="buy":
-        if trader.cash_balance < portfolio_value_change:
+        # Balance check lives in the WHERE clause so concurrent buys can't overdraw
+        debited = await session.execute(
+            update(Trader)
+            .where(Trader.id == trader_id, Trader.cash_balance >= portfolio_value_change)
+            .values(cash_balance=Trader.cash_balance - portfolio_value_change, updated_at=now, last_seen_at=now)
+            .returning(Trader)
+            .execution_options(populate_existing=True)
+        )
+        trader = debited.scalar_one_or_none()
+        if trader is None:
+            await session.rollback()
+            await get_trader_by_id(trader_id, session)
             raise ValueError("Insufficient cash balance for this trade")
-        trader.cash_balance -= portfolio_value_change
-        existing_holding=await session.execute(select(Holding).where(Holding.trader_id == trader.id, Holding.symbol == symbol))
-        existing_holding = existing_holding.scalar_one_or_none()
-        if existing_holding:
-            existing_holding.quantity += quantity
-            existing_holding.updated_at = now
-
-        else:
-            new_holding = Holding(
-                trader_id=trader.id,
-                symbol=symbol,
-                quantity=quantity,
-                updated_at=now,
-                initial_purchase_date=now
-            )
-            session.add(new_holding)
+        await session.execute(upsert_holdings_statement([{
+            "trader_id": trader_id,
+            "symbol": symbol,
+            "quantity": quantity,
+            "updated_at": now,
+            "initial_purchase_date": now,
+        }], increment=True))
     elif trade_type=="sell":
-        existing_holding = await session.execute(select(Holding).where(Holding.trader_id == trader.id, Holding.symbol == symbol))
-        existing_holding = existing_holding.scalar_one_or_none()
-        if not existing_holding or existing_holding.quantity < quantity:
+        sold = await session.execute(
+            update(Holding)
+            .where(Holding.trader_id == trader_id, Holding.symbol == symbol, Holding.quantity >= quantity)
+            .values(quantity=Holding.quantity - quantity, updated_at=now)
+            .returning(Holding.quantity)
+        )
+        remaining = sold.scalar_one_or_none()
+        if remaining is None:
+            await session.rollback()
             raise ValueError("Insufficient holdings to sell")
-        existing_holding.quantity -= quantity
-        if existing_holding.quantity == 0:
-            session.delete(existing_holding)
-        trader.cash_balance += portfolio_value_change
-    trader.updated_at = now
-    trader.last_seen_at = now
+        if remaining == 0:
+            await session.execute(
+                delete(Holding).where(Holding.trader_id == trader_id, Holding.symbol == symbol, Holding.quantity == 0)
+            )
+        credited = await session.execute(
+            update(Trader)
+            .where(Trader.id == trader_id)
+            .values(cash_balance=Trader.cash_balance + portfolio_value_change, updated_at=now, last_seen_at=now)
+            .returning(Trader)
+            .execution_options(populate_existing=True)
+        )
+        trader = credited.scalar_one_or_none()
+        if trader is None:
+            await session.rollback()
+            raise ValueError(f"Trader with ID {trader_id} not found")
+    else:
+        raise ValueError(f"Unknown trade type {trade_type}")
+    await session.execute(insert(Trade).values(
+        trader_id=trader_id,
+        symbol=symbol,
+        quantity=quantity,
+        price=price,
+        trade_type=trade_type,
+        trade_date=now))
     await session.commit()
-    await session.refresh(trader)
     holdings=await session.execute(select(Holding).where(Holding.trader_id == trader.id))
     holdings = holdings.scalars().all()
-    portfolio_value = 0.0
-    holdings_list = []
-    
-    for holding in holdings:
-            current_value = holding.quantity * price
-            portfolio_value += current_value
-            
-            holding_dict = {
-                "id": str(holding.id),
-                "symbol": holding.symbol,
-                "quantity": holding.quantity,
-                "purchase_date": holding.initial_purchase_date.isoformat() if holding.initial_purchase_date else None,
-                "current_price": price,
-                "current_value": current_value,
-            }
-            holdings_list.append(holding_dict)
+    # The traded symbol is valued at the fill price, everything else at its own latest quote
+    others = [holding.symbol for holding in holdings if holding.symbol != symbol]
+    try:
+        quotes = await price_provider.get_quotes(others) if others else {}
+    except Exception as e:
+        logger.error(f"Error fetching prices for {others}: {e}")
+        quotes = {}
+    quotes[symbol] = {"price": price}
+    holdings_list, portfolio_value = value_holdings(holdings, quotes)
     return {
         "trader": trader,
         "holdings": holdings_list,
         "portfolio_value": portfolio_value,
     }
 
+
+def apply_fills(fills: List[dict], cash_balances: Dict[str, float], positions: Dict[Tuple[str, str], float]) -> List[str | None]:
+    """
+    Applies fills in order to in-memory balances and positions, running the same
+    checks as update_on_trade for each one. Rejected fills leave the state untouched.
+
+    :param fills: Dicts with trader_id, trade_type, quantity, price and symbol
+    :param cash_balances: Cash balance per trader ID, updated in place
+    :param positions: Quantity per (trader ID, symbol), updated in place
+    :return: One error message per fill, None where the fill was accepted
+    """
+    errors = []
+    for fill in fills:
+        trader_id = fill["trader_id"]
+        if trader_id not in cash_balances:
+            errors.append(f"Trader with ID {trader_id} not found")
+            continue
+        portfolio_value_change = fill["quantity"] * fill["price"]
+        key = (trader_id, fill["symbol"])
+        if fill["trade_type"] == "buy":
+            if cash_balances[trader_id] < portfolio_value_change:
+                errors.append("Insufficient cash balance for this trade")
+                continue
+            cash_balances[trader_id] -= portfolio_value_change
+            positions[key] = positions.get(key, 0) + fill["quantity"]
+        elif fill["trade_type"] == "sell":
+            if positions.get(key, 0) < fill["quantity"]:
+                errors.append("Insufficient holdings to sell")
+                continue
+            positions[key] -= fill["quantity"]
+            cash_balances[trader_id] += portfolio_value_change
+        else:
+            errors.append(f"Unknown trade type {fill['trade_type']}")
+            continue
+        errors.append(None)
+    return errors
+
+class SettlementConflict(Exception):
+    """A guarded settlement statement matched fewer rows than expected because another writer got there first"""
+
+
+SETTLE_ATTEMPTS = 3
+# Slack for float rounding between the in-memory balance check and the same check in SQL
+BALANCE_TOLERANCE = 1e-6
+
+
+def running_floor(deltas: List[float]) -> float:
+    """Lowest point a running total of deltas reaches, starting from 0"""
+    return min(np.cumsum(deltas).min(), 0.0) if deltas else 0.0
+
+
+async def settle_trades(fills: List[dict], session: AsyncSession, ledger: TraderLedger | None = None) -> List[dict]:
+    """
+    Settles a batch of fills in a single transaction (group commit), without locking rows
+    up front. Traders and holdings touched by the batch are read with two queries and the
+    fills checked and applied in order in memory; the outcome is then written as relative
+    guarded statements: one UPDATE ... FROM VALUES ... RETURNING for the cash of every
+    trader, whose WHERE clause re-checks the balance and that the trader's updated_at is
+    still the one read, one increment INSERT ... ON CONFLICT for the holdings and one
+    DELETE of closed positions guarded on their quantity. If another writer got in between,
+    a guard matches fewer rows, the transaction is rolled back and the batch re-checked
+    against fresh state; the last of SETTLE_ATTEMPTS locks the trader rows while reading
+    so a hot trader can't starve.
+    With a ledger, positions of traders whose cached entry is current come from memory
+    and the holdings query only covers the others; the ledger is written through after commit.
+
+    :param fills: Dicts with trader_id, trade_type, quantity, price and symbol, in settlement order
+    :param session: Database session
+    :param ledger: Optional in-memory trader ledger
+    :return: One dict per fill with the updated trader and an error message (None on success)
+    """
+    if not fills:
+        return []
+    for attempt in range(1, SETTLE_ATTEMPTS + 1):
+        try:
+            return await _settle_once(fills, session, ledger, lock=attempt == SETTLE_ATTEMPTS)
+        except SettlementConflict as e:
+            await session.rollback()
+            if attempt == SETTLE_ATTEMPTS:
+                raise
+            logger.info(f"Settlement conflict ({e}), retrying batch of {len(fills)} fills")
+
+
+async def _settle_once(fills: List[dict], session: AsyncSession, ledger: TraderLedger | None, lock: bool = False) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    trader_ids = {fill["trader_id"] for fill in fills}
+    symbols = {fill["symbol"] for fill in fills}
+    traders_query = select(Trader).where(Trader.id.in_(trader_ids)).execution_options(populate_existing=True)
+    traders_result = await session.execute(traders_query.with_for_update() if lock else traders_query)
+    traders = {trader.id: trader for trader in traders_result.scalars().all()}
+    stamps = {trader_id: trader.updated_at for trader_id, trader in traders.items()}
+    if ledger is None:
+        holdings_result = await session.execute(
+            select(Holding.trader_id, Holding.symbol, Holding.quantity)
+            .where(Holding.trader_id.in_(traders.keys()), Holding.symbol.in_(symbols))
+        )
+        positions = {(row.trader_id, row.symbol): row.quantity for row in holdings_result}
+    else:
+        positions = {}
+        uncached = []
+        for trader_id, trader in traders.items():
+            # The trader update below only applies if updated_at is unchanged, so a matching entry can be trusted
+            entry = ledger.get(trader_id, trader.updated_at)
+            if entry is None:
+                uncached.append(trader_id)
+            else:
+                positions.update(((trader_id, symbol), quantity) for symbol, quantity in entry.positions().items())
+        if uncached:
+            holdings_result = await session.execute(
+                select(Holding.trader_id, Holding.symbol, Holding.id, Holding.quantity, Holding.initial_purchase_date)
+                .where(Holding.trader_id.in_(uncached))
+            )
+            rows_by_trader = {trader_id: [] for trader_id in uncached}
+            for row in holdings_result:
+                rows_by_trader[row.trader_id].append(row)
+                positions[(row.trader_id, row.symbol)] = row.quantity
+            for trader_id, rows in rows_by_trader.items():
+                ledger.load(trader_id, traders[trader_id].cash_balance, stamps[trader_id], rows)
+
+    initial_positions = dict(positions)
+    cash_balances = {trader_id: trader.cash_balance for trader_id, trader in traders.items()}
+    errors = apply_fills(fills, cash_balances, positions)
+    accepted = [fill for fill, error in zip(fills, errors) if error is None]
+    if not accepted:
+        await session.rollback()
+        return [{"trader": traders.get(fill["trader_id"]), "error": error} for fill, error in zip(fills, errors)]
+
+    cash_deltas: Dict[str, List[float]] = {}
+    for fill in accepted:
+        value = fill["quantity"] * fill["price"]
+        cash_deltas.setdefault(fill["trader_id"], []).append(-value if fill["trade_type"] == "buy" else value)
+    deltas = values(
+        column("id", String), column("delta", Float), column("floor", Float), column("stamp", DateTime(timezone=True)),
+        name="deltas",
+    ).data([
+        (trader_id, float(sum(changes)), float(running_floor(changes)), stamps[trader_id])
+        for trader_id, changes in cash_deltas.items()
+    ])
+    # Traders are written first: the row locks taken here serialize concurrent batches for the same trader
+    debited = await session.execute(
+        update(Trader)
+        .where(
+            Trader.id == deltas.c.id,
+            Trader.updated_at.is_not_distinct_from(deltas.c.stamp),
+            Trader.cash_balance + deltas.c.floor >= -BALANCE_TOLERANCE,
+        )
+        .values(cash_balance=Trader.cash_balance + deltas.c.delta, updated_at=now, last_seen_at=now)
+        .returning(Trader)
+        .execution_options(populate_existing=True, synchronize_session=False)
+    )
+    balances = {trader.id: trader.cash_balance for trader in debited.scalars().all()}
+    if len(balances) != len(cash_deltas):
+        raise SettlementConflict("trader changed")
+
+    touched_positions = {(fill["trader_id"], fill["symbol"]) for fill in accepted}
+    increments = [
+        {
+            "trader_id": trader_id, "symbol": symbol,
+            "quantity": positions[(trader_id, symbol)] - initial_positions.get((trader_id, symbol), 0),
+            "updated_at": now, "initial_purchase_date": now,
+        }
+        for trader_id, symbol in touched_positions
+        if positions[(trader_id, symbol)] > 0
+    ]
+    upserted = []
+    if increments:
+        statement = upsert_holdings_statement(increments, increment=True)
+        statement = statement.returning(Holding.trader_id, Holding.symbol, Holding.id, Holding.quantity, Holding.initial_purchase_date)
+        upserted = (await session.execute(statement)).all()
+        # ON CONFLICT returns a row per input either way; a holding removed or changed since it was
+        # read shows up as a quantity other than the one computed from the read
+        if any(abs(row.quantity - positions[(row.trader_id, row.symbol)]) > BALANCE_TOLERANCE for row in upserted):
+            raise SettlementConflict("holding changed")
+    closed = [key for key in touched_positions if positions[key] == 0 and initial_positions.get(key, 0) > 0]
+    if closed:
+        deleted = await session.execute(
+            delete(Holding)
+            .where(tuple_(Holding.trader_id, Holding.symbol, Holding.quantity).in_(
+                [(trader_id, symbol, initial_positions[(trader_id, symbol)]) for trader_id, symbol in closed]
+            ))
+            .returning(Holding.id)
+        )
+        if len(deleted.all()) != len(closed):
+            raise SettlementConflict("holding changed")
+
+    await session.execute(insert(Trade), [
+        {
+            "trader_id": fill["trader_id"],
+            "symbol": fill["symbol"],
+            "quantity": fill["quantity"],
+            "price": fill["price"],
+            "trade_type": fill["trade_type"],
+            "trade_date": now,
+        }
+        for fill in accepted
+    ])
+    await session.commit()
+    if ledger is not None:
+        changes = {trader_id: {} for trader_id in cash_deltas}
+        for row in upserted:
+            changes[row.trader_id][row.symbol] = {
+                "id": row.id, "quantity": row.quantity, "initial_purchase_date": row.initial_purchase_date,
+            }
+        for trader_id, symbol in closed:
+            changes[trader_id][symbol] = None
+        for trader_id, holdings in changes.items():
+            ledger.write(trader_id, balances[trader_id], now, holdings)
+    return [
+        {"trader": traders.get(fill["trader_id"]), "error": error}
+        for fill, error in zip(fills, errors)
+    ]
+
     
 async def signup_trader(uid:str, email:str, name:str, session: AsyncSession) -> Trader:
     exisiting_trader=await session.execute(select(Trader).where(Trader.id == uid))
@@ -106,41 +431,71 @@ async def signup_trader(uid:str, email:str, name:str, session: AsyncSession) ->
         "portfolio_value": 0.0,
     }
 
-async def login_trader(uid:str, session: AsyncSession) -> Trader:
+def value_holdings(holdings: List[Holding], quotes: Dict[str, dict]) -> Tuple[List[dict], float]:
+    """
+    Values holdings against a batch of quotes in one vectorized pass.
+    Holdings without a usable price are logged and left out of the result.
+
+    :param holdings: Holding rows to value
+    :param quotes: Latest quotes keyed by symbol
+    :return: Holding dicts for the priced holdings and the total portfolio value
+    """
+    if not holdings:
+        return [], 0.0
+    quantities = np.fromiter((holding.quantity for holding in holdings), dtype=float, count=len(holdings))
+    prices = np.array(
+        [(quotes.get(holding.symbol) or {}).get("price") for holding in holdings],
+        dtype=float,
+    )
+    values = quantities * prices
+    priced = ~np.isnan(values)
+    holdings_list = []
+    for holding, current_price, current_value, has_price in zip(holdings, prices.tolist(), values.tolist(), priced.tolist()):
+        if not has_price:
+            logger.warning(f"No price data found for {holding.symbol}")
+            continue
+        holdings_list.append({
+            "id": str(holding.id),  # Convert UUID to string
+            "symbol": holding.symbol,
+            "quantity": holding.quantity,
+            "purchase_date": holding.initial_purchase_date.isoformat() if holding.initial_purchase_date else None,
+            "current_price": current_price,
+            "current_value": current_value,
+        })
+    return holdings_list, float(values[priced].sum())
+
+async def get_positions(uid: str, session: AsyncSession, ledger: TraderLedger | None = None) -> Tuple[Trader, list]:
+    """
+    Loads a trader and their holdings, from the ledger when its entry is current
+
+    :param uid: Trader ID
+    :param session: Database session
+    :param ledger: Optional in-memory trader ledger
+    :return: The trader row and its holdings, each with id, symbol, quantity and initial_purchase_date
+    """
     existing_trader = await session.execute(select(Trader).where(Trader.id == uid))
     trader = existing_trader.scalar_one_or_none()
     if not trader:
         raise ValueError("Trader does not exist")
 
+    entry = ledger.get(uid, trader.updated_at) if ledger is not None else None
+    if entry is not None:
+        return trader, [SimpleNamespace(symbol=symbol, **holding) for symbol, holding in entry.holdings.items()]
     await session.refresh(trader, ["holdings"])
+    if ledger is not None:
+        ledger.load(uid, trader.cash_balance, trader.updated_at, trader.holdings)
+    return trader, trader.holdings
 
-    portfolio_value = 0.0
-    holdings_list=[]
-    for holding in trader.holdings:
-        try:
-            price_data = yf.download([holding.symbol], period="1d", interval="1m", progress=False)
-            if price_data.empty:
-                logger.warning(f"No price data found for {holding.symbol}")
-                continue
-            latest_price = price_data["Close"].iloc[-1]
-            if not math.isnan(latest_price):
-                current_price = float(latest_price)
-            else:
-                current_price = 0.0
-            portfolio_value += holding.quantity * current_price
-            holding_dict = {
-                "id": str(holding.id),  # Convert UUID to string
-                "symbol": holding.symbol,
-                "quantity": holding.quantity,
-                "purchase_date": holding.initial_purchase_date.isoformat() if holding.initial_purchase_date else None,
-                "current_price": current_price,
-                "current_value": holding.quantity * current_price,
-            }
-            holdings_list.append(holding_dict)
-        except Exception as e:
-            logger.error(f"Error fetching price for {holding.symbol}: {e}")
-            continue
-    print(holdings_list, portfolio_value)
+async def login_trader(uid:str, session: AsyncSession, ledger: TraderLedger | None = None) -> Trader:
+    trader, holdings = await get_positions(uid, session, ledger)
+
+    symbols = [holding.symbol for holding in holdings]
+    try:
+        quotes = await price_provider.get_quotes(symbols) if symbols else {}
+    except Exception as e:
+        logger.error(f"Error fetching prices for {symbols}: {e}")
+        quotes = {}
+    holdings_list, portfolio_value = value_holdings(holdings, quotes)
     return {
         "trader": trader,
         "holdings": holdings_list,
@@ -3,7 +3,6 @@ from fastapi import (
     Query,
     HTTPException,
     Request,
-    BackgroundTasks,
     WebSocket,
     WebSocketDisconnect,
     Depends,
@@ -11,38 +10,86 @@ from fastapi import (
 )
 import signal
 from contextlib import asynccontextmanager
-from fastapi.responses import JSONResponse
-from typing import List
-from app.utils.auth_utils import get_token_data
+from fastapi.responses import StreamingResponse
+from app.utils.json_utils import FastJSONResponse
+from typing import List, Literal
+from datetime import datetime
+from app.utils.auth_utils import token_cache
 from fastapi.middleware.cors import CORSMiddleware
-from app.schemas.trade_request import TradeRequest
+from app.schemas.trade_request import TradeRequest, BatchTradeRequest
 from app.schemas.signup_request import SignupRequest
-from app.core.trade_processing import TradeSystem
+from app.core.trade_processing import TradeSystem, TradeQueueFullError
 from app.core.notifications import NotificationService
-from app.core.websocket_manager import WebsocketManager
+from app.core.push_sinks import create_push_sink
+from app.core.websocket_manager import WebsocketManager, WebsocketRelay
+from app.core.event_bus import create_event_bus, DEFAULT_EVENT_BUS_PATH
 from app.models.tables import Trader, Notification
 from app.config.firebase_config import FirebaseConfig
 from app.utils.logger import logger
-from app.core.stock_search import lookup_stock, get_price_data
+from app.core.stock_search import quote_cache
+from app.core.price_provider import price_provider
+from app.core.symbol_index import symbol_index
+from app.core.bar_store import bar_store
+from app.core.tick_buffer import tick_store
+from app.core.trader_ledger import trader_ledger
+from app.utils.loop_monitor import LoopLagMonitor
 from app.db.database_connection import (
     engine,
     Base,
     AsyncSessionLocal,
     init_async_session,
 )
-from app.db.trader_store import signup_trader, login_trader, update_notification_token
+from app.db.trader_store import signup_trader, login_trader, update_notification_token, merge_duplicate_holdings, normalize_symbol_case
+from app.db.trade_store import get_trades, get_portfolio, stream_trades, MAX_PAGE_SIZE
 from app.core.market_data import MarketDataStreamer
+from app.core.portfolio_valuation import PortfolioValuator
+from sqlalchemy import text
 from dotenv import load_dotenv
 import asyncio
 import os
 
 load_dotenv()
 TEST_TRADER_ID = os.getenv("TEST_UID")
-
+TRADE_WORKERS = int(os.getenv("TRADE_WORKERS", "5"))
+TRADE_MAX_PENDING = int(os.getenv("TRADE_MAX_PENDING", "10000"))
+TRADE_ENQUEUE_TIMEOUT = float(os.getenv("TRADE_ENQUEUE_TIMEOUT", "0.5"))
+TRADE_DRAIN_TIMEOUT = float(os.getenv("TRADE_DRAIN_TIMEOUT", "10"))
+TRADE_TICK_INTERVAL = float(os.getenv("TRADE_TICK_INTERVAL", "0.5"))
+TRADE_SETTLE_BATCH_SIZE = int(os.getenv("TRADE_SETTLE_BATCH_SIZE", "100"))
+TRADE_SETTLE_WINDOW_MS = float(os.getenv("TRADE_SETTLE_WINDOW_MS", "5"))
+TRADE_PROGRESS_INTERVAL = float(os.getenv("TRADE_PROGRESS_INTERVAL", "0.5"))
+TRADE_PROGRESS_MIN_DELTA = float(os.getenv("TRADE_PROGRESS_MIN_DELTA", "1"))
+MARKET_DATA_POLL_INTERVAL = float(os.getenv("MARKET_DATA_POLL_INTERVAL", "10"))
+SYMBOLS_REFRESH_INTERVAL = float(os.getenv("SYMBOLS_REFRESH_INTERVAL", "300"))
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "coalesce")
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+AUTH_KEYS_REFRESH_INTERVAL = float(os.getenv("AUTH_KEYS_REFRESH_INTERVAL", "3600"))
+PUSH_SINK = os.getenv("PUSH_SINK", "firebase")
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "500"))
+NOTIFICATION_FLUSH_INTERVAL_MS = float(os.getenv("NOTIFICATION_FLUSH_INTERVAL_MS", "50"))
+NOTIFICATION_MAX_RETRIES = int(os.getenv("NOTIFICATION_MAX_RETRIES", "5"))
+EVENT_BUS = os.getenv("EVENT_BUS", "local")
+EVENT_BUS_PATH = os.getenv("EVENT_BUS_PATH", DEFAULT_EVENT_BUS_PATH)
+
+
+# Key of the advisory lock serializing schema setup across uvicorn workers
+INIT_DB_LOCK_KEY = 7261354
+
+def create_missing_indexes(sync_conn):
+    # create_all skips tables that already exist, so indexes added to existing models are created here
+    merge_duplicate_holdings(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+    normalize_symbol_case(sync_conn)
 
 async def init_db():
     async with engine.begin() as conn:
+        # Workers start together; the first sets up the schema and the others find it done
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": INIT_DB_LOCK_KEY})
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_missing_indexes)
         print("Database initialized")
 
 @asynccontextmanager
@@ -50,7 +97,49 @@ async def lifespan(app: FastAPI):
     app.state.background_tasks = set()
     firebase_instance = FirebaseConfig.get_instance()
     firebase_instance.initialize_firebase_app()
+    token_cache.start(key_refresh_interval=AUTH_KEYS_REFRESH_INTERVAL)
+    await event_bus.start()
     await init_db()
+    app.state.loop_monitor = LoopLagMonitor()
+    app.state.loop_monitor.start()
+    app.state.trade_system = TradeSystem(
+        sessionmaker=AsyncSessionLocal,
+        num_processors=TRADE_WORKERS,
+        max_pending=TRADE_MAX_PENDING,
+        enqueue_timeout=TRADE_ENQUEUE_TIMEOUT,
+        tick_interval=TRADE_TICK_INTERVAL,
+        settle_batch_size=TRADE_SETTLE_BATCH_SIZE,
+        settle_window=TRADE_SETTLE_WINDOW_MS / 1000,
+        progress_interval=TRADE_PROGRESS_INTERVAL,
+        progress_min_delta=TRADE_PROGRESS_MIN_DELTA,
+        ledger=trader_ledger,
+    )
+    app.state.notification_service = NotificationService(
+        sessionmaker=AsyncSessionLocal,
+        push_sink=create_push_sink(PUSH_SINK),
+        batch_size=NOTIFICATION_BATCH_SIZE,
+        flush_interval=NOTIFICATION_FLUSH_INTERVAL_MS / 1000,
+        max_retries=NOTIFICATION_MAX_RETRIES,
+    )
+    app.state.notification_service.start()
+    portfolio_valuator = PortfolioValuator(
+        ws_manager=market_data_ws_manager,
+        sessionmaker=AsyncSessionLocal,
+        ledger=trader_ledger,
+        bus=event_bus,
+    )
+    await app.state.trade_system.start(
+        ws_manager=ws_manager_instance,
+        notification_service=app.state.notification_service,
+        valuator=portfolio_valuator,
+    )
+    app.state.market_data_streamer = MarketDataStreamer(
+        poll_interval=MARKET_DATA_POLL_INTERVAL,
+        valuator=portfolio_valuator,
+        tick_store=tick_store,
+    )
+    app.state.market_data_streamer.start(ws_manager=market_data_ws_manager)
+    symbol_index.start(refresh_interval=SYMBOLS_REFRESH_INTERVAL)
     def handle_exit(sig, frame):
         for task in app.state.background_tasks:
             task.cancel()
@@ -60,11 +149,22 @@ async def lifespan(app: FastAPI):
     
     yield
 
+    await symbol_index.stop()
+    await token_cache.stop()
+    await app.state.market_data_streamer.stop()
+    await app.state.trade_system.shutdown(drain_timeout=TRADE_DRAIN_TIMEOUT)
+    await app.state.notification_service.stop()
+    # Closed before the bus stops so the writer tasks finish and peers hear the traders went offline
+    await ws_manager_instance.close_all()
+    await market_data_ws_manager.close_all()
+    await app.state.loop_monitor.stop()
+    price_provider.shutdown()
+    await event_bus.stop()
     for task in app.state.background_tasks:
         task.cancel()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 
 @app.middleware("http")
@@ -81,7 +181,7 @@ async def authenticate(request: Request, call_next):
         raise HTTPException(status_code=401, detail="Authorization header missing")
     token = auth_header.split("Bearer ")[-1]
     try:
-        user_data = get_token_data(token)
+        user_data = await token_cache.get_token_data(token)
 
         # Store user in request state for access in route handlers
         request.state.user = user_data
@@ -107,36 +207,57 @@ def main():
     return {"Hello": "World"}
 
 
-ws_manager_instance = WebsocketManager()
-market_data_ws_manager = WebsocketManager()
+# Trade and market events reach sockets held by other uvicorn workers through the event bus
+event_bus = create_event_bus(EVENT_BUS, EVENT_BUS_PATH)
+ws_manager_instance = WebsocketRelay(
+    WebsocketManager(
+        max_queue_size=WS_SEND_QUEUE_SIZE,
+        overflow_policy=WS_OVERFLOW_POLICY,
+        send_timeout=WS_SEND_TIMEOUT,
+    ),
+    bus=event_bus,
+    channel="trade_progress",
+)
+market_data_ws_manager = WebsocketRelay(
+    WebsocketManager(
+        max_queue_size=WS_SEND_QUEUE_SIZE,
+        overflow_policy=WS_OVERFLOW_POLICY,
+        send_timeout=WS_SEND_TIMEOUT,
+    ),
+    bus=event_bus,
+    channel="market_data",
+)
 
 @app.get("/api/stocks/lookup/")
-def lookup_stock_endpoint(
+async def lookup_stock_endpoint(
     symbol: str = Query(..., description="Stock symbol to lookup"),
     result_length: int = Query(5, description="Number of results to return"),
 ):
 
     try:
-        stock_data = lookup_stock(symbol, result_length)
-        return JSONResponse(
+        # Symbols missing from the local universe fall back to a live lookup
+        stock_data = await symbol_index.search_or_lookup(symbol, result_length, price_provider.lookup)
+        return FastJSONResponse(
             status_code=200,
             content={"message": "Search results retrieved successfully", "search_results": stock_data},
         )
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Stock lookup timed out")
     except Exception as e:
         logger.error(f"Error during stock lookup: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/stock/")
-def get_stock_data_endpoint(
+async def get_stock_data_endpoint(
     symbol: str = Query(..., description="Stock ticker symbol"),
 ):
     try:
-        stock_data = get_price_data(symbol)
+        stock_data = await price_provider.get_quote(symbol)
         if not stock_data:
             raise HTTPException(status_code=404, detail="Stock not found")
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=200,
             content={"message": "Stock data retrieved successfully", "stock_data": stock_data},
         )
@@ -144,6 +265,43 @@ def get_stock_data_endpoint(
         logger.error(f"Error during stock data retrieval: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/stock/history")
+async def get_stock_history_endpoint(
+    symbol: str = Query(..., description="Stock ticker symbol"),
+    interval: str = Query("1d", description="Bar interval: 1m, 1h or 1d"),
+    start: datetime | None = Query(None, description="First bar time, defaults to a year ago"),
+    end: datetime | None = Query(None, description="Only bars before this time"),
+):
+    try:
+        bars = await bar_store.get_bars(symbol, interval=interval, start=start, end=end)
+        return FastJSONResponse(
+            status_code=200,
+            content={"message": "Stock history retrieved successfully", "symbol": symbol.upper(), "interval": interval, "bars": bars},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error during stock history retrieval: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/stock/intraday")
+async def get_stock_intraday_endpoint(
+    symbol: str = Query(..., description="Stock ticker symbol"),
+    interval: str = Query("1m", description="Bar interval: 1m, 5m or 15m"),
+    since: datetime | None = Query(None, description="First bar time, defaults to the start of the UTC day"),
+):
+    try:
+        bars = tick_store.bars(symbol, interval=interval, since=since)
+        return FastJSONResponse(
+            status_code=200,
+            content={"message": "Intraday prices retrieved successfully", "symbol": symbol.upper(), "interval": interval, "bars": bars},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error during intraday price retrieval: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/trader/signup")
 async def signup_trader_endpoint(
     request: Request,
@@ -174,7 +332,7 @@ async def signup_trader_endpoint(
             "cash_balance": new_trader.cash_balance,
             "notification_tokens": new_trader.notification_tokens or [],
         }
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=201,
             content={"message": "Trader signed up successfully", "trader": trader_dict, "holdings": signup_data["holdings"], "portfolio_value": signup_data["portfolio_value"]},
         )
@@ -188,7 +346,7 @@ async def login_trader_endpoint(request: Request, session=Depends(init_async_ses
     try:
         user_data = request.state.user
         uid = user_data["uid"]
-        login_user_data = await login_trader(uid=uid, session=session)
+        login_user_data = await login_trader(uid=uid, session=session, ledger=trader_ledger)
         trader= login_user_data["trader"]
         trader_dict = {
             "id": trader.id,
@@ -205,7 +363,7 @@ async def login_trader_endpoint(request: Request, session=Depends(init_async_ses
             "cash_balance": trader.cash_balance,
             "notification_tokens": trader.notification_tokens or [],
         }
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=200,
             content={"message": "Trader logged in successfully", "trader": trader_dict, "holdings": login_user_data["holdings"], "portfolio_value": login_user_data["portfolio_value"]},
         )
@@ -220,7 +378,7 @@ async def update_notification_token_endpoint(request: Request, notification_toke
         uid = user_data["uid"]
         await update_notification_token(uid=uid, token=notification_token, session=session)
         logger.info(f"Notification token updated for trader {uid}")
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=200,
             content={"message": "Notification token updated successfully"},
         )
@@ -232,99 +390,207 @@ async def update_notification_token_endpoint(request: Request, notification_toke
 async def make_trade_order(
     request: Request,
     trade_request: TradeRequest,
-    bg_tasks: BackgroundTasks,
-    notification_service=Depends(NotificationService),
 ):
     try:
 
         trader_id = request.state.user["uid"]
-        ticker = trade_request.ticker
-        quantity = trade_request.quantity
-        price= trade_request.price
-        trade_system = TradeSystem(sessionmaker=AsyncSessionLocal)
-        bg_tasks.add_task(
-            trade_system.run,
+        trade_system: TradeSystem = request.app.state.trade_system
+        trade = await trade_system.submit_order(
             trader_id=trader_id,
-            ticker=ticker,
-            quantity=quantity,
-            price=price,
-            ws_manager=ws_manager_instance,
-            notification_service=notification_service,
+            ticker=trade_request.ticker,
+            quantity=trade_request.quantity,
+            price=trade_request.price,
             trade_type=trade_request.trade_type,
         )
         return {
             "status": "success",
             "processing": True,
+            "trade_id": trade.id,
             "message": "Trade recieved successfully",
         }
+    except TradeQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/trades/batch")
+async def make_batch_trade_order(
+    request: Request,
+    batch_request: BatchTradeRequest,
+):
+    try:
+        trader_id = request.state.user["uid"]
+        trade_system: TradeSystem = request.app.state.trade_system
+        trades = await trade_system.submit_many(
+            trader_id=trader_id,
+            orders=[order.model_dump() for order in batch_request.orders],
+        )
+        return {
+            "status": "success",
+            "processing": True,
+            "trade_ids": [trade.id for trade in trades],
+            "message": f"{len(trades)} trades recieved successfully",
+        }
+    except TradeQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/trades")
+async def get_trades_endpoint(
+    request: Request,
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE, description="Number of trades to return"),
+    symbol: str | None = Query(None, description="Only trades in this symbol"),
+    side: Literal["buy", "sell"] | None = Query(None, description="Only buys or only sells"),
+    start: datetime | None = Query(None, description="Only trades at or after this time"),
+    end: datetime | None = Query(None, description="Only trades before this time"),
+    session=Depends(init_async_session),
+):
+    try:
+        page = await get_trades(
+            trader_id=request.state.user["uid"], session=session, cursor=cursor, limit=limit,
+            symbol=symbol, trade_type=side, start=start, end=end,
+        )
+        return FastJSONResponse(status_code=200, content={"message": "Trades retrieved successfully", **page})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error retrieving trades: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/trades/export")
+async def export_trades_endpoint(
+    request: Request,
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format", description="ndjson or csv"),
+    symbol: str | None = Query(None, description="Only trades in this symbol"),
+    side: Literal["buy", "sell"] | None = Query(None, description="Only buys or only sells"),
+    start: datetime | None = Query(None, description="Only trades at or after this time"),
+    end: datetime | None = Query(None, description="Only trades before this time"),
+):
+    chunks = stream_trades(
+        trader_id=request.state.user["uid"], sessionmaker=AsyncSessionLocal, export_format=export_format,
+        symbol=symbol, trade_type=side, start=start, end=end,
+    )
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="trades.{export_format}"'},
+    )
+
+
+@app.get("/api/portfolio")
+async def get_portfolio_endpoint(
+    request: Request,
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE, description="Number of holdings to return"),
+    session=Depends(init_async_session),
+):
+    try:
+        page = await get_portfolio(trader_id=request.state.user["uid"], session=session, cursor=cursor, limit=limit)
+        return FastJSONResponse(status_code=200, content={"message": "Portfolio retrieved successfully", **page})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error retrieving portfolio: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/metrics")
+def get_metrics(request: Request):
+    return FastJSONResponse(
+        status_code=200,
+        content={
+            "trade_system": request.app.state.trade_system.get_stats(),
+            "market_data": request.app.state.market_data_streamer.get_stats(),
+            "notifications": request.app.state.notification_service.get_stats(),
+            "quote_cache": quote_cache.get_stats(),
+            "price_provider": price_provider.get_stats(),
+            "symbol_index": symbol_index.get_stats(),
+            "bar_store": bar_store.get_stats(),
+            "tick_store": tick_store.get_stats(),
+            "trade_progress_ws": ws_manager_instance.get_stats(),
+            "market_data_ws": market_data_ws_manager.get_stats(),
+            "event_loop": request.app.state.loop_monitor.get_stats(),
+            "auth": token_cache.get_stats(),
+            "ledger": trader_ledger.get_stats(),
+            "event_bus": event_bus.get_stats(),
+        },
+    )
+
+
 @app.get("/api/market-data/")
 # will run on useeffect from client side
 async def get_market_data(
     request: Request,
-    bg_tasks: BackgroundTasks,
-    streamer=Depends(MarketDataStreamer),
     use_test_auth: bool = Query(False),
     ticker: List[str] = Query(..., description="List of stock tickers"),
 ):
     trader_id = request.state.user["uid"] if not use_test_auth else TEST_TRADER_ID
-    # bg_tasks.add_task(
-    #     streamer.stream_price_data,
-    #     trader_id=trader_id,
-    #     tickers=ticker,
-    #     ws_manager=market_data_ws_manager,
-    # )
-    task=asyncio.create_task(
-        streamer.stream_price_data(
-            trader_id=trader_id,
-            tickers=ticker,
-            ws_manager=market_data_ws_manager,
-        )
-    )
-    request.app.state.background_tasks.add(task)
-    task.add_done_callback(lambda t: request.app.state.background_tasks.remove(t))
+    streamer: MarketDataStreamer = request.app.state.market_data_streamer
+    streamer.subscribe(trader_id=trader_id, tickers=ticker)
     return {
         "status": "success",
         "message": f"Market data for {ticker} is being sent to the websocket.",
     }
 
 
-async def websocket_auth(websocket:WebSocket, token:str, use_test_auth:bool = False):   
+async def websocket_auth(websocket:WebSocket, token:str, use_test_auth:bool = False) -> dict:
     if use_test_auth:
-        return TEST_TRADER_ID
-    user_data = get_token_data(token)
+        return {"uid": TEST_TRADER_ID, "admin": False}
+    user_data = await token_cache.get_token_data(token)
 
     if not user_data:
         await websocket.close(code=1008)
         raise HTTPException(status_code=401, detail="Invalid authentication")
 
-    return user_data["uid"]
+    return user_data
 
 
 @app.websocket("/trade-progress/ws")
-async def ws_endpoint(websocket: WebSocket, token: str=Query(..., description="Bearer token for authentication")):
-    trader_id = await websocket_auth(websocket, token)
+async def ws_endpoint(
+    websocket: WebSocket,
+    token: str=Query(..., description="Bearer token for authentication"),
+    topics: str | None = Query(None, description="Admin only: comma-separated topics, e.g. trade:<id>,trader:<id>"),
+):
+    user_data = await websocket_auth(websocket, token)
+    trader_id = user_data["uid"]
+    if topics and not user_data.get("admin"):
+        await websocket.close(code=1008)
+        return
     await ws_manager_instance.connect(websocket, trader_id)
+    if topics:
+        ws_manager_instance.subscribe(trader_id, [topic.strip() for topic in topics.split(",") if topic.strip()])
     try:
         while True:
-            await asyncio.sleep(60)  # Keeps the connection alive
+            await websocket.receive_text()  # Returns only when the client sends or disconnects
     except WebSocketDisconnect:
-        await ws_manager_instance.disconnect(trader_id)
+        logger.info(f"Trade progress WebSocket for trader {trader_id} closed.")
+    finally:
+        await ws_manager_instance.disconnect(trader_id, websocket)
 
 
 @app.websocket("/market-data/ws")
 async def market_data_ws_endpoint(websocket: WebSocket, token: str = Query(..., description="Bearer token for authentication")):
-    trader_id = await websocket_auth(websocket, token)
+    trader_id = (await websocket_auth(websocket, token))["uid"]
     await market_data_ws_manager.connect(websocket, trader_id)
+    streamer: MarketDataStreamer = websocket.app.state.market_data_streamer
     try:
+        try:
+            await streamer.track_portfolio(trader_id)
+        except Exception as e:
+            logger.error(f"Could not start live valuation for trader {trader_id}: {str(e)}")
         while True:
-            try:
-                await asyncio.sleep(60)  # Keeps the connection alive
-            except asyncio.CancelledError:
-                logger.info(f"WebSocket connection for trader {trader_id} closed.")
-                break
+            await websocket.receive_text()  # Returns only when the client sends or disconnects
     except WebSocketDisconnect:
-        await market_data_ws_manager.disconnect(trader_id)
+        logger.info(f"WebSocket connection for trader {trader_id} closed.")
+    finally:
+        if await market_data_ws_manager.disconnect(trader_id, websocket):
+            streamer.unsubscribe(trader_id)
+            streamer.untrack_portfolio(trader_id)
@@ -1,6 +1,6 @@
 from app.db.database_connection import Base
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, String, ForeignKey, Boolean, DateTime, func, Float, UUID
+from sqlalchemy import Column, String, ForeignKey, Boolean, DateTime, func, Float, UUID, Index, CheckConstraint
 from datetime import datetime, timezone
 from uuid import uuid4
 import uuid
@@ -39,6 +39,12 @@ class Notification(Base):
 
 class Holding(Base):
     __tablename__ = "holdings"
+    __table_args__ = (
+        # One row per position; target of the ON CONFLICT upserts in trader_store
+        Index("ix_holdings_trader_id_symbol", "trader_id", "symbol", unique=True),
+        # Symbols are stored upper-case; added to older databases by normalize_symbol_case
+        CheckConstraint("symbol = upper(symbol)", name="ck_holdings_symbol_upper"),
+    )
     id = Column(UUID, primary_key=True, default=lambda:str(uuid.uuid4()))
     trader_id = Column(ForeignKey("traders.id"))
     symbol = Column(String, nullable=False)
@@ -50,6 +56,14 @@ class Holding(Base):
 
 class Trade(Base):
     __tablename__ = "trades"
+    __table_args__ = (
+        # Keyset pages of a trader's history; INCLUDE lets them be served by index-only scans
+        Index("ix_trades_trader_id_trade_date_id", "trader_id", "trade_date", "id",
+              postgresql_include=["symbol", "quantity", "price", "trade_type"]),
+        Index("ix_trades_trader_id_symbol_trade_date_id", "trader_id", "symbol", "trade_date", "id",
+              postgresql_include=["quantity", "price", "trade_type"]),
+        CheckConstraint("symbol = upper(symbol)", name="ck_trades_symbol_upper"),
+    )
     id = Column(UUID, primary_key=True, default=lambda:str(uuid.uuid4()))
     trader_id = Column(ForeignKey("traders.id"))
     symbol = Column(String, nullable=False)
@@ -1,5 +1,7 @@
-from pydantic import BaseModel, field_validator
-from typing import Literal, Any
+from pydantic import BaseModel, Field, field_validator
+from typing import Literal, Any, List
+
+MAX_BATCH_ORDERS = 1000
 class TradeRequest(BaseModel):
     ticker: str
     quantity: int
@@ -11,4 +13,8 @@ class TradeRequest(BaseModel):
         """Ensure price is converted to float regardless of input format."""
         if isinstance(v, str):
             return float(v)
-        return float(v)
\ No newline at end of file
+        return float(v)
+
+
+class BatchTradeRequest(BaseModel):
+    orders: List[TradeRequest] = Field(..., min_length=1, max_length=MAX_BATCH_ORDERS)
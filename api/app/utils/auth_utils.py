@@ -1,26 +1,217 @@
-from firebase_admin import auth
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+import firebase_admin
+from google.auth import exceptions, jwt
+from google.auth.transport.requests import Request
 
 from app.utils.logger import logger
+
+ID_TOKEN_CERT_URI = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+ID_TOKEN_ISSUER_PREFIX = "https://securetoken.google.com/"
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+class SigningKeys:
+    def __init__(self, url: str = ID_TOKEN_CERT_URI, request=None, default_max_age: int = 3600):
+        """
+        Google's token signing certificates, fetched with the public google.auth transport and
+        kept until the response's Cache-Control max-age runs out
+
+        :param url: Certificate set URL
+        :param request: google.auth transport request, a requests-backed one if None
+        :param default_max_age: Seconds to keep the set when the response has no max-age
+        """
+        self.url = url
+        self.request = request or Request()
+        self.default_max_age = default_max_age
+        self._certs: dict = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def refresh(self) -> dict:
+        """
+        Re-downloads the certificate set, so verification on the request path never has to
+        wait for the fetch
+        """
+        response = self.request(self.url, method="GET", headers={"Cache-Control": "no-cache"})
+        if response.status != 200:
+            raise exceptions.TransportError(f"Could not fetch token signing keys: HTTP {response.status}")
+        data = response.data.decode("utf-8") if isinstance(response.data, bytes) else response.data
+        certs = json.loads(data)
+        match = MAX_AGE_PATTERN.search(response.headers.get("cache-control", ""))
+        with self._lock:
+            self._certs = certs
+            self._expires_at = time.time() + (int(match.group(1)) if match else self.default_max_age)
+            self.fetches += 1
+        return certs
+
+    def get(self) -> dict:
+        with self._lock:
+            if self._expires_at > time.time():
+                return self._certs
+        return self.refresh()
+
+
+signing_keys = SigningKeys()
+
+
+def verify_id_token(id_token: str, keys: SigningKeys | None = None, project_id: str | None = None) -> dict:
+    """
+    Verifies a Firebase ID token the way firebase_admin does: RS256 signature against Google's
+    signing keys, expiry, and the project's audience and issuer
+
+    :param id_token: Firebase ID token
+    :param keys: Signing key set, the module's shared one if None
+    :param project_id: Firebase project, the default app's if None
+    :return: Decoded claims with uid set to the subject
+    :raises ValueError: If the token is malformed, expired or not for this project
+    """
+    keys = keys or signing_keys
+    project_id = project_id or firebase_admin.get_app().project_id
+    header = jwt.decode_header(id_token)
+    if header.get("alg") != "RS256" or not header.get("kid"):
+        raise ValueError("ID token must be RS256 signed and carry a key id")
+    claims = jwt.decode(id_token, certs=keys.get(), audience=project_id)
+    if claims.get("iss") != ID_TOKEN_ISSUER_PREFIX + project_id:
+        raise ValueError(f"ID token has incorrect issuer {claims.get('iss')}")
+    subject = claims.get("sub")
+    if not isinstance(subject, str) or not subject or len(subject) > 128:
+        raise ValueError("ID token has an invalid subject")
+    claims["uid"] = subject
+    return claims
+
+
 def decode_token(id_token:str):
     try:
-        decoded_token = auth.verify_id_token(id_token=id_token)
+        decoded_token = verify_id_token(id_token)
         logger.info("👋 Token verified 👋")
         return decoded_token
-    except auth.InvalidIdTokenError:
+    except ValueError:
         logger.error("🫷 Invalid ID token 🫷")
         return None
 
-def get_token_data(id_token:str):
-    decoded_token=decode_token(id_token)
-    if decoded_token:
-        user_data = {
+def user_data_from_token(decoded_token: dict) -> dict:
+    return {
         "uid": decoded_token["uid"],
         "email": decoded_token.get("email"),
         "auth_time": decoded_token["auth_time"],
-        "created_at": decoded_token["iat"]
+        "created_at": decoded_token["iat"],
+        "admin": bool(decoded_token.get("admin", False)),  # Firebase custom claim
     }
-        print(user_data)
-        return user_data
+
+def get_token_data(id_token:str):
+    decoded_token=decode_token(id_token)
+    if decoded_token:
+        return user_data_from_token(decoded_token)
     else:
         return None
-    
\ No newline at end of file
+
+
+class TokenCache:
+    def __init__(self, max_size: int = 10000, window: int = 1000):
+        """
+        Cache of verified ID tokens keyed by the token's SHA-256, each entry expiring at the
+        token's exp claim. A warm token skips signature verification entirely; misses are
+        verified on a worker thread so RSA checks and key fetches stay off the event loop.
+
+        :param max_size: Maximum number of cached tokens, least recently used evicted first
+        :param window: Number of recent auth timings kept for the metrics summary
+        """
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.auth_times = deque(maxlen=window)
+        self.verify_times = deque(maxlen=window)
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(id_token: str) -> str:
+        return hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+    async def get_token_data(self, id_token: str) -> dict | None:
+        """
+        Returns the user data for a valid token
+
+        :param id_token: Firebase ID token
+        :return: User data dictionary, or None if the token is invalid or expired
+        """
+        start = time.perf_counter()
+        key = self._key(id_token)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, user_data = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.auth_times.append(time.perf_counter() - start)
+                return user_data
+            del self._entries[key]
+        self.misses += 1
+        decoded_token = await asyncio.to_thread(decode_token, id_token)
+        elapsed = time.perf_counter() - start
+        self.verify_times.append(elapsed)
+        self.auth_times.append(elapsed)
+        if not decoded_token:
+            self.rejected += 1
+            return None
+        user_data = user_data_from_token(decoded_token)
+        self._entries[key] = (decoded_token["exp"], user_data)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return user_data
+
+    def clear(self):
+        self._entries.clear()
+
+    @staticmethod
+    def _summary(samples) -> dict:
+        samples = sorted(samples)
+        if not samples:
+            return {"samples": 0, "mean_ms": 0.0, "p99_ms": 0.0}
+        return {
+            "samples": len(samples),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+            "p99_ms": round(samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000, 3),
+        }
+
+    def get_stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "auth": self._summary(self.auth_times),
+            "verify": self._summary(self.verify_times),
+        }
+
+    async def refresh_keys_loop(self, interval: float):
+        while True:
+            try:
+                await asyncio.to_thread(signing_keys.refresh)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Could not refresh token signing keys: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def start(self, key_refresh_interval: float = 3600.0):
+        if self._task is None:
+            self._task = asyncio.create_task(self.refresh_keys_loop(key_refresh_interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+token_cache = TokenCache(max_size=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000")))
@@ -0,0 +1,51 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if hasattr(obj, "tolist"):  # numpy scalars and arrays
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps_bytes(obj) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+else:
+    def dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    loads = json.loads
+
+
+def dumps(obj) -> str:
+    """
+    Serializes an object to compact JSON text, using orjson when it's installed
+
+    :param obj: JSON-serializable object; Decimals, datetimes and numpy values are converted
+    :return: JSON string
+    """
+    return dumps_bytes(obj).decode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the fast encoder"""
+
+    def render(self, content) -> bytes:
+        return dumps_bytes(content)
@@ -0,0 +1,47 @@
+import asyncio
+import time
+from collections import deque
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.5, window: int = 120):
+        """
+        Measures event-loop lag: how late a sleep wakes up compared to when it was due.
+        Anything blocking the loop (sync I/O, heavy CPU work) shows up as lag.
+
+        :param interval: Seconds between samples
+        :param window: Number of recent samples kept for the summary
+        """
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - expected, 0.0)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def get_stats(self) -> dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"samples": 0, "mean_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        return {
+            "samples": len(samples),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+            "p99_ms": round(samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000, 3),
+            "max_ms": round(self.max_lag * 1000, 3),
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,74 @@
+"""
+Latency of a stored history request (BarStore.get_bars plus JSON encoding) for multi-year
+1d and 1h ranges, against building and serializing a DataFrame of the same bars as a
+yf.download call would on every request (network time excluded).
+
+Bars are synthetic and written to a temporary directory. Usage (from the api directory):
+
+    python -m benchmarks.bench_bar_store --years 20 --repeats 50
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+from app.core.bar_store import BarStore
+from app.utils.json_utils import dumps_bytes
+
+NOW = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def synthetic(step: int, count: int):
+    def fetch(symbol, interval, start, end):
+        ts = int(NOW.timestamp()) - step * np.arange(count, dtype=np.int64)[::-1]
+        ts = ts[ts >= int(start.timestamp())]
+        close = 100 + np.cumsum(np.random.default_rng(0).normal(0, 1, len(ts)))
+        return {"ts": ts, "open": close, "high": close + 1, "low": close - 1, "close": close, "volume": np.full(len(ts), 1e6)}
+    return fetch
+
+
+def dataframe_request(bars: dict) -> bytes:
+    frame = pd.DataFrame({column.capitalize(): values for column, values in bars.items() if column != "ts"},
+                         index=pd.to_datetime(bars["ts"], unit="s", utc=True))
+    frame = frame.dropna(subset=["Close"])
+    return dumps_bytes({"bars": {column.lower(): frame[column].tolist() for column in frame.columns}})
+
+
+async def measure(interval: str, step: int, span: timedelta, repeats: int) -> dict:
+    count = int(span.total_seconds() // step)
+    with tempfile.TemporaryDirectory() as path:
+        store = BarStore(path=path, fetch=synthetic(step, count))
+        start = NOW - span
+        bars = await store.get_bars("BENCH", interval=interval, start=start)
+        stored, dataframe = [], []
+        for _ in range(repeats):
+            t = time.perf_counter()
+            dumps_bytes({"bars": await store.get_bars("BENCH", interval=interval, start=start)})
+            stored.append((time.perf_counter() - t) * 1000)
+            t = time.perf_counter()
+            dataframe_request(bars)
+            dataframe.append((time.perf_counter() - t) * 1000)
+        return {"bars": len(bars["ts"]), "stored": statistics.median(stored), "dataframe": statistics.median(dataframe),
+                "fetches": store.stats["refreshes"]}
+
+
+async def main(args):
+    cases = {
+        "1d": (86400, timedelta(days=365 * args.years)),
+        "1h": (3600, timedelta(days=720)),
+    }
+    print(f"median of {args.repeats} requests")
+    print(f"{'interval':>8} {'bars':>8} {'stored':>10} {'dataframe':>11} {'fetches':>8}")
+    for interval, (step, span) in cases.items():
+        result = await measure(interval, step, span, args.repeats)
+        print(f"{interval:>8} {result['bars']:>8} {result['stored']:>8.2f}ms {result['dataframe']:>9.2f}ms {result['fetches']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+"""
+Orders per second through /api/trades/send (one request per order) versus
+/api/trades/batch (one request per basket).
+
+Runs in-process against a minimal app exposing the two routes the same way main.py does,
+over httpx's ASGI transport. Settlement is simulated with a fixed commit latency per
+transaction and fills take --latency seconds, so no database is needed. Usage (from the
+api directory):
+
+    python -m benchmarks.bench_batch_orders --orders 2000 --basket 200
+"""
+import argparse
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+import httpx
+from fastapi import FastAPI, Request
+from app.core.trade_processing import TradeSystem
+from app.schemas.trade_request import TradeRequest, BatchTradeRequest
+
+
+def build_app(trade_system: TradeSystem) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/trades/send")
+    async def send(request: Request, trade_request: TradeRequest):
+        trade = await trade_system.submit_order(trader_id="bench_trader", **trade_request.model_dump())
+        return {"trade_id": trade.id}
+
+    @app.post("/api/trades/batch")
+    async def batch(request: Request, batch_request: BatchTradeRequest):
+        trades = await trade_system.submit_many("bench_trader", [order.model_dump() for order in batch_request.orders])
+        return {"trade_ids": [trade.id for trade in trades]}
+
+    return app
+
+
+def order(i: int) -> dict:
+    return {"ticker": f"SYM{i % 50}", "quantity": 1, "price": 10.0, "trade_type": "buy"}
+
+
+async def run(args, batched: bool) -> dict:
+    transactions = 0
+
+    async def settle(fills, session, ledger=None):
+        nonlocal transactions
+        transactions += 1
+        await asyncio.sleep(args.commit_ms / 1000)
+        return [{"trader": None, "error": None} for _ in fills]
+
+    ws_manager = MagicMock()
+    ws_manager.notify = AsyncMock()
+    ws_manager.recipients.return_value = set()
+    trade_system = TradeSystem(sessionmaker=MagicMock(return_value=AsyncMock()), num_processors=4,
+                               max_pending=args.orders, tick_interval=0.01)
+    with patch("app.core.trade_processing.settle_trades", side_effect=settle), \
+            patch("app.core.trade_processing.random.uniform", return_value=args.latency):
+        await trade_system.start(ws_manager=ws_manager, notification_service=AsyncMock())
+        transport = httpx.ASGITransport(app=build_app(trade_system))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            if batched:
+                for offset in range(0, args.orders, args.basket):
+                    body = {"orders": [order(i) for i in range(offset, min(offset + args.basket, args.orders))]}
+                    (await client.post("/api/trades/batch", json=body)).raise_for_status()
+            else:
+                for i in range(args.orders):
+                    (await client.post("/api/trades/send", json=order(i))).raise_for_status()
+            submitted = time.perf_counter() - start
+            await trade_system.process_all_orders()
+            settled = time.perf_counter() - start
+        await trade_system.shutdown()
+    return {"submit": args.orders / submitted, "end_to_end": args.orders / settled, "transactions": transactions}
+
+
+async def main(args):
+    print(f"orders={args.orders} basket={args.basket} latency={args.latency}s commit={args.commit_ms}ms")
+    for label, batched in (("single", False), ("batch", True)):
+        result = await run(args, batched)
+        print(f"{label:<7} submit: {result['submit']:9.0f} orders/s  end-to-end: {result['end_to_end']:9.0f} orders/s"
+              f"  settle transactions: {result['transactions']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--basket", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated fill latency in seconds")
+    parser.add_argument("--commit-ms", type=float, default=2.0, help="Simulated commit latency per transaction")
+    asyncio.run(main(parser.parse_args()))
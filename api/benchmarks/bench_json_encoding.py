@@ -0,0 +1,84 @@
+"""
+Microbenchmark of JSON encode cost per broadcast.
+
+Compares what send_json used to do (stdlib json.dumps once per client) with the
+serialize-once path used by WebsocketManager (one dumps, same payload queued for every
+client). Usage (from the api directory):
+
+    python -m benchmarks.bench_json_encoding --clients 1000 --rounds 200
+"""
+import argparse
+import asyncio
+import json
+import time
+from app.core.websocket_manager import WebsocketManager
+from app.utils import json_utils
+
+
+class IdleWebSocket:
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload):
+        await asyncio.Event().wait()  # Never completes, so queued frames stay queued
+
+    async def close(self):
+        pass
+
+
+def sample_message(trades: int) -> dict:
+    return {
+        "event": "trade_progress_batch",
+        "trades": [
+            {
+                "event": "trade_progress",
+                "trade_id": f"00000000-0000-0000-0000-{i:012d}",
+                "trader_id": "fusvH9xzOncbwYY3rsdYOmoztet1",
+                "ticker": "AAPL",
+                "quantity": 10,
+                "progress": 42.5,
+                "status": "in_progress",
+            }
+            for i in range(trades)
+        ],
+    }
+
+
+def report(label: str, elapsed: float, rounds: int):
+    print(f"{label:<34} {elapsed / rounds * 1000:8.3f} ms per broadcast")
+
+
+async def main(args):
+    message = sample_message(args.trades)
+    print(f"clients={args.clients} rounds={args.rounds} payload={len(json_utils.dumps(message))} bytes "
+          f"encoder={'orjson' if json_utils.orjson is not None else 'json'}")
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for _ in range(args.clients):
+            json.dumps(message)
+    report("json.dumps per client (send_json)", time.perf_counter() - start, args.rounds)
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        json_utils.dumps(message)
+    report("serialize once", time.perf_counter() - start, args.rounds)
+
+    manager = WebsocketManager(max_queue_size=args.rounds + 1)
+    for i in range(args.clients):
+        await manager.connect(IdleWebSocket(), f"trader_{i}")
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        await manager.broadcast(message)
+    report("WebsocketManager.broadcast", time.perf_counter() - start, args.rounds)
+    for i in range(args.clients):
+        await manager.disconnect(f"trader_{i}")
+    await asyncio.sleep(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--trades", type=int, default=5, help="Trades per progress batch frame")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,53 @@
+"""
+Offline load test for the market-data hub using the seeded random-walk price source.
+
+No network or database is needed: subscribers are fake websocket managers that
+only count frames. Usage (from the api directory):
+
+    python -m benchmarks.bench_market_data --traders 10000 --tickers 200 --polls 20
+"""
+import argparse
+import asyncio
+import random
+import time
+from app.core.market_data import MarketDataStreamer
+from app.core.price_provider import PriceProvider
+from app.core.price_sources import RandomWalkSource
+from app.core.stock_search import QuoteCache
+
+
+class CountingWebsocketManager:
+    def __init__(self):
+        self.frames = 0
+
+    async def notify(self, trader_id, message, payload=None):
+        self.frames += 1
+        return True
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    universe = [f"SYM{i:04d}" for i in range(args.tickers)]
+    provider = PriceProvider(cache=QuoteCache(ttl=0), source=RandomWalkSource(seed=args.seed))
+    streamer = MarketDataStreamer(price_provider=provider)
+    streamer.ws_manager = CountingWebsocketManager()
+    for i in range(args.traders):
+        streamer.subscribe(f"trader_{i}", rng.sample(universe, k=min(args.watchlist, len(universe))))
+
+    start = time.perf_counter()
+    for _ in range(args.polls):
+        await streamer.poll_once()
+    elapsed = time.perf_counter() - start
+    provider.shutdown()
+    print(f"traders={args.traders} tickers={len(streamer.ticker_refs)} polls={args.polls}")
+    print(f"per poll: {elapsed / args.polls * 1000:8.2f} ms, frames/s: {streamer.ws_manager.frames / elapsed:10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traders", type=int, default=10000)
+    parser.add_argument("--tickers", type=int, default=200)
+    parser.add_argument("--watchlist", type=int, default=5)
+    parser.add_argument("--polls", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
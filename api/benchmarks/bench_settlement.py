@@ -0,0 +1,101 @@
+"""
+Compares settlement throughput of the per-trade path (update_on_trade) with
+group-commit batches (settle_trades), with and without the in-memory trader ledger.
+
+Runs against the database in SUPABASE_CONNECTION_STRING and cleans up the
+traders it creates. update_on_trade values the portfolio at the latest quotes, so
+use the simulated price source to keep downloads out of the measurement. Usage
+(from the api directory):
+
+    PRICE_SOURCE=random_walk python -m benchmarks.bench_settlement --trades 2000 --traders 50 --batch-size 100
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from sqlalchemy import delete
+from app.db.database_connection import engine, Base, AsyncSessionLocal
+from app.db.trader_store import update_on_trade, settle_trades
+from app.models.tables import Trader, Holding, Trade
+from app.core.trader_ledger import TraderLedger
+
+SYMBOLS = ["AAPL", "MSFT", "GOOGL", "AMZN", "NVDA", "META", "TSLA", "JPM"]
+
+
+def make_fills(trader_ids, num_trades, seed):
+    rng = random.Random(seed)
+    fills = []
+    for _ in range(num_trades):
+        fills.append({
+            "trader_id": rng.choice(trader_ids),
+            "trade_type": "buy",
+            "quantity": rng.randint(1, 5),
+            "price": round(rng.uniform(10, 50), 2),
+            "symbol": rng.choice(SYMBOLS),
+        })
+    return fills
+
+
+async def seed_traders(prefix, num_traders):
+    now = datetime.now(timezone.utc)
+    trader_ids = [f"{prefix}_{i}" for i in range(num_traders)]
+    async with AsyncSessionLocal() as session:
+        session.add_all([
+            Trader(id=trader_id, name=trader_id, status="online", notification_tokens=[],
+                   created_at=now, updated_at=now, last_seen_at=now, cash_balance=10_000_000.0)
+            for trader_id in trader_ids
+        ])
+        await session.commit()
+    return trader_ids
+
+
+async def cleanup(trader_ids):
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(Trade).where(Trade.trader_id.in_(trader_ids)))
+        await session.execute(delete(Holding).where(Holding.trader_id.in_(trader_ids)))
+        await session.execute(delete(Trader).where(Trader.id.in_(trader_ids)))
+        await session.commit()
+
+
+async def run_single(fills):
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as session:
+        for fill in fills:
+            await update_on_trade(session=session, **fill)
+    return len(fills) / (time.perf_counter() - start)
+
+
+async def run_batched(fills, batch_size, ledger=None):
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as session:
+        for i in range(0, len(fills), batch_size):
+            await settle_trades(fills[i:i + batch_size], session, ledger=ledger)
+    return len(fills) / (time.perf_counter() - start)
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    prefix = f"bench_settle_{int(time.time())}"
+    trader_ids = await seed_traders(prefix, args.traders)
+    try:
+        single_tps = await run_single(make_fills(trader_ids, args.trades, seed=1))
+        batched_tps = await run_batched(make_fills(trader_ids, args.trades, seed=2), args.batch_size)
+        ledger = TraderLedger()
+        ledger_tps = await run_batched(make_fills(trader_ids, args.trades, seed=3), args.batch_size, ledger=ledger)
+    finally:
+        await cleanup(trader_ids)
+        await engine.dispose()
+    print(f"trades={args.trades} traders={args.traders} batch_size={args.batch_size}")
+    print(f"per-trade update_on_trade: {single_tps:10.1f} trades/s")
+    print(f"batched settle_trades:     {batched_tps:10.1f} trades/s ({batched_tps / single_tps:.1f}x)")
+    print(f"batched with ledger:       {ledger_tps:10.1f} trades/s ({ledger_tps / single_tps:.1f}x), {ledger.get_stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trades", type=int, default=2000)
+    parser.add_argument("--traders", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
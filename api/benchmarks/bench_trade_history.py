@@ -0,0 +1,110 @@
+"""
+Page latency of GET /api/trades (get_trades) for a trader with a short history versus one
+with a very long history, at the first page and deep into the history. An OFFSET query
+over the same ordering is timed alongside for comparison.
+
+Seeds trades with INSERT ... SELECT generate_series against the database in
+SUPABASE_CONNECTION_STRING and cleans up afterwards. Usage (from the api directory):
+
+    python -m benchmarks.bench_trade_history --small 100 --large 1000000 --limit 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timezone
+from sqlalchemy import delete, select, text
+from app.db.database_connection import engine, Base, AsyncSessionLocal
+from app.db.trade_store import get_trades, encode_cursor
+from app.models.tables import Trader, Trade
+
+SEED_SQL = text("""
+    INSERT INTO trades (id, trader_id, symbol, quantity, price, trade_type, trade_date)
+    SELECT gen_random_uuid(), :trader_id,
+           (ARRAY['AAPL','MSFT','GOOGL','AMZN','NVDA','META','TSLA','JPM'])[1 + i % 8],
+           1 + i % 5, 10 + i % 90, CASE WHEN i % 3 = 0 THEN 'sell' ELSE 'buy' END,
+           now() - make_interval(secs => i)
+    FROM generate_series(1, :count) AS i
+""")
+
+
+async def seed(prefix: str, sizes: dict) -> list:
+    now = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as session:
+        session.add_all([Trader(id=f"{prefix}_{name}", created_at=now, updated_at=now) for name in sizes])
+        await session.commit()
+        for name, count in sizes.items():
+            await session.execute(SEED_SQL, {"trader_id": f"{prefix}_{name}", "count": count})
+        await session.commit()
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE trades"))
+    return [f"{prefix}_{name}" for name in sizes]
+
+
+async def cleanup(trader_ids: list):
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(Trade).where(Trade.trader_id.in_(trader_ids)))
+        await session.execute(delete(Trader).where(Trader.id.in_(trader_ids)))
+        await session.commit()
+
+
+async def timed(coro_factory, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        await coro_factory()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def measure(trader_id: str, count: int, args) -> dict:
+    depth = max(0, int(count * 0.9) - 1)
+    async with AsyncSessionLocal() as session:
+        anchor = (await session.execute(
+            select(Trade.trade_date, Trade.id).where(Trade.trader_id == trader_id)
+            .order_by(Trade.trade_date.desc(), Trade.id.desc()).offset(depth).limit(1)
+        )).one()
+        cursor = encode_cursor(anchor.trade_date, str(anchor.id))
+
+        async def offset_page():
+            await session.execute(
+                select(Trade.id, Trade.symbol, Trade.quantity, Trade.price, Trade.trade_type, Trade.trade_date)
+                .where(Trade.trader_id == trader_id)
+                .order_by(Trade.trade_date.desc(), Trade.id.desc()).offset(depth).limit(args.limit)
+            )
+
+        return {
+            "first": await timed(lambda: get_trades(trader_id, session, limit=args.limit), args.repeats),
+            "deep": await timed(lambda: get_trades(trader_id, session, cursor=cursor, limit=args.limit), args.repeats),
+            "filtered": await timed(lambda: get_trades(trader_id, session, cursor=cursor, limit=args.limit,
+                                                       symbol="NVDA", trade_type="sell"), args.repeats),
+            "offset": await timed(offset_page, args.repeats),
+        }
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(lambda sync_conn: [index.create(sync_conn, checkfirst=True) for index in Trade.__table__.indexes])
+    sizes = {"small": args.small, "large": args.large}
+    trader_ids = await seed(f"bench_history_{int(time.time())}", sizes)
+    try:
+        results = {name: await measure(trader_id, sizes[name], args) for name, trader_id in zip(sizes, trader_ids)}
+    finally:
+        await cleanup(trader_ids)
+        await engine.dispose()
+    print(f"limit={args.limit} median of {args.repeats} runs, deep pages start at 90% of the history")
+    print(f"{'trades':>10} {'first page':>12} {'deep page':>12} {'deep+filter':>12} {'deep OFFSET':>12}")
+    for name, result in results.items():
+        print(f"{sizes[name]:>10} {result['first']:>10.2f}ms {result['deep']:>10.2f}ms"
+              f" {result['filtered']:>10.2f}ms {result['offset']:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--small", type=int, default=100)
+    parser.add_argument("--large", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,111 @@
+import time
+from datetime import datetime, timedelta, timezone
+import orjson
+import pytest
+from unittest.mock import MagicMock, patch
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt
+from app.utils.auth_utils import ID_TOKEN_ISSUER_PREFIX, SigningKeys, TokenCache, decode_token, verify_id_token
+
+PROJECT = "test-project"
+
+
+def decoded(uid="trader_1", expires_in=3600):
+    now = int(time.time())
+    return {"uid": uid, "email": "a@b.c", "auth_time": now, "iat": now, "exp": now + expires_in}
+
+@pytest.mark.asyncio
+async def test_warm_token_skips_verification():
+    """Test that a cached token is answered without calling Firebase again."""
+    cache = TokenCache()
+    with patch("app.utils.auth_utils.decode_token", return_value=decoded()) as mock_decode:
+        first = await cache.get_token_data("token-a")
+        second = await cache.get_token_data("token-a")
+
+    mock_decode.assert_called_once_with("token-a")
+    assert first == second
+    assert first["uid"] == "trader_1" and first["admin"] is False
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+    assert stats["auth"]["samples"] == 2
+    assert "token-a" not in str(cache._entries)  # Only the hash is kept
+
+@pytest.mark.asyncio
+async def test_expired_and_invalid_tokens_are_verified_again():
+    """Test that entries expire at the token's exp and invalid tokens are never cached."""
+    cache = TokenCache()
+    with patch("app.utils.auth_utils.decode_token", return_value=decoded(expires_in=-1)) as mock_decode:
+        await cache.get_token_data("token-a")
+        await cache.get_token_data("token-a")
+    assert mock_decode.call_count == 2
+
+    with patch("app.utils.auth_utils.decode_token", return_value=None) as mock_decode:
+        assert await cache.get_token_data("bad") is None
+        assert await cache.get_token_data("bad") is None
+    assert mock_decode.call_count == 2
+    assert cache.get_stats()["rejected"] == 2
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used():
+    cache = TokenCache(max_size=2)
+    with patch("app.utils.auth_utils.decode_token", side_effect=lambda token: decoded(uid=token)):
+        await cache.get_token_data("a")
+        await cache.get_token_data("b")
+        await cache.get_token_data("a")
+        await cache.get_token_data("c")
+    assert cache._key("a") in cache._entries
+    assert cache._key("b") not in cache._entries
+
+
+def signing_cert():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.system.gserviceaccount.com")])
+    now = datetime.now(timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(1).not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    private = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    return private, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+PRIVATE_KEY, CERT = signing_cert()
+
+def transport(max_age="max-age=600"):
+    response = MagicMock(status=200, data=orjson.dumps({"key-1": CERT}), headers={"cache-control": f"public, {max_age}"})
+    return MagicMock(return_value=response)
+
+def id_token(key_id="key-1", **claims):
+    now = int(time.time())
+    payload = {"iss": ID_TOKEN_ISSUER_PREFIX + PROJECT, "aud": PROJECT, "sub": "trader_1", "auth_time": now,
+               "iat": now, "exp": now + 3600, **claims}
+    return jwt.encode(crypt.RSASigner.from_string(PRIVATE_KEY, key_id), payload).decode()
+
+def test_signing_keys_are_fetched_once_per_max_age():
+    request = transport()
+    keys = SigningKeys(request=request)
+    assert keys.get() == keys.get() == {"key-1": CERT}
+    request.assert_called_once()
+    assert request.call_args.kwargs["headers"] == {"Cache-Control": "no-cache"}
+
+    keys._expires_at = time.time() - 1
+    keys.get()
+    assert keys.fetches == 2
+
+def test_id_tokens_are_verified_against_the_fetched_keys():
+    keys = SigningKeys(request=transport())
+    claims = verify_id_token(id_token(), keys=keys, project_id=PROJECT)
+    assert claims["uid"] == "trader_1"
+
+    for token in [id_token(aud="other-project"), id_token(iss=ID_TOKEN_ISSUER_PREFIX + "other-project"),
+                  id_token(sub=""), id_token(exp=int(time.time()) - 600), id_token(key_id="unknown"), "not-a-token"]:
+        with pytest.raises(ValueError):
+            verify_id_token(token, keys=keys, project_id=PROJECT)
+
+def test_decode_token_rejects_invalid_tokens():
+    keys = SigningKeys(request=transport())
+    with patch("app.utils.auth_utils.signing_keys", keys), \
+            patch("firebase_admin.get_app", return_value=MagicMock(project_id=PROJECT)):
+        assert decode_token(id_token())["uid"] == "trader_1"
+        assert decode_token(id_token(aud="other-project")) is None
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+from app.core.bar_store import BarStore, COLUMNS
+
+DAY = 86400
+T0 = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeSource:
+    """Daily bars from T0 on, close = day number; records every fetch"""
+
+    def __init__(self, days: int):
+        self.days = days
+        self.calls = []
+
+    def __call__(self, symbol, interval, start, end):
+        self.calls.append((symbol, interval, start))
+        ts = int(T0.timestamp()) + DAY * np.arange(self.days, dtype=np.int64)
+        ts = ts[ts >= int(start.timestamp())]
+        close = (ts - int(T0.timestamp())) // DAY + 0.5
+        return {"ts": ts, "open": close, "high": close + 1, "low": close - 1, "close": close, "volume": close * 100}
+
+
+def expire(store: BarStore):
+    store._refreshed.clear()
+
+
+@pytest.mark.asyncio
+async def test_repeated_requests_are_served_from_the_mapped_files(tmp_path):
+    """Test that a fresh series is read without fetching and ranges are views over the memory-mapped columns."""
+    source = FakeSource(days=100)
+    store = BarStore(path=str(tmp_path), fetch=source)
+
+    bars = await store.get_bars("aapl", start=T0)
+    assert len(source.calls) == 1 and len(bars["ts"]) == 100
+    assert (tmp_path / "1d" / "AAPL" / "close.bin").stat().st_size == 100 * 8
+
+    window = await store.get_bars("AAPL", start=T0 + timedelta(days=10), end=T0 + timedelta(days=20))
+    assert len(source.calls) == 1
+    assert window["close"].tolist() == [day + 0.5 for day in range(10, 20)]
+    mapped = store.columns("AAPL", "1d")
+    assert all(np.shares_memory(window[column], mapped[column]) for column in COLUMNS)
+    assert store.get_stats() == {"series": 1, "evicted": 0, "hits": 1, "misses": 0, "refreshes": 1, "fetched_bars": 100, "fetch_errors": 0}
+
+
+@pytest.mark.asyncio
+async def test_refresh_fetches_only_new_bars_and_rewrites_the_last_one(tmp_path):
+    source = FakeSource(days=10)
+    store = BarStore(path=str(tmp_path), fetch=source)
+    await store.get_bars("AAPL", start=T0)
+
+    source.days = 13
+    expire(store)
+    bars = await store.get_bars("AAPL", start=T0)
+
+    assert source.calls[-1][2] == T0 + timedelta(days=9)  # From the last stored bar, which may have been forming
+    assert store.stats["fetched_bars"] == 10 + 4
+    assert bars["ts"].tolist() == [int(T0.timestamp()) + DAY * day for day in range(13)]
+    assert bars["close"].tolist() == [day + 0.5 for day in range(13)]
+
+
+@pytest.mark.asyncio
+async def test_older_start_reloads_unless_the_source_has_nothing_older(tmp_path):
+    source = FakeSource(days=30)
+    store = BarStore(path=str(tmp_path), fetch=source)
+    await store.get_bars("AAPL", start=T0 + timedelta(days=20))
+
+    bars = await store.get_bars("AAPL", start=T0)
+    assert source.calls[-1][2] == T0 and len(bars["ts"]) == 30
+
+    # Nothing exists before T0: the first request for more history has to ask, repeats don't
+    for _ in range(2):
+        bars = await store.get_bars("AAPL", start=T0 - timedelta(days=365))
+        assert len(source.calls) == 3 and len(bars["ts"]) == 30
+
+
+@pytest.mark.asyncio
+async def test_fetch_errors_serve_stored_bars(tmp_path):
+    source = FakeSource(days=5)
+    store = BarStore(path=str(tmp_path), fetch=source)
+    await store.get_bars("AAPL", start=T0)
+
+    store.fetch = lambda *args: (_ for _ in ()).throw(ConnectionError("offline"))
+    expire(store)
+    bars = await store.get_bars("AAPL", start=T0)
+    assert len(bars["ts"]) == 5 and store.stats["fetch_errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_naive_times_and_unknown_interval(tmp_path):
+    store = BarStore(path=str(tmp_path), fetch=FakeSource(days=5))
+    bars = await store.get_bars("AAPL", start=datetime(2020, 1, 2), end=datetime(2020, 1, 4))
+    assert len(bars["ts"]) == 2
+
+    with pytest.raises(ValueError, match="Unsupported interval"):
+        await store.get_bars("AAPL", interval="3d")
+
+
+@pytest.mark.asyncio
+async def test_symbols_cannot_escape_the_store(tmp_path):
+    root = tmp_path / "store"
+    store = BarStore(path=str(root), fetch=FakeSource(days=5))
+    for symbol in ["../../escaped", "..", "AAPL/../MSFT", "", "A" * 16]:
+        with pytest.raises(ValueError, match="Invalid symbol"):
+            await store.get_bars(symbol, start=T0)
+    assert list(tmp_path.iterdir()) == []
+    for symbol in ["BRK-B", "^GSPC", "EURUSD=X", "RDS.A"]:
+        assert len((await store.get_bars(symbol, start=T0))["ts"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_only_recent_series_stay_mapped(tmp_path):
+    source = FakeSource(days=5)
+    store = BarStore(path=str(tmp_path), fetch=source, max_series=2)
+    for symbol in ["AAPL", "MSFT", "NVDA", "AAPL"]:
+        await store.get_bars(symbol, start=T0)
+
+    assert set(store._maps) == set(store._series) == {("NVDA", "1d"), ("AAPL", "1d")}
+    assert store.get_stats()["evicted"] == 2
+    assert len(source.calls) == 4  # AAPL was evicted, so it was refreshed (incrementally) again
+    assert source.calls[-1][2] == T0 + timedelta(days=4)
+
+
+@pytest.mark.asyncio
+async def test_unknown_symbols_write_nothing_and_are_remembered(tmp_path):
+    """Test that a symbol the source has no bars for leaves no trace on disk and isn't fetched again until the miss expires."""
+    source = FakeSource(days=0)
+    store = BarStore(path=str(tmp_path), fetch=source, miss_ttl=60.0)
+    for _ in range(3):
+        bars = await store.get_bars("NOPE", start=T0)
+        assert len(bars["ts"]) == 0
+    assert len(source.calls) == 1
+    assert list(tmp_path.iterdir()) == []
+    assert store.get_stats()["misses"] == 2
+
+    source.days = 5
+    store._misses[("NOPE", "1d")] -= 61
+    assert len((await store.get_bars("NOPE", start=T0))["ts"]) == 5
+    assert len(source.calls) == 2  # The listing's first bars are written from the fetch that found them
+    assert (tmp_path / "1d" / "NOPE" / "ts.bin").stat().st_size == 5 * 8
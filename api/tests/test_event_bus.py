@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import tempfile
+import pytest
+import pytest_asyncio
+from app.core.event_bus import EventBroker, LocalEventBus, SocketEventBus
+from app.core.websocket_manager import WebsocketManager, WebsocketRelay
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload):
+        self.sent.append(json.loads(payload))
+
+    async def close(self):
+        pass
+
+
+async def wait_for(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("Condition not met in time")
+        await asyncio.sleep(0.01)
+
+@pytest_asyncio.fixture
+async def broker():
+    path = os.path.join(tempfile.mkdtemp(), "events.sock")
+    broker = EventBroker(path)
+    await broker.start()
+    yield broker
+    await broker.stop()
+
+@pytest.mark.asyncio
+async def test_local_bus_dispatches_in_process():
+    bus = LocalEventBus()
+    received = []
+
+    async def handler(message, origin):
+        received.append((message, origin))
+
+    bus.subscribe("prices", handler)
+    await bus.publish("prices", {"ticker": "AAPL"})
+    await bus.publish("other", {"ticker": "MSFT"})
+    assert received == [({"ticker": "AAPL"}, None)]
+
+@pytest.mark.asyncio
+async def test_relay_delivers_to_trader_on_another_worker(broker):
+    """Test that a message sent from worker A reaches a socket held by worker B through the broker."""
+    bus_a, bus_b = SocketEventBus(broker.path), SocketEventBus(broker.path)
+    relay_a = WebsocketRelay(WebsocketManager(), bus_a, "trade_progress")
+    relay_b = WebsocketRelay(WebsocketManager(), bus_b, "trade_progress")
+    await bus_a.start()
+    await bus_b.start()
+
+    socket = FakeWebSocket()
+    await relay_b.connect(socket, "trader_1")
+    await wait_for(lambda: "trader_1" in relay_a.remote)
+
+    assert await relay_a.notify("trader_1", {"event": "trade_completed", "trade_id": "t1"}, guaranteed=True)
+    assert not await relay_a.notify("nobody", {"event": "trade_completed"})
+    await wait_for(lambda: socket.sent)
+    assert socket.sent == [{"event": "trade_completed", "trade_id": "t1"}]
+    assert relay_a.get_stats()["relayed"] == 1
+
+    await relay_b.disconnect("trader_1", socket)
+    await wait_for(lambda: "trader_1" not in relay_a.remote)
+    assert not await relay_a.notify("trader_1", {"event": "trade_completed"})
+
+    # Shutdown closes the remaining sockets and tells the other workers
+    await relay_b.connect(FakeWebSocket(), "trader_2")
+    await wait_for(lambda: "trader_2" in relay_a.remote)
+    await relay_b.close_all()
+    assert not relay_b.ws_manager.clients
+    await wait_for(lambda: "trader_2" not in relay_a.remote)
+
+    await bus_a.stop()
+    await bus_b.stop()
+
+@pytest.mark.asyncio
+async def test_late_worker_syncs_presence_and_peer_exit_clears_it(broker):
+    """Test that a worker joining later learns existing connections and forgets them when that worker exits."""
+    bus_b = SocketEventBus(broker.path)
+    relay_b = WebsocketRelay(WebsocketManager(), bus_b, "market_data")
+    await bus_b.start()
+    await relay_b.connect(FakeWebSocket(), "trader_1")
+
+    bus_a = SocketEventBus(broker.path)
+    relay_a = WebsocketRelay(WebsocketManager(), bus_a, "market_data")
+    await bus_a.start()
+    await wait_for(lambda: relay_a.has_active_connection("trader_1"))
+
+    await bus_b.stop()
+    await wait_for(lambda: not relay_a.has_active_connection("trader_1"))
+    await bus_a.stop()
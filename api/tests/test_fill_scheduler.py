@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from app.core.fill_scheduler import FillScheduler
+from app.core.trade_processing import Stock, StockTrade
+
+
+def make_trade(trader_id: str, latency: float) -> StockTrade:
+    trade = StockTrade(trader_id, Stock("AAPL", 190.50), 1, "buy")
+    trade.latency = latency
+    return trade
+
+@pytest.mark.asyncio
+async def test_scheduler_tracks_many_trades_on_one_clock():
+    """Test that thousands of in-flight trades fill from a single scheduler task."""
+    progress_batches = []
+    filled = []
+
+    async def on_progress(trades):
+        progress_batches.append(len(trades))
+
+    async def on_fill(trade):
+        filled.append(trade)
+
+    scheduler = FillScheduler(on_progress=on_progress, on_fill=on_fill, tick_interval=0.02)
+    trades = [make_trade(f"trader_{i}", 0.1) for i in range(2000)]
+    for trade in trades:
+        scheduler.schedule(trade)
+    assert len(scheduler) == 2000
+
+    scheduler.start()
+    await asyncio.sleep(0.3)
+    await scheduler.stop()
+
+    assert len(filled) == 2000
+    assert all(trade.status == "completed" for trade in filled)
+    assert max(progress_batches) == 2000
+    assert len(scheduler) == 0
+
+@pytest.mark.asyncio
+async def test_scheduler_keeps_trader_fills_in_submission_order():
+    """Test that a faster later order waits for the same trader's earlier order."""
+    filled = []
+
+    async def on_fill(trade):
+        filled.append(trade)
+
+    scheduler = FillScheduler(on_progress=lambda trades: asyncio.sleep(0), on_fill=on_fill, tick_interval=0.02)
+    slow = make_trade("trader_a", 0.1)
+    fast = make_trade("trader_a", 0.01)
+    other = make_trade("trader_b", 0.01)
+    for trade in (slow, fast, other):
+        scheduler.schedule(trade)
+
+    scheduler.start()
+    await asyncio.sleep(0.2)
+    await scheduler.stop()
+
+    assert filled == [other, slow, fast]
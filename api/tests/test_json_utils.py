@@ -0,0 +1,27 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+import numpy as np
+from app.utils.json_utils import dumps, FastJSONResponse
+
+
+def test_dumps_handles_app_types():
+    """Test that Decimals, datetimes and numpy values encode to plain JSON."""
+    created_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    encoded = dumps({
+        "cash_balance": Decimal("10.5"),
+        "created_at": created_at,
+        "value": np.float64(1.25),
+        "prices": np.array([1.0, 2.0]),
+    })
+    decoded = json.loads(encoded)
+    assert decoded["cash_balance"] == 10.5
+    assert datetime.fromisoformat(decoded["created_at"]) == created_at
+    assert decoded["value"] == 1.25
+    assert decoded["prices"] == [1.0, 2.0]
+
+def test_fast_json_response_renders_bytes():
+    response = FastJSONResponse(status_code=201, content={"message": "ok", "holdings": []})
+    assert response.status_code == 201
+    assert json.loads(response.body) == {"message": "ok", "holdings": []}
+    assert response.headers["content-type"] == "application/json"
@@ -0,0 +1,83 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.core.market_data import MarketDataStreamer
+from app.core.tick_buffer import TickStore
+
+
+def fake_quotes(tickers):
+    return [{"ticker": ticker, "price": 100.0, "date": "2025-01-01 00:00:00"} for ticker in tickers]
+
+def fake_provider():
+    provider = AsyncMock()
+    provider.get_quotes.side_effect = lambda tickers: {quote["ticker"]: quote for quote in fake_quotes(tickers)}
+    return provider
+
+@pytest.mark.asyncio
+async def test_hub_polls_union_of_tickers_once():
+    """Test that one batched download serves every subscriber with only its own tickers."""
+    provider = fake_provider()
+    streamer = MarketDataStreamer(price_provider=provider)
+    streamer.ws_manager = AsyncMock()
+    streamer.ws_manager.notify.return_value = True
+    for i in range(1000):
+        streamer.subscribe(f"trader_{i}", ["AAPL"])
+    streamer.subscribe("trader_x", ["AAPL", "MSFT", "AAPL"])
+
+    await streamer.poll_once()
+
+    provider.get_quotes.assert_awaited_once_with(["AAPL", "MSFT"])
+    assert streamer.ws_manager.notify.await_count == 1001
+    calls = {call.args[0]: call for call in streamer.ws_manager.notify.await_args_list}
+    assert calls["trader_x"].args[1] == fake_quotes(["AAPL", "MSFT"])
+    assert json.loads(calls["trader_x"].kwargs["payload"]) == fake_quotes(["AAPL", "MSFT"])
+    assert json.loads(calls["trader_0"].kwargs["payload"]) == fake_quotes(["AAPL"])
+    # Traders watching the same list share one encoded frame
+    assert calls["trader_0"].kwargs["payload"] is calls["trader_999"].kwargs["payload"]
+
+def test_hub_ref_counts_tickers():
+    """Test that a ticker stays registered until its last subscriber leaves."""
+    streamer = MarketDataStreamer()
+    streamer.subscribe("trader_a", ["AAPL", "MSFT"])
+    streamer.subscribe("trader_b", ["AAPL"])
+    assert streamer.ticker_refs == {"AAPL": 2, "MSFT": 1}
+
+    streamer.subscribe("trader_a", ["GOOGL"])  # Replaces the previous watch list
+    assert streamer.ticker_refs == {"AAPL": 1, "GOOGL": 1}
+
+    streamer.unsubscribe("trader_b")
+    streamer.unsubscribe("trader_b")
+    assert streamer.ticker_refs == {"GOOGL": 1}
+    assert streamer.get_stats() == {"subscribers": 1, "tickers": 1, "polls": 0}
+
+@pytest.mark.asyncio
+async def test_hub_drops_subscribers_without_connection():
+    """Test that a subscriber whose socket is gone is unsubscribed."""
+    streamer = MarketDataStreamer(price_provider=fake_provider())
+    streamer.ws_manager = AsyncMock()
+    streamer.ws_manager.notify.return_value = False
+    streamer.ws_manager.has_active_connection = MagicMock(side_effect=lambda trader_id: trader_id == "trader_b")
+    streamer.subscribe("trader_a", ["AAPL"])
+    streamer.subscribe("trader_b", ["AAPL"])  # Connected, its frame was only dropped from a full queue
+
+    await streamer.poll_once()
+
+    assert set(streamer.subscriptions) == {"trader_b"}
+    assert streamer.ticker_refs == {"AAPL": 1}
+
+@pytest.mark.asyncio
+async def test_hub_records_polled_prices_as_ticks():
+    """Test that every polled price lands in the tick store so intraday bars need no extra provider call."""
+    provider = fake_provider()
+    tick_store = TickStore(capacity=10)
+    streamer = MarketDataStreamer(price_provider=provider, tick_store=tick_store)
+    streamer.ws_manager = AsyncMock()
+    streamer.ws_manager.notify.return_value = True
+    streamer.subscribe("trader_a", ["AAPL"])
+
+    await streamer.poll_once()
+    await streamer.poll_once()
+
+    bars = tick_store.bars("aapl", interval="1m")
+    assert bars["close"].tolist() == [100.0] and bars["ticks"].sum() == 2
+    assert provider.get_quotes.await_count == 2
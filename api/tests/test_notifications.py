@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.core.notifications import NotificationService
+from app.core.push_sinks import StubPushSink
+from app.core.trade_processing import StockTrade, Stock
+
+
+def make_trader(trader_id="trader_1", status="offline", tokens=("device_a",)):
+    trader = MagicMock()
+    trader.id = trader_id
+    trader.status = status
+    trader.notification_tokens = list(tokens)
+    return trader
+
+def make_sessionmaker():
+    session = AsyncMock()
+    sessionmaker = MagicMock()
+    sessionmaker.return_value.__aenter__.return_value = session
+    return sessionmaker, session
+
+@pytest.mark.asyncio
+async def test_send_notification_only_queues():
+    """Test that settlement-side calls neither touch the database nor push."""
+    sessionmaker, session = make_sessionmaker()
+    sink = StubPushSink()
+    service = NotificationService(sessionmaker=sessionmaker, push_sink=sink)
+    ws_manager = AsyncMock()
+
+    trade = StockTrade(trader_id="trader_1", stock=Stock("AAPL", 100.0), quantity=5)
+    message = await service.send_notification(make_trader(status="online"), trade, ws_manager)
+    await service.send_notification(make_trader(), trade, ws_manager)
+
+    assert message["event"] == "trade_completed"
+    ws_manager.notify.assert_awaited_once_with("trader_1", message, guaranteed=True)
+    sessionmaker.assert_not_called()
+    assert sink.calls == 0
+    assert service.get_stats()["queued_rows"] == 2
+    assert service.get_stats()["queued_pushes"] == 1
+
+@pytest.mark.asyncio
+async def test_flush_bulk_inserts_and_multicasts_per_token():
+    """Test that one flush inserts all rows in one statement and collapses each device's pushes."""
+    sessionmaker, session = make_sessionmaker()
+    sink = StubPushSink()
+    service = NotificationService(sessionmaker=sessionmaker, push_sink=sink)
+    for i in range(20):
+        trade = StockTrade(trader_id="trader_1", stock=Stock("AAPL", 100.0), quantity=i + 1)
+        await service.send_notification(make_trader(tokens=("device_a", "device_b")), trade, AsyncMock())
+    trade = StockTrade(trader_id="trader_2", stock=Stock("MSFT", 100.0), quantity=1)
+    await service.send_notification(make_trader("trader_2", tokens=("device_c",)), trade, AsyncMock())
+
+    await service.flush()
+
+    session.execute.assert_awaited_once()
+    assert len(session.execute.await_args.args[1]) == 21
+    session.commit.assert_awaited_once()
+    # device_a and device_b get the same 20-trade summary in one multicast, device_c its own push
+    assert sink.calls == 2
+    pushes = dict(sink.sent)
+    assert pushes["device_a"] == pushes["device_b"]
+    assert pushes["device_a"]["body"] == "20 trades completed"
+    assert pushes["device_c"]["body"] == "1 MSFT"
+    assert service.get_stats()["inserted"] == 21
+
+@pytest.mark.asyncio
+async def test_failed_pushes_and_inserts_are_retried_with_backoff():
+    sessionmaker, session = make_sessionmaker()
+    session.execute.side_effect = [Exception("connection reset"), None]
+    sink = StubPushSink(fail_tokens={"device_a": 1})
+    service = NotificationService(sessionmaker=sessionmaker, push_sink=sink, flush_interval=0.001, retry_backoff=0.01)
+    service.start()
+    trade = StockTrade(trader_id="trader_1", stock=Stock("AAPL", 100.0), quantity=5)
+    await service.send_notification(make_trader(), trade, AsyncMock())
+
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if service.stats["inserted"] and sink.sent:
+            break
+    await service.stop()
+
+    stats = service.get_stats()
+    assert stats["inserted"] == 1
+    assert stats["retried"] == 2
+    assert [token for token, _ in sink.sent] == ["device_a"]
+    assert stats["failed"] == 0
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    service = NotificationService(push_sink=StubPushSink(fail_tokens={"device_a": 10}), max_retries=0)
+    trade = StockTrade(trader_id="trader_1", stock=Stock("AAPL", 100.0), quantity=5)
+    await service.send_notification(make_trader(), trade, AsyncMock())
+    service.rows.clear()
+    await service.flush()
+    assert service.get_stats()["failed"] == 1
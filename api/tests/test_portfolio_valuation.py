@@ -0,0 +1,135 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.core.market_data import MarketDataStreamer
+from app.core.portfolio_valuation import PortfolioValuator
+
+
+def holding(symbol, quantity):
+    return SimpleNamespace(symbol=symbol, quantity=quantity)
+
+
+def quote(price):
+    return {"price": price}
+
+
+def valuator_with(**portfolios):
+    ws_manager = AsyncMock()
+    ws_manager.notify.return_value = True
+    valuator = PortfolioValuator(ws_manager=ws_manager)
+    for trader_id, holdings in portfolios.items():
+        valuator.load(trader_id, 1000.0, [holding(symbol, quantity) for symbol, quantity in holdings.items()])
+    return valuator
+
+
+def test_ticks_only_touch_holders_of_the_quoted_symbol():
+    """Test that a quote updates value and P&L of the traders holding it and nobody else."""
+    valuator = valuator_with(a={"AAPL": 10, "MSFT": 1}, b={"MSFT": 2}, c={"TSLA": 5})
+    assert valuator.holders == {"AAPL": {"a"}, "MSFT": {"a", "b"}, "TSLA": {"c"}}
+
+    first = valuator.on_quotes({"AAPL": quote(100.0), "MSFT": quote(50.0), "NVDA": quote(1.0)})
+    assert set(first) == {"a", "b"}
+    assert (first["a"]["value"], first["a"]["pnl"], first["a"]["total_value"]) == (1050.0, 0.0, 2050.0)
+
+    second = valuator.on_quotes({"AAPL": quote(110.0), "MSFT": quote(50.0)})
+    assert set(second) == {"a"}  # MSFT didn't move
+    assert second["a"] == {
+        "event": "portfolio_update", "cash_balance": 1000.0, "value": 1150.0, "pnl": 100.0, "total_value": 2150.0,
+        "positions": [{"symbol": "AAPL", "quantity": 10, "price": 110.0, "value": 1100.0, "pnl": 100.0}],
+    }
+
+
+def test_fills_update_positions_cost_and_reverse_index():
+    valuator = valuator_with(a={"AAPL": 10})
+    valuator.on_quotes({"AAPL": quote(100.0)})
+
+    valuator.apply_fill({"trader_id": "a", "symbol": "AAPL", "trade_type": "buy", "quantity": 10, "price": 120.0, "cash_balance": -200.0})
+    position = valuator.portfolios["a"].positions["AAPL"]
+    assert (position.quantity, position.cost) == (20, 110.0)
+    assert valuator.portfolios["a"].pnl == -200.0  # Still marked at the last quote of 100
+
+    valuator.apply_fill({"trader_id": "a", "symbol": "MSFT", "trade_type": "buy", "quantity": 1, "price": 50.0, "cash_balance": -250.0})
+    closed = valuator.apply_fill({"trader_id": "a", "symbol": "AAPL", "trade_type": "sell", "quantity": 20, "price": 100.0, "cash_balance": 1750.0})
+    assert closed.quantity == 0
+    assert valuator.holders == {"MSFT": {"a"}}
+    assert valuator.apply_fill({"trader_id": "untracked", "symbol": "AAPL", "trade_type": "buy", "quantity": 1, "price": 1.0, "cash_balance": 0.0}) is None
+
+
+@pytest.mark.asyncio
+async def test_record_fills_pushes_one_delta_per_trader_and_untracks_disconnected():
+    valuator = valuator_with(a={}, b={})
+    valuator.ws_manager.notify.side_effect = lambda trader_id, message: trader_id == "a"
+    valuator.ws_manager.has_active_connection = MagicMock(return_value=False)
+
+    await valuator.record_fills([
+        {"trader_id": "a", "symbol": "AAPL", "trade_type": "buy", "quantity": 1, "price": 10.0, "cash_balance": 990.0},
+        {"trader_id": "a", "symbol": "MSFT", "trade_type": "buy", "quantity": 1, "price": 20.0, "cash_balance": 970.0},
+        {"trader_id": "b", "symbol": "AAPL", "trade_type": "buy", "quantity": 1, "price": 10.0, "cash_balance": 990.0},
+    ])
+
+    assert valuator.ws_manager.notify.await_count == 2
+    delta = valuator.ws_manager.notify.await_args_list[0].args[1]
+    assert [p["symbol"] for p in delta["positions"]] == ["AAPL", "MSFT"]
+    assert (delta["cash_balance"], delta["value"]) == (970.0, 30.0)
+    assert set(valuator.portfolios) == {"a"}
+    assert valuator.holders == {"AAPL": {"a"}, "MSFT": {"a"}}
+
+
+@pytest.mark.asyncio
+async def test_fills_reach_other_workers_over_a_distributed_bus():
+    bus = MagicMock(distributed=True, publish=AsyncMock())
+    valuator = PortfolioValuator(ws_manager=AsyncMock(), bus=bus)
+    handler = bus.subscribe.call_args.args[1]
+    fills = [{"trader_id": "a", "symbol": "AAPL", "trade_type": "buy", "quantity": 1, "price": 10.0, "cash_balance": 0.0}]
+
+    await valuator.record_fills(fills)
+    bus.publish.assert_awaited_once_with("portfolio", fills)
+
+    valuator.load("a", 10.0, [])
+    await handler(fills, None)  # Own copy, already applied
+    assert valuator.portfolios["a"].positions == {}
+    await handler(fills, 2)
+    assert valuator.portfolios["a"].positions["AAPL"].quantity == 1
+
+
+@pytest.mark.asyncio
+async def test_track_reads_again_when_a_fill_settles_during_the_load():
+    """Test that a fill settling between the positions read and tracking start isn't lost."""
+    sessionmaker = MagicMock()
+    sessionmaker.return_value.__aenter__.return_value = AsyncMock()
+    valuator = PortfolioValuator(ws_manager=AsyncMock(), sessionmaker=sessionmaker)
+    fill = {"trader_id": "a", "symbol": "AAPL", "trade_type": "buy", "quantity": 5, "price": 10.0, "cash_balance": 950.0}
+    reads = [
+        (SimpleNamespace(cash_balance=1000.0), []),  # Read before the fill committed
+        (SimpleNamespace(cash_balance=950.0), [holding("AAPL", 5)]),
+    ]
+
+    async def get_positions(trader_id, session, ledger):
+        if len(reads) == 2:
+            await valuator.record_fills([fill])  # Not tracked yet, so dropped
+        return reads.pop(0)
+
+    with patch("app.core.portfolio_valuation.get_positions", side_effect=get_positions) as mock_get:
+        snapshot = await valuator.track("a")
+
+    assert mock_get.await_count == 2
+    assert snapshot["cash_balance"] == 950.0 and snapshot["positions"][0]["quantity"] == 5
+    assert valuator.holders == {"AAPL": {"a"}}
+    assert valuator._loading == {}
+
+
+@pytest.mark.asyncio
+async def test_hub_polls_held_symbols_and_pushes_portfolio_deltas():
+    """Test that the market data hub polls symbols held in tracked portfolios even if nobody watches them."""
+    provider = AsyncMock()
+    provider.get_quotes.return_value = {"TSLA": {"ticker": "TSLA", "price": 200.0}}
+    valuator = valuator_with(a={"TSLA": 2})
+    streamer = MarketDataStreamer(price_provider=provider, valuator=valuator)
+    streamer.ws_manager = AsyncMock()
+
+    await streamer.poll_once()
+
+    provider.get_quotes.assert_awaited_once_with(["TSLA"])
+    valuator.ws_manager.notify.assert_awaited_once()
+    assert valuator.ws_manager.notify.await_args.args[1]["value"] == 400.0
+    assert streamer.get_stats()["portfolios"] == {"traders": 1, "symbols": 1, "ticks": 1, "updates": 1, "fills": 0}
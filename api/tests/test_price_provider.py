@@ -0,0 +1,48 @@
+import time
+import pytest
+from app.core.price_provider import PriceProvider
+from app.core.price_sources import PriceSource
+from app.core.stock_search import QuoteCache
+from app.utils.loop_monitor import LoopLagMonitor
+
+
+class SlowSource(PriceSource):
+    name = "slow"
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+
+    def fetch_quotes(self, tickers):
+        self.calls += 1
+        time.sleep(self.delay)
+        return {ticker: {"ticker": ticker, "price": 100.0, "date": "2025-01-01 00:00:00"} for ticker in tickers}
+
+@pytest.mark.asyncio
+async def test_provider_keeps_event_loop_responsive():
+    """Test that a blocking download runs off the loop and cached quotes skip the pool."""
+    source = SlowSource(0.3)
+    provider = PriceProvider(cache=QuoteCache(ttl=60), source=source, max_workers=2, timeout=5)
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    quotes = await provider.get_quotes(["AAPL", "MSFT"])
+    cached = await provider.get_quote("AAPL")
+    await monitor.stop()
+    provider.shutdown()
+
+    assert quotes["MSFT"]["price"] == 100.0
+    assert cached["price"] == 100.0
+    assert source.calls == 1
+    assert monitor.get_stats()["samples"] > 10
+    assert monitor.get_stats()["max_ms"] < 200
+
+@pytest.mark.asyncio
+async def test_provider_times_out_slow_downloads():
+    """Test that a download exceeding the per-call timeout yields error quotes."""
+    provider = PriceProvider(cache=QuoteCache(ttl=60), source=SlowSource(0.3), max_workers=1, timeout=0.05)
+    quote = await provider.get_quote("AAPL")
+    provider.shutdown()
+
+    assert quote["price"] is None
+    assert quote["error"] == "Download timed out"
+    assert provider.get_stats()["timeouts"] == 1
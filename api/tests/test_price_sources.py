@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+from app.core.price_sources import RandomWalkSource, ReplaySource, YFinanceSource, create_price_source
+
+
+def test_random_walk_is_reproducible_per_ticker():
+    """Test that a seed fixes each ticker's path regardless of which tickers are fetched with it."""
+    first = RandomWalkSource(seed=42)
+    second = RandomWalkSource(seed=42)
+    first_path = [first.fetch_quotes(["AAPL", "MSFT"])["AAPL"]["price"] for _ in range(5)]
+    second_path = [second.fetch_quotes(["AAPL"])["AAPL"]["price"] for _ in range(5)]
+    other_seed = RandomWalkSource(seed=7).fetch_quotes(["AAPL"])["AAPL"]["price"]
+
+    assert first_path == second_path
+    assert len(set(first_path)) == 5
+    assert other_seed != first_path[0]
+
+@pytest.mark.parametrize("extension", ["csv", "parquet"])
+def test_replay_steps_through_recorded_ticks(tmp_path, extension):
+    """Test that the replay source returns recorded ticks in time order and wraps around."""
+    ticks = tmp_path / f"ticks.{extension}"
+    recorded = pd.DataFrame({
+        "timestamp": pd.to_datetime(["2025-01-02 09:31:00", "2025-01-02 09:30:00", "2025-01-02 09:30:00"]),
+        "ticker": ["AAPL", "AAPL", "MSFT"],
+        "price": [101.0, 100.0, 400.0],
+    })
+    if extension == "parquet":
+        recorded.to_parquet(ticks)
+    else:
+        recorded.to_csv(ticks, index=False)
+    source = ReplaySource(str(ticks))
+
+    prices = [source.fetch_quotes(["AAPL"])["AAPL"]["price"] for _ in range(3)]
+    quotes = source.fetch_quotes(["MSFT", "FAKE"])
+
+    assert prices == [100.0, 101.0, 100.0]
+    assert quotes["MSFT"] == {"ticker": "MSFT", "price": 400.0, "date": "2025-01-02 09:30:00"}
+    assert quotes["FAKE"]["price"] is None
+
+def test_create_price_source_by_name():
+    """Test that the configured source name selects the implementation."""
+    assert isinstance(create_price_source("yfinance"), YFinanceSource)
+    assert create_price_source("random_walk", seed=3).seed == 3
+    with pytest.raises(ValueError):
+        create_price_source("replay")
+    with pytest.raises(ValueError):
+        create_price_source("bloomberg")
@@ -0,0 +1,54 @@
+import pytest
+from unittest.mock import AsyncMock
+from app.core.progress_aggregator import ProgressAggregator
+
+
+def progress(trade_id, value, status="in_progress"):
+    return {"event": "trade_progress", "trade_id": trade_id, "progress": value, "status": status}
+
+@pytest.mark.asyncio
+async def test_updates_are_batched_per_connection():
+    """Test that 50 open orders produce one frame per connection per flush, carrying only the latest update."""
+    aggregator = ProgressAggregator()
+    aggregator.ws_manager = AsyncMock()
+    for tick in range(2):
+        for i in range(50):
+            aggregator.add(progress(f"t{i}", tick * 10.0), ["trader_a"])
+    aggregator.add(progress("t_b", 5.0), ["trader_b", "admin"])
+    await aggregator.flush()
+
+    assert aggregator.ws_manager.notify.await_count == 3
+    frames = {call.args[0]: call.args[1] for call in aggregator.ws_manager.notify.await_args_list}
+    assert frames["trader_a"]["event"] == "trade_progress_batch"
+    assert len(frames["trader_a"]["trades"]) == 50
+    assert all(update["progress"] == 10.0 for update in frames["trader_a"]["trades"])
+    assert frames["admin"]["trades"] == [progress("t_b", 5.0)]
+
+    aggregator.ws_manager.notify.reset_mock()
+    await aggregator.flush()
+    aggregator.ws_manager.notify.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_unchanged_and_small_updates_are_skipped():
+    """Test that updates below the minimum delta are skipped unless the status changes."""
+    aggregator = ProgressAggregator(min_delta=5.0)
+    aggregator.ws_manager = AsyncMock()
+    aggregator.add(progress("t1", 10.0), ["trader"])
+    aggregator.add(progress("t1", 10.0), ["trader"])
+    aggregator.add(progress("t1", 12.0), ["trader"])
+    aggregator.add(progress("t1", 12.0, status="completed"), ["trader"])
+    assert aggregator.get_stats()["skipped"] == 2
+    await aggregator.flush()
+    assert aggregator.ws_manager.notify.await_args.args[1]["trades"] == [progress("t1", 12.0, status="completed")]
+
+@pytest.mark.asyncio
+async def test_discard_drops_pending_progress():
+    """Test that a completed trade's pending progress is not sent after its completion event."""
+    aggregator = ProgressAggregator()
+    aggregator.ws_manager = AsyncMock()
+    aggregator.add(progress("t1", 90.0), ["trader"])
+    aggregator.add(progress("t2", 50.0), ["trader"])
+    aggregator.discard("t1")
+    await aggregator.flush()
+    assert aggregator.ws_manager.notify.await_args.args[1]["trades"] == [progress("t2", 50.0)]
+    assert aggregator.get_stats()["tracked_trades"] == 1
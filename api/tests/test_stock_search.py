@@ -0,0 +1,57 @@
+import threading
+import time
+from app.core.stock_search import QuoteCache
+
+
+def make_fetch(calls, delay=0.0, price=100.0):
+    def fetch(tickers):
+        calls.append(list(tickers))
+        time.sleep(delay)
+        return {ticker: {"ticker": ticker, "price": price, "date": "2025-01-01 00:00:00"} for ticker in tickers}
+    return fetch
+
+def test_quote_cache_hits_within_ttl():
+    """Test that fresh quotes are served from the cache and only misses are downloaded."""
+    calls = []
+    cache = QuoteCache(ttl=60)
+    cache.get_many(["AAPL", "MSFT"], make_fetch(calls))
+    quotes = cache.get_many(["AAPL", "MSFT", "GOOGL"], make_fetch(calls))
+
+    assert calls == [["AAPL", "MSFT"], ["GOOGL"]]
+    assert quotes["AAPL"]["price"] == 100.0
+    assert cache.get_stats() == {"size": 3, "hits": 2, "misses": 3, "coalesced": 0}
+
+def test_quote_cache_expires_and_evicts():
+    """Test TTL expiry, LRU eviction and that failed downloads are not cached."""
+    calls = []
+    cache = QuoteCache(ttl=0.05, max_size=2)
+    cache.get_many(["AAPL"], make_fetch(calls))
+    cache.get_many(["MSFT"], make_fetch(calls))
+    cache.get_many(["AAPL"], make_fetch(calls))  # Refreshes AAPL's position in the LRU order
+    cache.get_many(["GOOGL"], make_fetch(calls))  # Evicts MSFT
+    assert list(cache._entries) == ["AAPL", "GOOGL"]
+
+    time.sleep(0.06)
+    cache.get_many(["AAPL"], make_fetch(calls))
+    assert calls[-1] == ["AAPL"]
+
+    quote = cache.get_many(["FAKE"], lambda tickers: {})["FAKE"]
+    assert quote["price"] is None
+    assert "FAKE" not in cache._entries
+
+def test_quote_cache_coalesces_concurrent_misses():
+    """Test that simultaneous misses for one ticker trigger a single download."""
+    calls = []
+    cache = QuoteCache(ttl=60)
+    fetch = make_fetch(calls, delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_many(["AAPL"], fetch))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [["AAPL"]]
+    assert len(results) == 10
+    assert all(result["AAPL"]["price"] == 100.0 for result in results)
+    assert cache.get_stats()["coalesced"] == 9
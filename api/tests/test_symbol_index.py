@@ -0,0 +1,70 @@
+import os
+import pytest
+from unittest.mock import AsyncMock
+from app.core.symbol_index import SymbolIndex, DEFAULT_SYMBOLS_PATH
+
+
+@pytest.fixture
+def symbols_file(tmp_path):
+    path = tmp_path / "symbols.csv"
+    path.write_text(
+        "symbol,name\n"
+        "AAPL,Apple Inc.\n"
+        "AA,Alcoa Corporation\n"
+        "APLE,Apple Hospitality REIT Inc.\n"
+        "MSFT,Microsoft Corporation\n"
+        "PINE,Alpine Income Property Trust\n"
+    )
+    return path
+
+def test_search_ranks_ticker_matches_before_names(symbols_file):
+    """Test that exact tickers beat ticker prefixes, which beat company name matches."""
+    index = SymbolIndex(str(symbols_file))
+    index.load()
+
+    assert [r["symbol"] for r in index.search("aa")] == ["AA", "AAPL"]
+    assert [r["symbol"] for r in index.search("ap")] == ["APLE", "AAPL"]
+    assert index.search("micro") == [{"symbol": "MSFT", "name": "Microsoft Corporation"}]
+    assert [r["symbol"] for r in index.search("income")] == ["PINE"]
+    assert index.search("zzz") == []
+    assert len(index.search("a", limit=2)) == 2
+
+def test_load_reports_memory_and_picks_up_file_changes(symbols_file):
+    """Test that reloading swaps in the new universe and the footprint is reported."""
+    index = SymbolIndex(str(symbols_file))
+    index.load()
+    stats = index.get_stats()
+    assert stats["symbols"] == 5
+    assert stats["memory_bytes"] > 0
+
+    symbols_file.write_text("symbol,name\nNVDA,NVIDIA Corporation\n")
+    index.load()
+    assert len(index) == 1
+    assert index.search("aapl") == []
+    assert index.search("nv")[0]["symbol"] == "NVDA"
+
+def test_bundled_symbol_file_loads():
+    """Test that the symbol universe shipped with the app is usable."""
+    index = SymbolIndex(DEFAULT_SYMBOLS_PATH)
+    index.load()
+    assert os.path.exists(DEFAULT_SYMBOLS_PATH)
+    assert index.search("AAPL")[0]["name"] == "Apple Inc."
+
+@pytest.mark.asyncio
+async def test_unknown_symbols_fall_back_to_a_live_lookup_once(symbols_file):
+    """Test that a query with no local match is looked up live and then served from the index."""
+    index = SymbolIndex(str(symbols_file))
+    index.load()
+    lookup = AsyncMock(return_value=[{"symbol": "SHOP", "name": "Shopify Inc."}])
+
+    assert (await index.search_or_lookup("aapl", 5, lookup))[0]["symbol"] == "AAPL"
+    lookup.assert_not_awaited()
+
+    assert await index.search_or_lookup("shop", 5, lookup) == [{"symbol": "SHOP", "name": "Shopify Inc."}]
+    assert await index.search_or_lookup("shopify", 5, lookup) == [{"symbol": "SHOP", "name": "Shopify Inc."}]
+    lookup.assert_awaited_once_with("shop", 5)
+    assert len(index) == 6 and index.search("aa")[0]["symbol"] == "AA"
+
+    lookup.side_effect = ValueError("Stock with symbol zzz not found.")
+    with pytest.raises(ValueError):
+        await index.search_or_lookup("zzz", 5, lookup)
@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+from app.core.tick_buffer import TickRing, TickStore, resample
+
+T0 = datetime(2025, 1, 2, 14, 30, tzinfo=timezone.utc).timestamp()
+
+
+def test_ring_keeps_the_newest_ticks_in_order():
+    ring = TickRing(capacity=4)
+    for i in range(6):
+        ring.append(T0 + i, float(i))
+    assert not ring.append(T0, -1.0)  # Older than the last tick
+
+    ts, price = ring.series()
+    assert price.tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert ts.tolist() == [T0 + i for i in range(2, 6)]
+    assert ring.series(since=T0 + 4)[1].tolist() == [4.0, 5.0]
+    assert ring.ts.nbytes == 4 * 8
+
+
+def test_resample_matches_a_per_bar_loop():
+    """Test that the vectorized resampling agrees with a straightforward loop over random ticks."""
+    rng = np.random.default_rng(7)
+    ts = np.sort(T0 + rng.uniform(0, 3600, 2000))
+    price = 100 + np.cumsum(rng.normal(0, 0.1, 2000))
+
+    for seconds in (60, 300, 900):
+        bars = resample(ts, price, seconds)
+        expected = {}
+        for t, p in zip(ts, price):
+            bar = expected.setdefault(int(t // seconds) * seconds, [p, p, p, p, 0])
+            bar[1], bar[2], bar[3], bar[4] = max(bar[1], p), min(bar[2], p), p, bar[4] + 1
+        assert bars["ts"].tolist() == list(expected)
+        assert np.allclose(np.column_stack([bars[c] for c in ("open", "high", "low", "close")]),
+                           [bar[:4] for bar in expected.values()])
+        assert bars["ticks"].tolist() == [bar[4] for bar in expected.values()]
+
+
+def test_store_bounds_memory_and_skips_unpriced_quotes():
+    store = TickStore(capacity=100, max_symbols=2)
+    for i in range(500):
+        store.record({"AAPL": {"price": 1.0 + i}, "MSFT": {"price": None}}, ts=T0 + i)
+    store.record({"MSFT": {"price": 1.0}, "NVDA": {"price": 2.0}}, ts=T0 + 500)
+    store.record({"NVDA": {"price": 3.0}, "TSLA": {"price": 4.0}}, ts=T0 + 501)
+
+    assert store.get_stats() == {"symbols": 2, "ticks": 504, "evicted": 2, "bytes": 2 * 100 * 16}
+    assert store.bars("AAPL")["ts"].size == 0  # Evicted, least recently ticked
+    since = datetime.fromtimestamp(T0, timezone.utc)
+    assert store.bars("nvda", interval="5m", since=since)["close"].tolist() == [3.0]
+    with pytest.raises(ValueError, match="Unsupported interval"):
+        store.bars("NVDA", interval="1h")
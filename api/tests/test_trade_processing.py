@@ -1,12 +1,16 @@
 
+import asyncio
 import time
-from app.core.trade_processing import Stock, StockTrade, Trader
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.core.trade_processing import Stock, StockTrade, Trader, TradeSystem, TradeQueueFullError
 
 def test_stock_creation():
     """Test that Stock objects are created correctly."""
     stock = Stock("AAPL", 190.50)
     assert stock.ticker == "AAPL"
     assert stock.price == 190.50
+    assert Stock(" aapl", 1.0).ticker == "AAPL"
 
 def test_trader_creation():
     """Test that Trader objects are created correctly."""
@@ -71,4 +75,216 @@ def test_sell_trade_constraints():
     trade = StockTrade("test_trader", stock, 10, "sell")
     
     assert trade.trade_type == "sell"
-    assert trade.quantity > 0
\ No newline at end of file
+    assert trade.quantity > 0
+
+
+@pytest.mark.asyncio
+async def test_trade_system_rejects_orders_when_at_capacity():
+    """Test that the engine applies backpressure once max_pending orders are outstanding."""
+    trade_system = TradeSystem(sessionmaker=MagicMock(), num_processors=1, max_pending=1, enqueue_timeout=0.01)
+    await trade_system.submit_order("test_trader", "AAPL", 10, 190.50, "buy")
+
+    with pytest.raises(TradeQueueFullError):
+        await trade_system.submit_order("test_trader", "AAPL", 10, 190.50, "buy")
+
+def fake_ws_manager():
+    ws_manager = MagicMock()
+    ws_manager.notify = AsyncMock()
+    ws_manager.recipients.return_value = set()
+    return ws_manager
+
+@pytest.mark.asyncio
+async def test_trade_system_settles_queued_orders():
+    """Test that long-lived processors settle orders and drain on shutdown."""
+    session = AsyncMock()
+    sessionmaker = MagicMock()
+    sessionmaker.return_value.__aenter__.return_value = session
+    ws_manager = fake_ws_manager()
+    notification_service = AsyncMock()
+    trade_system = TradeSystem(sessionmaker=sessionmaker, num_processors=2, tick_interval=0.01, progress_interval=0.01)
+
+    with patch("app.core.trade_processing.settle_trades", new_callable=AsyncMock) as mock_settle, \
+            patch("app.core.trade_processing.random.uniform", return_value=0.05):
+        mock_settle.return_value = [{"trader": MagicMock(), "error": None}]
+        await trade_system.start(ws_manager=ws_manager, notification_service=notification_service)
+        trade = await trade_system.submit_order("test_trader", "AAPL", 10, 190.50, "buy")
+        await trade_system.shutdown(drain_timeout=5.0)
+
+    mock_settle.assert_awaited_once()
+    assert mock_settle.await_args.args[0][0]["symbol"] == "AAPL"
+    notification_service.send_notification.assert_awaited_once()
+    ws_manager.broadcast.assert_not_called()
+    frame = ws_manager.notify.await_args.args
+    assert frame[0] == "test_trader"
+    assert frame[1]["event"] == "trade_progress_batch"
+    assert trade.status == "completed"
+    assert trade_system.processors == []
+
+@pytest.mark.asyncio
+async def test_trade_system_serializes_orders_per_trader():
+    """Test that a trader's orders settle in submission order even when later orders fill faster."""
+    settled = []
+    session = AsyncMock()
+    sessionmaker = MagicMock()
+    sessionmaker.return_value.__aenter__.return_value = session
+    trade_system = TradeSystem(sessionmaker=sessionmaker, num_processors=4, tick_interval=0.01)
+
+    async def record_settlement(fills, session, ledger=None):
+        settled.extend((fill["trader_id"], fill["quantity"]) for fill in fills)
+        return [{"trader": MagicMock(), "error": None} for _ in fills]
+
+    with patch("app.core.trade_processing.settle_trades", side_effect=record_settlement), \
+            patch("app.core.trade_processing.random.uniform", side_effect=[0.15, 0.1, 0.05]):
+        for quantity in (1, 2, 3):
+            await trade_system.submit_order("trader_a", "AAPL", quantity, 190.50, "buy")
+        stats = trade_system.get_stats()
+        await trade_system.start(ws_manager=fake_ws_manager(), notification_service=AsyncMock())
+        await trade_system.shutdown(drain_timeout=5.0)
+
+    shard_id = trade_system.shard_for("trader_a")
+    assert stats["pending"] == 3
+    assert stats["in_flight"] == 3
+    assert stats["shards"][shard_id]["hot_traders"] == [{"trader_id": "trader_a", "pending": 3}]
+    assert settled == [("trader_a", 1), ("trader_a", 2), ("trader_a", 3)]
+    assert trade_system.get_stats()["shards"][shard_id]["processed"] == 3
+
+@pytest.mark.asyncio
+async def test_trade_system_groups_fills_into_one_settlement():
+    """Test that fills completing together are committed as one batch and rejections skip notification."""
+    session = AsyncMock()
+    sessionmaker = MagicMock()
+    sessionmaker.return_value.__aenter__.return_value = session
+    notification_service = AsyncMock()
+    trade_system = TradeSystem(sessionmaker=sessionmaker, num_processors=1, tick_interval=0.01, settle_window=0.02)
+
+    valuator = AsyncMock()
+
+    async def settle(fills, session, ledger=None):
+        return [{"trader": MagicMock(cash_balance=500.0), "error": "Insufficient cash balance for this trade" if i == 0 else None} for i in range(len(fills))]
+
+    with patch("app.core.trade_processing.settle_trades", side_effect=settle) as mock_settle, \
+            patch("app.core.trade_processing.random.uniform", return_value=0.05):
+        await trade_system.start(ws_manager=fake_ws_manager(), notification_service=notification_service, valuator=valuator)
+        for i in range(10):
+            await trade_system.submit_order(f"trader_{i}", "AAPL", 1, 190.50, "buy")
+        await trade_system.shutdown(drain_timeout=5.0)
+
+    assert mock_settle.await_count == 1
+    assert len(mock_settle.await_args.args[0]) == 10
+    assert notification_service.send_notification.await_count == 9
+    (settled,) = valuator.record_fills.await_args.args
+    assert len(settled) == 9 and settled[0]["cash_balance"] == 500.0
+    shard_stats = trade_system.get_stats()["shards"][0]
+    assert (shard_stats["batches"], shard_stats["processed"], shard_stats["failed"]) == (1, 9, 1)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("outcome", ["rejected", "error"])
+async def test_unsettled_trades_are_discarded_and_reported_as_failed(outcome):
+    """Test that rejected or errored trades stop being tracked and their owners get a final trade_failed event."""
+    sessionmaker = MagicMock()
+    sessionmaker.return_value.__aenter__.return_value = AsyncMock()
+    notification_service = AsyncMock()
+    ws_manager = fake_ws_manager()
+    trade_system = TradeSystem(sessionmaker=sessionmaker, num_processors=1, tick_interval=0.01, settle_window=0.02)
+
+    async def settle(fills, session, ledger=None):
+        if outcome == "error":
+            raise RuntimeError("database unavailable")
+        return [{"trader": MagicMock(), "error": "Insufficient cash balance for this trade"} for _ in fills]
+
+    with patch("app.core.trade_processing.settle_trades", side_effect=settle), \
+            patch("app.core.trade_processing.random.uniform", return_value=0.05):
+        await trade_system.start(ws_manager=ws_manager, notification_service=notification_service)
+        for i in range(50):
+            await trade_system.submit_order(f"trader_{i}", "AAPL", 1, 190.50, "buy")
+        await trade_system.shutdown(drain_timeout=5.0)
+
+    assert trade_system.get_stats()["progress"]["tracked_trades"] == 0
+    notification_service.send_notification.assert_not_awaited()
+    failures = [call.args[1] for call in ws_manager.notify.await_args_list if call.args[1].get("event") == "trade_failed"]
+    assert len(failures) == 50 and len({failure["trade_id"] for failure in failures}) == 50
+    expected = "Insufficient cash balance for this trade" if outcome == "rejected" else "Trade could not be settled"
+    assert failures[0]["error"] == expected
+
+@pytest.mark.asyncio
+async def test_failures_after_settlement_do_not_fail_committed_trades():
+    """Test that a notifier or valuator error after the commit leaves the trades settled and reported once."""
+    sessionmaker = MagicMock()
+    sessionmaker.return_value.__aenter__.return_value = AsyncMock()
+    notification_service = AsyncMock()
+    notification_service.send_notification.side_effect = ConnectionResetError("relay bus write failed")
+    valuator = AsyncMock()
+    valuator.record_fills.side_effect = RuntimeError("valuation failed")
+    ws_manager = fake_ws_manager()
+    trade_system = TradeSystem(sessionmaker=sessionmaker, num_processors=1, tick_interval=0.01, settle_window=0.02)
+
+    async def settle(fills, session, ledger=None):
+        return [{"trader": MagicMock(cash_balance=500.0), "error": None} for _ in fills]
+
+    with patch("app.core.trade_processing.settle_trades", side_effect=settle), \
+            patch("app.core.trade_processing.random.uniform", return_value=0.05):
+        await trade_system.start(ws_manager=ws_manager, notification_service=notification_service, valuator=valuator)
+        await trade_system.submit_many("test_trader", basket(3))
+        await trade_system.shutdown(drain_timeout=5.0)
+
+    assert notification_service.send_notification.await_count == 3
+    valuator.record_fills.assert_awaited_once()
+    shard_stats = trade_system.get_stats()["shards"][0]
+    assert (shard_stats["processed"], shard_stats["failed"]) == (3, 0)
+    assert not [call for call in ws_manager.notify.await_args_list if call.args[1].get("event") == "trade_failed"]
+    assert trade_system.get_stats()["progress"]["tracked_trades"] == 0
+
+def basket(size, quantity=1):
+    return [{"ticker": f"SYM{i}", "quantity": quantity, "price": 10.0, "trade_type": "buy"} for i in range(size)]
+
+@pytest.mark.asyncio
+async def test_submit_many_is_all_or_nothing():
+    """Test that a basket is rejected whole when it doesn't fit or contains an invalid order."""
+    trade_system = TradeSystem(sessionmaker=MagicMock(), num_processors=1, max_pending=5, enqueue_timeout=0.01)
+    await trade_system.submit_order("test_trader", "AAPL", 1, 190.50, "buy")
+
+    with pytest.raises(TradeQueueFullError):
+        await trade_system.submit_many("test_trader", basket(5))
+    with pytest.raises(ValueError, match="Order 1"):
+        await trade_system.submit_many("test_trader", basket(1) + basket(1, quantity=0))
+    assert trade_system.get_stats()["pending"] == 1
+
+    trades = await trade_system.submit_many("test_trader", basket(4))
+    assert len({trade.id for trade in trades}) == 4
+    assert trade_system.get_stats()["pending"] == 5
+
+@pytest.mark.asyncio
+async def test_cancelled_reservation_returns_its_slots():
+    """Test that a basket cancelled while waiting for room gives back the slots it already took."""
+    trade_system = TradeSystem(sessionmaker=MagicMock(), num_processors=1, max_pending=10, enqueue_timeout=5.0)
+    await trade_system.submit_many("trader_a", basket(8))
+
+    waiting = asyncio.create_task(trade_system.submit_many("trader_b", basket(5)))
+    await asyncio.sleep(0.01)
+    assert trade_system.capacity._value == 0
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert trade_system.capacity._value == 2
+    assert trade_system.get_stats()["pending"] == 8
+
+@pytest.mark.asyncio
+async def test_submit_many_settles_basket_together():
+    """Test that a basket fills on one tick and settles in grouped transactions."""
+    session = AsyncMock()
+    sessionmaker = MagicMock()
+    sessionmaker.return_value.__aenter__.return_value = session
+    trade_system = TradeSystem(sessionmaker=sessionmaker, num_processors=2, tick_interval=0.01, settle_batch_size=100)
+
+    async def settle(fills, session, ledger=None):
+        return [{"trader": MagicMock(), "error": None} for _ in fills]
+
+    with patch("app.core.trade_processing.settle_trades", side_effect=settle) as mock_settle, \
+            patch("app.core.trade_processing.random.uniform", side_effect=[0.05] + [0.5] * 249):
+        await trade_system.start(ws_manager=fake_ws_manager(), notification_service=AsyncMock())
+        trades = await trade_system.submit_many("test_trader", basket(250))
+        await trade_system.shutdown(drain_timeout=5.0)
+
+    assert [len(call.args[0]) for call in mock_settle.await_args_list] == [100, 100, 50]
+    assert all(trade.status == "completed" for trade in trades)
@@ -0,0 +1,229 @@
+import os
+import resource
+import sys
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from app.db.database_connection import Base
+from app.db.trade_store import get_trades, get_portfolio, stream_trades, encode_cursor, decode_cursor
+from app.utils.json_utils import loads
+from app.models.tables import Trader, Trade
+
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def trade_row(i, trade_date=T0):
+    return SimpleNamespace(id=uuid.UUID(int=i), symbol="AAPL", quantity=1.0, price=10.0, trade_type="buy", trade_date=trade_date)
+
+
+def session_returning(rows):
+    session = AsyncMock()
+    session.execute = AsyncMock(return_value=MagicMock(all=lambda: rows))
+    return session
+
+
+def compiled(session) -> str:
+    statement = session.execute.await_args.args[0]
+    return str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    assert decode_cursor(encode_cursor("2025-01-01T00:00:00+00:00", "abc"), 2) == ["2025-01-01T00:00:00+00:00", "abc"]
+    for cursor in ["not base64!", encode_cursor("only one"), encode_cursor(1, 2, 3)]:
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            decode_cursor(cursor, 2)
+
+
+@pytest.mark.asyncio
+async def test_get_trades_pushes_filters_and_keyset_into_sql():
+    """Test that filters and the cursor become WHERE clauses and one extra row is fetched to detect the next page."""
+    session = session_returning([trade_row(i) for i in range(3, 0, -1)])
+    cursor = encode_cursor(T0 + timedelta(days=1), str(uuid.UUID(int=9)))
+
+    page = await get_trades("a", session, cursor=cursor, limit=2, symbol="nvda", trade_type="sell",
+                            start=T0, end=T0 + timedelta(days=2))
+
+    sql = compiled(session)
+    assert "trades.symbol = 'NVDA'" in sql and "trades.trade_type = 'sell'" in sql
+    assert "(trades.trade_date, trades.id) < (" in sql
+    assert "ORDER BY trades.trade_date DESC, trades.id DESC" in sql and "LIMIT 3" in sql
+    assert [trade["id"] for trade in page["trades"]] == [str(uuid.UUID(int=3)), str(uuid.UUID(int=2))]
+    assert decode_cursor(page["next_cursor"], 2) == [T0.isoformat(), str(uuid.UUID(int=2))]
+
+
+@pytest.mark.asyncio
+async def test_get_trades_last_page_and_bad_cursor():
+    page = await get_trades("a", session_returning([trade_row(1)]), limit=2)
+    assert page["next_cursor"] is None
+
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        await get_trades("a", session_returning([]), cursor=encode_cursor("yesterday", "not-a-uuid"))
+
+
+@pytest.mark.asyncio
+async def test_get_portfolio_lists_unpriced_holdings():
+    """Test that a portfolio page keeps holdings without a quote instead of dropping them."""
+    rows = [SimpleNamespace(id=uuid.UUID(int=i), symbol=symbol, quantity=2.0, initial_purchase_date=None)
+            for i, symbol in enumerate(["AAPL", "DELISTED", "MSFT"])]
+    session = session_returning(rows)
+
+    with patch("app.db.trade_store.price_provider") as mock_provider:
+        mock_provider.get_quotes = AsyncMock(return_value={"AAPL": {"price": 100.0}})
+        page = await get_portfolio("a", session, cursor=encode_cursor("AA"), limit=2)
+
+    assert "holdings.symbol > 'AA'" in compiled(session)
+    mock_provider.get_quotes.assert_awaited_once_with(["AAPL", "DELISTED"])
+    assert [(h["symbol"], h["current_value"]) for h in page["holdings"]] == [("AAPL", 200.0), ("DELISTED", None)]
+    assert page["page_value"] == 200.0
+    assert decode_cursor(page["next_cursor"], 1) == ["DELISTED"]
+
+
+ExportRow = namedtuple("ExportRow", "id symbol quantity price trade_type trade_date")
+
+
+def synthetic_sessionmaker(total: int, chunk_size: int):
+    """Session factory whose stream() yields total synthetic rows in chunks, generated lazily"""
+    chunk = [ExportRow(uuid.UUID(int=i), "AAPL", 1.0, 10.5, "buy", T0) for i in range(chunk_size)]
+
+    async def partitions():
+        for offset in range(0, total, chunk_size):
+            yield chunk[:total - offset]
+
+    session = AsyncMock()
+    session.stream = AsyncMock(return_value=MagicMock(partitions=partitions))
+    sessionmaker = MagicMock()
+    sessionmaker.return_value.__aenter__ = AsyncMock(return_value=session)
+    sessionmaker.return_value.__aexit__ = AsyncMock(return_value=False)
+    return sessionmaker, session
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+@pytest.mark.asyncio
+async def test_stream_trades_encodes_each_chunk():
+    sessionmaker, session = synthetic_sessionmaker(3, chunk_size=2)
+
+    chunks = [chunk async for chunk in stream_trades("a", sessionmaker, export_format="csv", symbol="aapl", chunk_size=2)]
+
+    assert session.stream.await_args.kwargs["execution_options"] == {"yield_per": 2}
+    assert "trades.symbol = :symbol_1" in str(session.stream.await_args.args[0])
+    assert len(chunks) == 3
+    lines = b"".join(chunks).decode().splitlines()
+    assert lines[0] == "id,symbol,quantity,price,trade_type,trade_date"
+    assert lines[1] == f"{uuid.UUID(int=0)},AAPL,1.0,10.5,buy,{T0.isoformat()}"
+    assert lines[3] == lines[1]
+    assert len(lines) == 4
+
+    sessionmaker, _ = synthetic_sessionmaker(2, chunk_size=5)
+    (chunk,) = [chunk async for chunk in stream_trades("a", sessionmaker)]
+    assert loads(chunk.splitlines()[1]) == {
+        "id": str(uuid.UUID(int=1)), "symbol": "AAPL", "quantity": 1.0, "price": 10.5,
+        "trade_type": "buy", "trade_date": T0.isoformat(),
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("export_format", ["ndjson", "csv"])
+async def test_stream_trades_memory_stays_flat(export_format):
+    """Test that exporting a million rows never holds more than a chunk in memory."""
+    total = 1_000_000
+    sessionmaker, _ = synthetic_sessionmaker(total, chunk_size=5000)
+    baseline = peak_rss_mb()
+    lines = exported = 0
+
+    async for chunk in stream_trades("a", sessionmaker, export_format=export_format, chunk_size=5000):
+        lines += chunk.count(b"\n")
+        exported += len(chunk)
+
+    assert lines == total + (export_format == "csv")
+    assert exported > 64 * 1024 * 1024  # More than the allowed growth below
+    assert peak_rss_mb() - baseline < 64
+
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest_asyncio.fixture
+async def seeded_trades():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessionmaker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    trader_id = f"history-{uuid.uuid4().hex[:8]}"
+    async with sessionmaker() as session:
+        session.add(Trader(id=trader_id, created_at=T0, updated_at=T0))
+        await session.commit()
+        # Settlement stamps a whole batch with one trade_date, so many rows share a timestamp
+        session.add_all([
+            Trade(trader_id=trader_id, symbol=["AAPL", "MSFT"][i % 2], quantity=1, price=i,
+                  trade_type=["buy", "sell"][i % 3 == 0], trade_date=T0 + timedelta(minutes=i // 4))
+            for i in range(37)
+        ])
+        await session.commit()
+    yield sessionmaker, trader_id
+    async with sessionmaker() as session:
+        await session.execute(delete(Trade).where(Trade.trader_id == trader_id))
+        await session.execute(delete(Trader).where(Trader.id == trader_id))
+        await session.commit()
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+async def test_paging_visits_every_trade_once(seeded_trades):
+    """Test that walking the cursors returns each matching trade exactly once, newest first, across timestamp ties."""
+    sessionmaker, trader_id = seeded_trades
+    for filters, expected in [({}, 37), ({"symbol": "msft", "side": "sell"}, 6)]:
+        seen, cursor = [], None
+        async with sessionmaker() as session:
+            while True:
+                page = await get_trades(trader_id, session, cursor=cursor, limit=5,
+                                        symbol=filters.get("symbol"), trade_type=filters.get("side"))
+                seen.extend(page["trades"])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+        assert len(seen) == len({trade["id"] for trade in seen}) == expected
+        assert [t["trade_date"] for t in seen] == sorted((t["trade_date"] for t in seen), reverse=True)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+async def test_export_from_server_side_cursor_keeps_memory_flat():
+    """Test that a million-row export from Postgres streams through a server-side cursor with flat memory."""
+    total = 1_000_000
+    engine = create_async_engine(TEST_DATABASE_URL)
+    sessionmaker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    trader_id = f"export-{uuid.uuid4().hex[:8]}"
+    async with sessionmaker() as session:
+        session.add(Trader(id=trader_id, created_at=T0, updated_at=T0))
+        await session.flush()
+        await session.execute(text(
+            "INSERT INTO trades (id, trader_id, symbol, quantity, price, trade_type, trade_date) "
+            "SELECT gen_random_uuid(), :trader_id, 'AAPL', 1, i, 'buy', now() - make_interval(secs => i) "
+            "FROM generate_series(1, :total) AS i"
+        ), {"trader_id": trader_id, "total": total})
+        await session.commit()
+    try:
+        baseline = peak_rss_mb()
+        lines = 0
+        async for chunk in stream_trades(trader_id, sessionmaker, export_format="ndjson"):
+            lines += chunk.count(b"\n")
+        assert lines == total
+        assert peak_rss_mb() - baseline < 64
+    finally:
+        async with sessionmaker() as session:
+            await session.execute(delete(Trade).where(Trade.trader_id == trader_id))
+            await session.execute(delete(Trader).where(Trader.id == trader_id))
+            await session.commit()
+        await engine.dispose()
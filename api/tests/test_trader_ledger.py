@@ -0,0 +1,197 @@
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from app.core.trader_ledger import TraderLedger
+from app.db.database_connection import Base
+from app.db.trader_store import settle_trades, update_on_trade, login_trader
+from app.models.tables import Trader, Holding, Trade
+
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+T1 = T0 + timedelta(seconds=1)
+
+
+def holding(symbol, quantity):
+    return SimpleNamespace(symbol=symbol, id=uuid.uuid4(), quantity=quantity, initial_purchase_date=T0)
+
+
+def test_get_hits_only_when_stamp_matches():
+    ledger = TraderLedger()
+    ledger.load("a", 100.0, T0, [holding("AAPL", 2)])
+
+    assert ledger.get("a", T0).positions() == {"AAPL": 2}
+    assert ledger.get("a", T1) is None
+    assert ledger.get("b", T0) is None
+    assert ledger.get_stats() == {
+        "traders": 1, "hits": 1, "misses": 2, "stale": 1, "idle": 0, "evicted": 0, "divergences": 0,
+    }
+
+
+def test_write_through_applies_changes_and_bumps_version():
+    ledger = TraderLedger()
+    ledger.load("a", 100.0, T0, [holding("AAPL", 2), holding("MSFT", 1)])
+
+    ledger.write("a", 40.0, T1, {"AAPL": {"id": "h1", "quantity": 5, "initial_purchase_date": T0}, "MSFT": None})
+    ledger.write("missing", 1.0, T1, {})
+
+    entry = ledger.get("a", T1)
+    assert (entry.cash_balance, entry.positions(), entry.version) == (40.0, {"AAPL": 5}, 2)
+    assert ledger.peek("missing") is None
+
+
+def test_evicts_least_recently_used_and_idle_entries():
+    ledger = TraderLedger(max_traders=2)
+    ledger.load("a", 1.0, T0, [])
+    ledger.load("b", 1.0, T0, [])
+    ledger.get("a", T0)
+    ledger.load("c", 1.0, T0, [])
+
+    assert ledger.peek("b") is None
+    assert {"a", "c"} == {tid for tid in ("a", "b", "c") if ledger.peek(tid)}
+
+    ledger.idle_ttl = 0.0
+    ledger.peek("a").last_used -= 1
+    assert ledger.get("a", T0) is None
+    assert ledger.idle == 1
+
+
+def test_reload_counts_divergence_only_for_the_same_row_version():
+    ledger = TraderLedger()
+    ledger.load("a", 100.0, T0, [holding("AAPL", 2)])
+
+    ledger.load("a", 100.0, T1, [holding("AAPL", 3)])  # Newer row, expected to differ
+    assert ledger.divergences == 0
+    ledger.load("a", 90.0, T1, [holding("AAPL", 3)])  # Same row, different cash
+    assert ledger.divergences == 1
+    assert ledger.peek("a").version == 3
+
+
+@pytest.mark.asyncio
+async def test_settle_trades_skips_holdings_query_for_cached_traders():
+    """Test that a cached trader is checked from memory and written through after commit."""
+    trader = MagicMock(id="a", cash_balance=1000.0, updated_at=T0)
+    ledger = TraderLedger()
+    ledger.load("a", 1000.0, T0, [holding("AAPL", 2)])
+    session = AsyncMock()
+    upserted = SimpleNamespace(trader_id="a", symbol="AAPL", id="h1", quantity=1, initial_purchase_date=T0)
+    session.execute = AsyncMock(side_effect=[
+        MagicMock(scalars=lambda: MagicMock(all=lambda: [trader])),  # traders
+        MagicMock(scalars=lambda: MagicMock(all=lambda: [MagicMock(id="a", cash_balance=1100.0)])),  # guarded credit
+        MagicMock(all=lambda: [upserted]),  # holdings increment
+        MagicMock(),  # trades insert
+    ])
+
+    results = await settle_trades([
+        {"trader_id": "a", "trade_type": "sell", "quantity": 1, "price": 100, "symbol": "AAPL"},
+        {"trader_id": "a", "trade_type": "sell", "quantity": 5, "price": 100, "symbol": "AAPL"},
+    ], session, ledger=ledger)
+
+    assert [result["error"] for result in results] == [None, "Insufficient holdings to sell"]
+    assert session.execute.await_count == 4
+    entry = ledger.peek("a")
+    assert entry.stamp > T0
+    assert (entry.cash_balance, entry.positions()) == (1100.0, {"AAPL": 1})
+
+
+@pytest.mark.asyncio
+async def test_login_trader_values_cached_holdings_without_refresh():
+    """Test that login reads positions from a current ledger entry instead of the holdings relationship."""
+    ledger = TraderLedger()
+    ledger.load("a", 10.0, T0, [holding("AAPL", 3)])
+    session = AsyncMock()
+    session.execute = AsyncMock(return_value=MagicMock(scalar_one_or_none=lambda: MagicMock(updated_at=T0)))
+
+    with patch("app.db.trader_store.price_provider") as mock_provider:
+        mock_provider.get_quotes = AsyncMock(return_value={"AAPL": {"price": 10.0}})
+        result = await login_trader(uid="a", session=session, ledger=ledger)
+
+    session.refresh.assert_not_awaited()
+    assert result["portfolio_value"] == 30.0
+
+
+# Consistency suite against a real Postgres. Point TEST_DATABASE_URL at a scratch database;
+# tables are created if missing and only rows for this run's traders are touched.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "TSLA"]
+
+
+@pytest_asyncio.fixture
+async def db_sessionmaker():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessionmaker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    prefix = f"ledger-{uuid.uuid4().hex[:8]}"
+    trader_ids = [f"{prefix}-{i}" for i in range(6)]
+    async with sessionmaker() as session:
+        now = datetime.now(timezone.utc)
+        session.add_all([Trader(id=tid, created_at=now, updated_at=now, cash_balance=5000.0) for tid in trader_ids])
+        await session.commit()
+    yield sessionmaker, trader_ids
+    async with sessionmaker() as session:
+        for table in (Trade, Holding):
+            await session.execute(delete(table).where(table.trader_id.in_(trader_ids)))
+        await session.execute(delete(Trader).where(Trader.id.in_(trader_ids)))
+        await session.commit()
+    await engine.dispose()
+
+
+async def assert_ledger_matches_db(ledger: TraderLedger, sessionmaker, trader_ids):
+    async with sessionmaker() as session:
+        traders = (await session.execute(select(Trader).where(Trader.id.in_(trader_ids)))).scalars().all()
+        rows = (await session.execute(select(Holding).where(Holding.trader_id.in_(trader_ids)))).scalars().all()
+    for trader in traders:
+        entry = ledger.peek(trader.id)
+        if entry is None or entry.stamp != trader.updated_at:
+            continue  # Not cached, or stale and bound to be reloaded on next use
+        holdings = {row.symbol: (row.id, row.quantity) for row in rows if row.trader_id == trader.id}
+        assert entry.cash_balance == trader.cash_balance
+        assert {symbol: (h["id"], h["quantity"]) for symbol, h in entry.holdings.items()} == holdings
+    assert ledger.divergences == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+async def test_ledger_never_diverges_from_database(db_sessionmaker):
+    """Test that random settlements, outside writes, logins and evictions never leave a current entry out of sync."""
+    sessionmaker, trader_ids = db_sessionmaker
+    rng = random.Random(20)
+    ledger = TraderLedger(max_traders=4)
+
+    def random_fill():
+        return {
+            "trader_id": rng.choice(trader_ids),
+            "trade_type": rng.choice(["buy", "buy", "sell"]),
+            "quantity": rng.randint(1, 5),
+            "price": rng.choice([10.0, 25.5, 99.99]),
+            "symbol": rng.choice(SYMBOLS),
+        }
+
+    for _ in range(150):
+        action = rng.random()
+        async with sessionmaker() as session:
+            if action < 0.6:
+                await settle_trades([random_fill() for _ in range(rng.randint(1, 12))], session, ledger=ledger)
+            elif action < 0.8:
+                fill = random_fill()
+                try:
+                    with patch("app.db.trader_store.price_provider") as mock_provider:
+                        mock_provider.get_quotes = AsyncMock(return_value={})
+                        await update_on_trade(session=session, **fill)
+                except ValueError:
+                    pass
+            elif action < 0.9:
+                with patch("app.db.trader_store.price_provider") as mock_provider:
+                    mock_provider.get_quotes = AsyncMock(return_value={})
+                    await login_trader(uid=rng.choice(trader_ids), session=session, ledger=ledger)
+            else:
+                ledger.invalidate(rng.choice(trader_ids))
+        await assert_ledger_matches_db(ledger, sessionmaker, trader_ids)
+
+    assert ledger.hits > 0 and ledger.stale > 0 and ledger.evicted > 0
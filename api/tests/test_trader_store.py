@@ -1,8 +1,19 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
-from app.db.trader_store import update_on_trade
-from sqlalchemy import select
-from app.models.tables import Holding
+from app.db.trader_store import (
+    update_on_trade, apply_fills, login_trader, settle_trades, merge_duplicate_holdings, normalize_symbol_case,
+    SettlementConflict, SETTLE_ATTEMPTS,
+)
+from sqlalchemy import select, delete, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from app.db.database_connection import Base
+from app.models.tables import Holding, Trader, Trade
 
 @pytest.mark.asyncio
 async def test_update_on_trade_insufficient_funds():
@@ -12,6 +23,9 @@ async def test_update_on_trade_insufficient_funds():
     mock_trader = MagicMock()
     mock_trader.id = "test_trader"
     mock_trader.cash_balance = 100  # Only $100 available
+
+    # The guarded debit matches no row when the balance is too low
+    mock_session.execute = AsyncMock(return_value=MagicMock(scalar_one_or_none=lambda: None))
     
     # Setup the get_trader_by_id mock to return our mock trader
     with patch('app.db.trader_store.get_trader_by_id', return_value=mock_trader):
@@ -25,6 +39,9 @@ async def test_update_on_trade_insufficient_funds():
                 symbol="AAPL",
                 session=mock_session
             )
+    guarded_debit = mock_session.execute.await_args_list[0].args[0]
+    assert "traders.cash_balance >= " in str(guarded_debit.compile(dialect=postgresql.dialect()))
+    mock_session.commit.assert_not_awaited()
 
 @pytest.mark.asyncio
 async def test_update_on_trade_insufficient_holdings():
@@ -60,10 +77,8 @@ async def test_update_on_trade_insufficient_quantity():
     mock_trader = MagicMock()
     mock_trader.id = "test_trader"
     
-    # Setup mock for the holding query with insufficient quantity
-    mock_holding = MagicMock()
-    mock_holding.quantity = 2  # Only own 2 shares
-    mock_execute = AsyncMock(return_value=AsyncMock(scalar_one_or_none=lambda: mock_holding))
+    # Only own 2 shares, so the guarded decrement matches no row
+    mock_execute = AsyncMock(return_value=MagicMock(scalar_one_or_none=lambda: None))
     mock_session.execute = mock_execute
     
     # Setup the get_trader_by_id mock
@@ -77,4 +92,272 @@ async def test_update_on_trade_insufficient_quantity():
                 price=100,
                 symbol="AAPL",
                 session=mock_session
-            )
\ No newline at end of file
+            )
+    guarded_update = mock_execute.await_args_list[0].args[0]
+    assert "holdings.quantity >= " in str(guarded_update.compile(dialect=postgresql.dialect()))
+    mock_session.commit.assert_not_awaited()
+
+def test_apply_fills_checks_each_fill_in_order():
+    """Test that batched fills run the same cash and holdings checks as single trades."""
+    cash_balances = {"trader_a": 1000.0}
+    positions = {("trader_a", "MSFT"): 1}
+    fills = [
+        {"trader_id": "trader_a", "trade_type": "buy", "quantity": 5, "price": 100, "symbol": "AAPL"},
+        {"trader_id": "trader_a", "trade_type": "buy", "quantity": 10, "price": 100, "symbol": "AAPL"},  # Only $500 left
+        {"trader_id": "trader_a", "trade_type": "sell", "quantity": 3, "price": 110, "symbol": "AAPL"},
+        {"trader_id": "trader_a", "trade_type": "sell", "quantity": 2, "price": 100, "symbol": "MSFT"},  # Only own 1
+        {"trader_id": "missing", "trade_type": "buy", "quantity": 1, "price": 1, "symbol": "AAPL"},
+    ]
+
+    errors = apply_fills(fills, cash_balances, positions)
+
+    assert errors == [
+        None,
+        "Insufficient cash balance for this trade",
+        None,
+        "Insufficient holdings to sell",
+        "Trader with ID missing not found",
+    ]
+    assert cash_balances == {"trader_a": 830.0}
+    assert positions == {("trader_a", "MSFT"): 1, ("trader_a", "AAPL"): 2}
+
+@pytest.mark.asyncio
+async def test_login_trader_values_portfolio_with_one_batched_quote_request():
+    """Test that login prices every holding from a single request and skips unpriced symbols."""
+    holdings = [
+        MagicMock(id=f"h{i}", symbol=symbol, quantity=quantity, initial_purchase_date=None)
+        for i, (symbol, quantity) in enumerate([("AAPL", 10), ("MSFT", 2), ("DELISTED", 5)])
+    ]
+    mock_trader = MagicMock(holdings=holdings)
+    mock_session = AsyncMock()
+    mock_session.execute = AsyncMock(return_value=MagicMock(scalar_one_or_none=lambda: mock_trader))
+    quotes = {
+        "AAPL": {"ticker": "AAPL", "price": 200.0},
+        "MSFT": {"ticker": "MSFT", "price": 400.0},
+        "DELISTED": {"ticker": "DELISTED", "price": None, "error": "No data found"},
+    }
+
+    with patch("app.db.trader_store.price_provider") as mock_provider:
+        mock_provider.get_quotes = AsyncMock(return_value=quotes)
+        result = await login_trader(uid="test_trader", session=mock_session)
+
+    mock_provider.get_quotes.assert_awaited_once_with(["AAPL", "MSFT", "DELISTED"])
+    assert result["portfolio_value"] == 2800.0
+    assert [(h["symbol"], h["current_value"]) for h in result["holdings"]] == [("AAPL", 2000.0), ("MSFT", 800.0)]
+
+@pytest.mark.asyncio
+async def test_update_on_trade_values_other_holdings_at_their_own_quotes():
+    """Test that after a fill only the traded symbol is valued at the fill price."""
+    mock_trader = MagicMock(id="test_trader")
+    holdings = [
+        MagicMock(id="h1", symbol="AAPL", quantity=10, initial_purchase_date=None),
+        MagicMock(id="h2", symbol="MSFT", quantity=2, initial_purchase_date=None),
+    ]
+    mock_session = AsyncMock()
+    mock_session.execute = AsyncMock(side_effect=[
+        MagicMock(scalar_one_or_none=lambda: mock_trader),  # guarded debit
+        MagicMock(),  # holdings upsert
+        MagicMock(),  # trade insert
+        MagicMock(scalars=lambda: MagicMock(all=lambda: holdings)),
+    ])
+
+    with patch("app.db.trader_store.price_provider") as mock_provider:
+        mock_provider.get_quotes = AsyncMock(return_value={"MSFT": {"price": 400.0}})
+        result = await update_on_trade(trader_id="test_trader", trade_type="buy", quantity=1, price=200,
+                                       symbol="AAPL", session=mock_session)
+
+    mock_provider.get_quotes.assert_awaited_once_with(["MSFT"])
+    assert [(h["symbol"], h["current_price"]) for h in result["holdings"]] == [("AAPL", 200.0), ("MSFT", 400.0)]
+    assert result["portfolio_value"] == 2800.0
+
+
+def compile_sql(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+@pytest.mark.asyncio
+async def test_settle_trades_writes_guarded_relative_statements():
+    """Test that settlement reads without locking and writes cash and holdings as guarded deltas."""
+    trader = MagicMock(id="a", cash_balance=1000.0, updated_at=None)
+    session = AsyncMock()
+    session.execute = AsyncMock(side_effect=[
+        MagicMock(scalars=lambda: MagicMock(all=lambda: [trader])),  # traders
+        [MagicMock(trader_id="a", symbol="AAPL", quantity=1)],  # holdings
+        MagicMock(scalars=lambda: MagicMock(all=lambda: [trader])),  # guarded debit
+        MagicMock(all=lambda: [MagicMock(trader_id="a", symbol="AAPL", quantity=3)]),  # holdings increment
+        MagicMock(),  # trades insert
+    ])
+
+    results = await settle_trades([
+        {"trader_id": "a", "trade_type": "buy", "quantity": 2, "price": 100, "symbol": "AAPL"},
+        {"trader_id": "a", "trade_type": "buy", "quantity": 9, "price": 100, "symbol": "AAPL"},
+    ], session)
+
+    assert [result["error"] for result in results] == [None, "Insufficient cash balance for this trade"]
+    statements = [compile_sql(call.args[0]) for call in session.execute.await_args_list[:4]]
+    assert not any("FOR UPDATE" in sql for sql in statements)
+    assert "traders.updated_at IS NOT DISTINCT FROM deltas.stamp" in statements[2]
+    assert "traders.cash_balance + deltas.floor >= " in statements[2]
+    assert "quantity = (holdings.quantity + excluded.quantity)" in statements[3]
+    increment = session.execute.await_args_list[3].args[0].compile(dialect=postgresql.dialect()).params
+    assert increment["quantity_m0"] == 2
+    session.commit.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_settle_trades_retries_when_a_guard_misses():
+    trader = MagicMock(id="a", cash_balance=1000.0, updated_at=None)
+    read = MagicMock(scalars=lambda: MagicMock(all=lambda: [trader]))
+    missed = MagicMock(scalars=lambda: MagicMock(all=lambda: []))
+    session = AsyncMock()
+    session.execute = AsyncMock(side_effect=[read, [], missed] * SETTLE_ATTEMPTS)
+
+    with pytest.raises(SettlementConflict):
+        await settle_trades([{"trader_id": "a", "trade_type": "buy", "quantity": 1, "price": 1, "symbol": "AAPL"}], session)
+
+    assert session.rollback.await_count == SETTLE_ATTEMPTS
+    session.commit.assert_not_awaited()
+    reads = [compile_sql(call.args[0]) for call in session.execute.await_args_list[::3]]
+    assert ["FOR UPDATE" in sql for sql in reads] == [False] * (SETTLE_ATTEMPTS - 1) + [True]
+
+
+@pytest.mark.asyncio
+async def test_settle_trades_retries_when_a_holding_vanished_since_it_was_read():
+    """Test that a partial sell of a holding deleted behind the trader's back conflicts instead of going negative."""
+    trader = MagicMock(id="a", cash_balance=1000.0, updated_at=None)
+    session = AsyncMock()
+    session.execute = AsyncMock(side_effect=[
+        MagicMock(scalars=lambda: MagicMock(all=lambda: [trader])),  # traders
+        [MagicMock(trader_id="a", symbol="AAPL", quantity=5)],  # holdings as read
+        MagicMock(scalars=lambda: MagicMock(all=lambda: [trader])),  # guarded credit
+        MagicMock(all=lambda: [MagicMock(trader_id="a", symbol="AAPL", quantity=-2)]),  # upsert inserted the delta
+    ] * SETTLE_ATTEMPTS)
+
+    with pytest.raises(SettlementConflict, match="holding changed"):
+        await settle_trades([{"trader_id": "a", "trade_type": "sell", "quantity": 2, "price": 1, "symbol": "AAPL"}], session)
+
+    assert session.rollback.await_count == SETTLE_ATTEMPTS
+    session.commit.assert_not_awaited()
+
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+async def test_concurrent_settlement_never_overdraws_or_loses_updates():
+    """Test that batches for the same trader settled from separate sessions at once stay consistent."""
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessionmaker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    trader_id = f"concurrent-{uuid.uuid4().hex[:8]}"
+    now = datetime.now(timezone.utc)
+    async with sessionmaker() as session:
+        session.add(Trader(id=trader_id, created_at=now, updated_at=now, cash_balance=5000.0))
+        await session.commit()
+
+    async def settle(batch):
+        async with sessionmaker() as session:
+            return await settle_trades(batch, session)
+
+    buy = {"trader_id": trader_id, "trade_type": "buy", "quantity": 1, "price": 100.0, "symbol": "AAPL"}
+    sell = {**buy, "trade_type": "sell", "price": 50.0}
+    try:
+        accepted = 0
+        for _ in range(5):
+            for results in await asyncio.gather(*(settle([buy] * 8 + [sell] * 2) for _ in range(4))):
+                accepted += sum(result["error"] is None for result in results)
+        async with sessionmaker() as session:
+            trader = await session.get(Trader, trader_id)
+            trades = (await session.execute(select(Trade).where(Trade.trader_id == trader_id))).scalars().all()
+            holdings = (await session.execute(select(Holding).where(Holding.trader_id == trader_id))).scalars().all()
+        bought = sum(t.quantity for t in trades if t.trade_type == "buy")
+        sold = sum(t.quantity for t in trades if t.trade_type == "sell")
+        spent = sum(t.quantity * t.price * (1 if t.trade_type == "buy" else -1) for t in trades)
+        assert len(trades) == accepted and 0 < bought < 5 * 4 * 8  # Not every buy fits in the balance
+        assert trader.cash_balance >= 0 and trader.cash_balance == pytest.approx(5000.0 - spent)
+        assert [(h.symbol, h.quantity) for h in holdings] == [("AAPL", bought - sold)]
+    finally:
+        async with sessionmaker() as session:
+            for table in (Trade, Holding):
+                await session.execute(delete(table).where(table.trader_id == trader_id))
+            await session.execute(delete(Trader).where(Trader.id == trader_id))
+            await session.commit()
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+async def test_duplicate_holdings_are_merged_before_the_unique_index():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    trader_id = f"dupes-{uuid.uuid4().hex[:8]}"
+    now = datetime.now(timezone.utc)
+    try:
+        async with engine.connect() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.commit()
+            transaction = await conn.begin()
+            # Everything below, including dropping the index, is rolled back at the end
+            await conn.execute(text("DROP INDEX ix_holdings_trader_id_symbol"))
+            await conn.execute(Trader.__table__.insert().values(id=trader_id, created_at=now, cash_balance=0.0))
+            await conn.execute(Holding.__table__.insert(), [
+                {"id": uuid.uuid4(), "trader_id": trader_id, "symbol": symbol, "quantity": quantity, "updated_at": now}
+                for symbol, quantity in [("AAPL", 1.0), ("AAPL", 2.0), ("AAPL", 4.0), ("MSFT", 3.0)]
+            ])
+
+            assert await conn.run_sync(merge_duplicate_holdings) == 2
+            await conn.run_sync(lambda sync_conn: [index.create(sync_conn) for index in Holding.__table__.indexes])
+            rows = (await conn.execute(
+                select(Holding.symbol, Holding.quantity).where(Holding.trader_id == trader_id).order_by(Holding.symbol)
+            )).all()
+            assert [tuple(row) for row in rows] == [("AAPL", 7.0), ("MSFT", 3.0)]
+            assert await conn.run_sync(merge_duplicate_holdings) == 0  # Index exists again
+            await transaction.rollback()
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+async def test_stored_symbols_are_upper_cased_and_case_duplicates_folded():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    trader_id = f"case-{uuid.uuid4().hex[:8]}"
+    now = datetime.now(timezone.utc)
+    try:
+        async with engine.connect() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.commit()
+            transaction = await conn.begin()
+            # Recreates a database from before the constraints; rolled back at the end
+            for table in ("trades", "holdings"):
+                await conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS ck_{table}_symbol_upper"))
+            await conn.execute(Trader.__table__.insert().values(id=trader_id, created_at=now, cash_balance=0.0))
+            await conn.execute(Holding.__table__.insert(), [
+                {"id": uuid.uuid4(), "trader_id": trader_id, "symbol": symbol, "quantity": quantity, "updated_at": now}
+                for symbol, quantity in [("AAPL", 1.0), ("aapl", 2.0), ("Aapl", 4.0), ("msft", 3.0)]
+            ])
+            await conn.execute(Trade.__table__.insert(), [
+                {"id": uuid.uuid4(), "trader_id": trader_id, "symbol": symbol, "quantity": 1.0, "price": 1.0,
+                 "trade_type": "buy", "trade_date": now}
+                for symbol in ["aapl", "AAPL", "msft"]
+            ])
+
+            assert await conn.run_sync(normalize_symbol_case) >= 4  # 2 trades, 2 folded positions
+            holdings = (await conn.execute(
+                select(Holding.symbol, Holding.quantity).where(Holding.trader_id == trader_id).order_by(Holding.symbol)
+            )).all()
+            trades = (await conn.execute(select(Trade.symbol).where(Trade.trader_id == trader_id))).scalars().all()
+            assert [tuple(row) for row in holdings] == [("AAPL", 7.0), ("MSFT", 3.0)]
+            assert sorted(trades) == ["AAPL", "AAPL", "MSFT"]
+
+            # Done once: later startups find the constraints and skip the scan
+            with patch("app.db.trader_store.NORMALIZE_TRADE_SYMBOLS", text("SELECT 1/0")):
+                assert await conn.run_sync(normalize_symbol_case) == 0
+            with pytest.raises(IntegrityError):
+                async with conn.begin_nested():
+                    await conn.execute(Holding.__table__.insert().values(
+                        id=uuid.uuid4(), trader_id=trader_id, symbol="nvda", quantity=1.0, updated_at=now))
+            await transaction.rollback()
+    finally:
+        await engine.dispose()
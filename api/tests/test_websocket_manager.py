@@ -0,0 +1,182 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import MagicMock
+from app.core.websocket_manager import WebsocketManager
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload):
+        await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(payload))
+
+    async def close(self):
+        self.closed = True
+
+def assert_closed(manager: WebsocketManager):
+    assert manager.clients == {} and manager.closing == set()
+
+
+@pytest.mark.asyncio
+async def test_close_tracks_its_tasks_until_done():
+    """Test that a connection closed from a sync path keeps its close task referenced and awaitable."""
+    manager = WebsocketManager()
+    socket = FakeWebSocket()
+    await manager.connect(socket, "trader")
+    connection = manager.clients["trader"]
+
+    connection.close()
+    assert manager.closing == {connection} and not socket.closed
+    await manager.close_all()
+
+    assert socket.closed and connection._writer.cancelled()
+    assert_closed(manager)
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_stall_others():
+    """Test that broadcast returns immediately and fast clients are served while one client hangs."""
+    manager = WebsocketManager(max_queue_size=10, send_timeout=60)
+    slow, fast = FakeWebSocket(delay=60), FakeWebSocket()
+    await manager.connect(slow, "slow_trader")
+    await manager.connect(fast, "fast_trader")
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for i in range(5):
+        await manager.broadcast({"event": "tick", "seq": i})
+    assert loop.time() - start < 0.05
+    await asyncio.sleep(0.05)
+
+    assert [message["seq"] for message in fast.sent] == [0, 1, 2, 3, 4]
+    assert slow.sent == []
+    assert await manager.notify("fast_trader", {"event": "direct"})
+    assert not await manager.notify("unknown_trader", {"event": "direct"})
+    await manager.disconnect("slow_trader")
+    await manager.disconnect("fast_trader")
+    assert_closed(manager)
+
+@pytest.mark.asyncio
+async def test_overflow_policies():
+    """Test drop-oldest, coalesce and disconnect behaviour when a client's queue is full."""
+    drop = WebsocketManager(max_queue_size=2, overflow_policy="drop_oldest")
+    await drop.connect(FakeWebSocket(delay=60), "trader")
+    await drop.notify("trader", {"event": "trade_progress", "trade_id": "t1", "seq": 0})
+    await asyncio.sleep(0)  # Writer takes the first message and hangs on it
+    for i in range(1, 4):
+        await drop.notify("trader", {"event": "trade_progress", "trade_id": "t1", "seq": i})
+    assert [m["seq"] for m, _, _ in drop.clients["trader"].pending] == [2, 3]
+    assert drop.get_stats()["dropped"] == 1
+
+    coalesce = WebsocketManager(max_queue_size=2, overflow_policy="coalesce")
+    await coalesce.connect(FakeWebSocket(delay=60), "trader")
+    await coalesce.notify("trader", {"event": "trade_progress", "trade_id": "t0", "seq": 0})
+    await asyncio.sleep(0)
+    await coalesce.notify("trader", {"event": "trade_progress", "trade_id": "t1", "seq": 1})
+    await coalesce.notify("trader", {"event": "trade_progress", "trade_id": "t2", "seq": 2})
+    await coalesce.notify("trader", {"event": "trade_progress", "trade_id": "t1", "seq": 3})
+    assert [m["seq"] for m, _, _ in coalesce.clients["trader"].pending] == [3, 2]
+    assert coalesce.get_stats()["coalesced"] == 1
+
+    disconnect = WebsocketManager(max_queue_size=1, overflow_policy="disconnect")
+    socket = FakeWebSocket(delay=60)
+    await disconnect.connect(socket, "trader")
+    await disconnect.notify("trader", {"seq": 0})
+    await asyncio.sleep(0)
+    assert await disconnect.notify("trader", {"seq": 1})
+    assert not await disconnect.notify("trader", {"seq": 2})
+    await asyncio.sleep(0)
+    assert not disconnect.has_active_connection("trader")
+    assert socket.closed
+
+    for manager in (drop, coalesce, disconnect):
+        await manager.close_all()
+        assert_closed(manager)
+
+@pytest.mark.asyncio
+async def test_guaranteed_messages_survive_overflow():
+    """Test that guaranteed messages are neither dropped nor coalesced when the queue is full."""
+    manager = WebsocketManager(max_queue_size=2, overflow_policy="coalesce")
+    await manager.connect(FakeWebSocket(delay=60), "trader")
+    await manager.notify("trader", {"event": "tick", "seq": 0})
+    await asyncio.sleep(0)
+    await manager.notify("trader", {"event": "trade_completed", "trade_id": "t1", "seq": 1}, guaranteed=True)
+    await manager.notify("trader", {"event": "trade_progress", "trade_id": "t2", "seq": 2})
+    await manager.notify("trader", {"event": "trade_completed", "trade_id": "t1", "seq": 3})
+    await manager.notify("trader", {"event": "trade_completed", "trade_id": "t3", "seq": 4}, guaranteed=True)
+    await manager.notify("trader", {"event": "trade_progress", "trade_id": "t4", "seq": 5})
+
+    pending = manager.clients["trader"].pending
+    assert [(m["seq"], guaranteed) for m, _, guaranteed in pending] == [(1, True), (4, True), (5, False)]
+    await manager.close_all()
+    assert_closed(manager)
+
+@pytest.mark.asyncio
+async def test_message_dropped_behind_guaranteed_ones_is_reported_undelivered():
+    manager = WebsocketManager(max_queue_size=1, overflow_policy="coalesce")
+    await manager.connect(FakeWebSocket(delay=60), "trader")
+    await manager.notify("trader", {"event": "tick", "seq": 0})
+    await asyncio.sleep(0)
+    assert await manager.notify("trader", {"event": "trade_completed", "trade_id": "t1"}, guaranteed=True)
+
+    assert not await manager.notify("trader", {"event": "trade_progress", "trade_id": "t2"})
+    connection = manager.clients["trader"]
+    assert [m["trade_id"] for m, _, _ in connection.pending] == ["t1"] and connection.dropped == 1
+    await manager.close_all()
+    assert_closed(manager)
+
+@pytest.mark.asyncio
+async def test_reconnect_replaces_connection():
+    """Test that a stale handler's disconnect doesn't drop the trader's new socket."""
+    manager = WebsocketManager()
+    old, new = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(old, "trader")
+    await manager.connect(new, "trader")
+
+    assert not await manager.disconnect("trader", old)
+    assert manager.has_active_connection("trader")
+    await manager.notify("trader", {"event": "tick"})
+    await asyncio.sleep(0.01)
+    assert new.sent == [{"event": "tick"}]
+    assert old.closed
+    assert await manager.disconnect("trader", new)
+    await manager.close_all()  # The replaced connection's close is still tracked until it finishes
+    assert_closed(manager)
+
+@pytest.mark.asyncio
+async def test_progress_reaches_only_owner_and_topic_subscribers():
+    """Test that trade progress goes to its owner and admins on the trade or trader topic, nobody else."""
+    from app.core.trade_processing import TradeSystem, StockTrade, Stock
+
+    manager = WebsocketManager()
+    sockets = {name: FakeWebSocket() for name in ("owner", "other", "trade_admin", "trader_admin", "idle_admin")}
+    for name, socket in sockets.items():
+        await manager.connect(socket, name)
+    trade = StockTrade(trader_id="owner", stock=Stock("AAPL", 100.0), quantity=5)
+    manager.subscribe("trade_admin", [f"trade:{trade.id}"])
+    manager.subscribe("trader_admin", ["trader:owner", f"trade:{trade.id}"])
+    manager.subscribe("idle_admin", ["trader:someone_else"])
+
+    trade_system = TradeSystem(sessionmaker=MagicMock())
+    trade_system.ws_manager = manager
+    trade_system.progress.ws_manager = manager
+    await trade_system.publish_progress([trade])
+    await trade_system.progress.flush()
+    await asyncio.sleep(0.01)
+
+    received = {name: len(socket.sent) for name, socket in sockets.items()}
+    assert received == {"owner": 1, "other": 0, "trade_admin": 1, "trader_admin": 1, "idle_admin": 0}
+    assert sockets["owner"].sent[0]["trades"][0]["trade_id"] == trade.id
+
+    await manager.disconnect("trader_admin")
+    assert manager.topics == {f"trade:{trade.id}": {"trade_admin"}, "trader:someone_else": {"idle_admin"}}
+    await manager.close_all()
+    assert manager.topics == {}
+    assert_closed(manager)
@@ -23,7 +23,12 @@ export default function TradeProgress({
   const websocketWithToken = token
     ? `${tradeProgressWebsocketUrl}?token=${token}`
     : null;
-  const { status, message } = useWebSocket(websocketWithToken);
+  const { status, message: frame } = useWebSocket(websocketWithToken);
+  // Progress arrives as one batched frame per tick; show the latest trade in it
+  const message =
+    frame?.event === "trade_progress_batch"
+      ? frame.trades[frame.trades.length - 1]
+      : frame;
   useEffect(() => {
     if (
       message &&